@@ -1,17 +1,84 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request, Response
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, ORJSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from typing import List, Literal, Optional, Dict, Any
+from contextlib import asynccontextmanager, contextmanager
+from functools import partial
+import argparse
+import asyncio
+import hashlib
+import hmac
+import importlib.util
+import random
+import shutil
+import tempfile
+import time
 import uvicorn
 import os
 from dotenv import load_dotenv
 
-# Import the Anki API functions
-from scripts.anki_api_v2 import add_anki_card, add_multiple_cards
-
-# Load environment variables
+# Load environment variables before importing modules that read them
 load_dotenv()
 
+# Import the Anki API functions
+from scripts.anki_api_v2 import (
+    AnkiConnectBackend,
+    add_anki_card,
+    add_card_batch,
+    add_multiple_cards,
+    add_raw_payloads,
+    count_by_deck,
+    get_backend,
+    get_default_cookie,
+    get_deck_registry_version,
+    list_deck_names,
+    payload_deck,
+    send_payload,
+    set_backend,
+    set_circuit_breaker,
+    set_default_cookie,
+    set_scheduler,
+    set_spool,
+    set_upstream_rate_limiter,
+    split_delimited_payloads,
+    update_anki_card,
+)
+from scripts.admission import AdmissionController
+from scripts.apkg_builder import build_apkg
+from scripts.cache import etag_matches, make_etag
+from scripts.compression import (
+    BodyTooLarge,
+    GZipUnlessStreaming,
+    SUPPORTED_ENCODINGS,
+    UnsupportedEncoding,
+    read_body,
+)
+from scripts.config_reload import ConfigWatcher, apply_config, parse_config
+from scripts.fast_json import (
+    ORJSON_AVAILABLE,
+    BulkRequestError,
+    decode_bulk_request,
+    dumps,
+    inline_schema,
+    loads,
+)
+from scripts.ledger import LEDGER_STATUSES, CardLedger, result_status
+from scripts.logging_setup import configure_logging, stop_logging
+from scripts.microbatch import MicroBatcher
+from scripts.near_duplicates import NearDuplicateIndex
+from scripts.note_index import NoteIndex
+from scripts.policies import DUPLICATE_POLICIES
+from scripts.profiling import PROFILE_MODES, ProfileStore, ProfilingMiddleware, RequestProfiler
+from scripts.scheduler import SubmissionScheduler
+from scripts.shared_state import BufferedCounter, LocalState, SharedState
+from scripts.spool import SpoolReplayer, adopt_orphaned_spools, open_worker_spool
+from scripts.traffic import TrafficRecorder, TrafficRecordingMiddleware
+from scripts.upstream_health import CircuitBreaker, UpstreamProber
+
 # Get the authentication cookie from environment variables
 DEFAULT_COOKIE = os.getenv(
     "ANKI_COOKIE",
@@ -19,12 +86,313 @@ DEFAULT_COOKIE = os.getenv(
     "InZidTxTQ1EqOVFHb34uaTwiLCJjIjoyLCJ0IjoxNzM2Nzk4ODI1fQ.mwUZf4Fym4BWUbMTQF"
     "lAeHa-3bq9fOIdxsNl2W1bcEs",
 )
+# Cards are sent with anki_api_v2's current default cookie, which the config
+# file below can replace at runtime
+set_default_cookie(DEFAULT_COOKIE)
+
+# Optional JSON config file with the cookie and deck registry, checked for
+# changes every ANKI_CONFIG_POLL_INTERVAL seconds and reloaded without a restart
+CONFIG_FILE = os.getenv("ANKI_CONFIG_FILE")
+CONFIG_POLL_INTERVAL = float(os.getenv("ANKI_CONFIG_POLL_INTERVAL", "2"))
+
+# Number of worker processes serving the app, set by the launcher below
+WORKER_PROCESSES = int(os.getenv("ANKI_WORKER_PROCESSES", "1"))
+
+# State for rate limiting, de-duplication and queue counters. Set ANKI_STATE_DB
+# when running several workers so that they all share one store.
+STATE_DB = os.getenv("ANKI_STATE_DB")
+state = SharedState(STATE_DB) if STATE_DB else LocalState()
+
+# Upstream requests per second across all workers (0 disables the limit)
+UPSTREAM_RATE = float(os.getenv("ANKI_UPSTREAM_RATE", "0"))
+UPSTREAM_BURST = float(os.getenv("ANKI_UPSTREAM_BURST", "1"))
+upstream_limiter = None
+if UPSTREAM_RATE > 0:
+    upstream_limiter = state.rate_limiter("upstream", UPSTREAM_RATE, UPSTREAM_BURST)
+    set_upstream_rate_limiter(upstream_limiter)
+
+# Where cards are sent: "ankiweb" (default) or "ankiconnect" for a local Anki
+# desktop running the AnkiConnect add-on, which adds bulk cards in one call.
+BACKEND = os.getenv("ANKI_BACKEND", "ankiweb").lower()
+if BACKEND == "ankiconnect":
+    set_backend(
+        AnkiConnectBackend(
+            url=os.getenv("ANKICONNECT_URL", "http://127.0.0.1:8765"),
+            # Registry deck name to desktop deck name, e.g. "it=Computing::IT"
+            deck_titles=dict(
+                item.split("=", 1)
+                for item in os.getenv("ANKICONNECT_DECKS", "").split(",")
+                if "=" in item
+            ),
+            model_name=os.getenv("ANKICONNECT_MODEL", "Basic"),
+            api_key=os.getenv("ANKICONNECT_KEY"),
+        )
+    )
+elif BACKEND != "ankiweb":
+    raise ValueError(f"Unknown ANKI_BACKEND '{BACKEND}'")
+
+# Priority scheduler in front of the upstream: interactive /add-card requests
+# go ahead of bulk cards, and decks/tenants share the rate budget fairly.
+# ANKI_SCHEDULER_WORKERS=0 sends directly without scheduling.
+SCHEDULER_WORKERS = int(os.getenv("ANKI_SCHEDULER_WORKERS", "4"))
+# A waiting bulk card is sent after this many seconds at the latest...
+BULK_MAX_WAIT = float(os.getenv("ANKI_BULK_MAX_WAIT", "5"))
+# ...or after this many interactive cards in a row
+INTERACTIVE_BURST = int(os.getenv("ANKI_INTERACTIVE_BURST", "20"))
+# Relative shares per tenant (X-Client-Id header), e.g. "importer=1,gpt=4"
+TENANT_WEIGHTS = {
+    name.strip(): float(weight)
+    for name, _, weight in (
+        item.partition("=")
+        for item in os.getenv("ANKI_TENANT_WEIGHTS", "").split(",")
+        if item.strip()
+    )
+}
+for _tenant, _weight in TENANT_WEIGHTS.items():
+    if not _weight > 0:
+        raise ValueError(f"ANKI_TENANT_WEIGHTS: weight of '{_tenant}' must be positive")
+
+# Identical /add-card requests within this many seconds are only sent once
+DEDUP_WINDOW = float(os.getenv("ANKI_DEDUP_WINDOW", "0"))
+
+# Near-duplicate detection: path of the index database (unset disables it),
+# the default similarity threshold (0-1) and the default policy for
+# near-duplicates: skip, flag or force. Requests can override both.
+NEAR_DUP_DB = os.getenv("ANKI_NEAR_DUP_DB")
+NEAR_DUP_THRESHOLD = float(os.getenv("ANKI_NEAR_DUP_THRESHOLD", "0.8"))
+NEAR_DUP_POLICY = os.getenv("ANKI_NEAR_DUP_POLICY", "skip")
+near_duplicates = (
+    NearDuplicateIndex(NEAR_DUP_DB, threshold=NEAR_DUP_THRESHOLD) if NEAR_DUP_DB else None
+)
+
+# Path of the index of note ids returned by AnkiWeb, which lets clients
+# update cards they added (unset disables it)
+NOTE_INDEX_DB = os.getenv("ANKI_NOTE_INDEX_DB")
+note_index = NoteIndex(NOTE_INDEX_DB) if NOTE_INDEX_DB else None
+
+# Counter holding the number of cards accepted but not yet sent upstream. Each
+# worker counts in memory and publishes its share to the state every second,
+# so requests never wait for the state database.
+QUEUED_CARDS_COUNTER = "queued_cards"
+queued_counter = BufferedCounter(state, QUEUED_CARDS_COUNTER)
+
+# Seconds between progress frames of streamed bulk submissions; progress
+# frames also keep idle proxies from closing the connection
+STREAM_PROGRESS_INTERVAL = float(os.getenv("ANKI_STREAM_PROGRESS_INTERVAL", "1"))
+
+# Micro-batching of concurrent /add-card requests: cards arriving within
+# ANKI_MICROBATCH_WINDOW_MS of each other are encoded and dispatched together
+# (0 disables it). ANKI_MICROBATCH_MAX caps the batch size.
+MICROBATCH_WINDOW_MS = float(os.getenv("ANKI_MICROBATCH_WINDOW_MS", "0"))
+MICROBATCH_MAX = int(os.getenv("ANKI_MICROBATCH_MAX", "64"))
+
+# Offline spool for cards that cannot be delivered to AnkiWeb right away.
+# ANKI_SPOOL_MODE is "fallback" (spool only during upstream outages) or
+# "always" (spool every card and deliver in the background).
+SPOOL_DIR = os.getenv("ANKI_SPOOL_DIR")
+SPOOL_MODE = os.getenv("ANKI_SPOOL_MODE", "fallback")
+# Spooled cards replayed per second across all workers (0 disables the limit)
+SPOOL_REPLAY_RATE = float(os.getenv("ANKI_SPOOL_REPLAY_RATE", "1"))
+
+
+# Token required in the X-Admin-Token header by admin endpoints and features.
+# Admin endpoints are disabled when it is not set.
+ADMIN_TOKEN = os.getenv("ANKI_ADMIN_TOKEN")
+# Token required in the X-Producer-Token header by /add-raw-payloads, which
+# accepts pre-encoded payloads from trusted producers. Disabled when not set.
+PRODUCER_TOKEN = os.getenv("ANKI_PRODUCER_TOKEN")
+
+# Request profiling is only wired in when ANKI_PROFILE_DIR is set. Requests are
+# profiled when they carry "X-Profile: sample|cprofile" (or "1" for sample) with a valid admin
+# token, or at random with probability ANKI_PROFILE_SAMPLE_RATE.
+PROFILE_DIR = os.getenv("ANKI_PROFILE_DIR")
+PROFILE_SAMPLE_RATE = float(os.getenv("ANKI_PROFILE_SAMPLE_RATE", "0"))
+PROFILE_SAMPLE_MODE = os.getenv("ANKI_PROFILE_SAMPLE_MODE", "sample")
+PROFILE_KEEP = int(os.getenv("ANKI_PROFILE_KEEP", "50"))
+
+
+# Largest accepted bulk request body, after decompression (0 = no cap). Bodies
+# may be sent with Content-Encoding gzip, deflate or (with zstandard) zstd.
+MAX_BODY_BYTES = int(os.getenv("ANKI_MAX_BODY_BYTES", str(64 * 1024 * 1024)))
+# Responses of at least this many bytes are gzipped for clients that accept
+# it (0 disables response compression)
+GZIP_MIN_SIZE = int(os.getenv("ANKI_GZIP_MIN_SIZE", "0"))
+
+# Opt-in recording of request shapes (endpoint, deck, card sizes, batch sizes,
+# timing; never card text) to this JSON lines file, for replay with
+# scripts/replay_traffic.py
+TRAFFIC_RECORD_FILE = os.getenv("ANKI_TRAFFIC_RECORD_FILE")
+
+# Logging runs through a background thread. ANKI_LOG_JSON=1 writes JSON lines;
+# ANKI_CARD_LOG_SAMPLE_RATE keeps only a share of the per-card log records.
+LOG_LEVEL = os.getenv("ANKI_LOG_LEVEL", "INFO")
+LOG_JSON = os.getenv("ANKI_LOG_JSON", "").lower() in ("1", "true", "yes")
+CARD_LOG_SAMPLE_RATE = float(os.getenv("ANKI_CARD_LOG_SAMPLE_RATE", "1"))
+
+# Per-client request quotas: ANKI_QUOTA_RATE requests per second with bursts
+# of ANKI_QUOTA_BURST (0 disables them). Clients are told apart by IP, or by
+# X-Client-Id/IP with ANKI_QUOTA_KEY=client; clients choose that header
+# themselves, so only use it behind a proxy that sets it. Quotas are per
+# worker unless ANKI_QUOTA_SHARED=1 keeps them in the shared state.
+QUOTA_RATE = float(os.getenv("ANKI_QUOTA_RATE", "0"))
+QUOTA_BURST = float(os.getenv("ANKI_QUOTA_BURST", "10"))
+QUOTA_KEY = os.getenv("ANKI_QUOTA_KEY", "ip")
+QUOTA_SHARED = os.getenv("ANKI_QUOTA_SHARED", "").lower() in ("1", "true", "yes")
+
+# Load shedding: requests in flight per worker, and upstream payloads queued
+# per scheduler lane, beyond which requests get a 503 (0 disables each limit)
+MAX_IN_FLIGHT = int(os.getenv("ANKI_MAX_IN_FLIGHT", "0"))
+MAX_QUEUE_DEPTH = int(os.getenv("ANKI_MAX_QUEUE_DEPTH", "0"))
+
+admission = None
+if QUOTA_RATE > 0 or MAX_IN_FLIGHT > 0 or MAX_QUEUE_DEPTH > 0:
+    admission = AdmissionController(
+        quota_state=state if QUOTA_SHARED else LocalState(),
+        quota_rate=QUOTA_RATE,
+        quota_burst=QUOTA_BURST,
+        max_in_flight=MAX_IN_FLIGHT,
+        max_queue_depth=MAX_QUEUE_DEPTH,
+        drain_rate=UPSTREAM_RATE,
+        quota_in_threadpool=QUOTA_SHARED and STATE_DB is not None,
+    )
+
+# Path of the searchable card ledger (unset disables it)
+LEDGER_DB = os.getenv("ANKI_LEDGER_DB")
+
+# Circuit breaker: after ANKI_BREAKER_FAILURES consecutive upstream failures
+# (default 0, disabled) cards fail fast, or are spooled, for ANKI_BREAKER_RESET
+# seconds before a trial request is let through
+BREAKER_FAILURES = int(os.getenv("ANKI_BREAKER_FAILURES", "0"))
+BREAKER_RESET = float(os.getenv("ANKI_BREAKER_RESET", "30"))
+circuit_breaker = None
+if BREAKER_FAILURES > 0:
+    circuit_breaker = CircuitBreaker(BREAKER_FAILURES, BREAKER_RESET)
+    set_circuit_breaker(circuit_breaker)
+
+# Seconds between background checks of the upstream and the credentials
+# reported by /ready (0 disables them)
+PROBE_INTERVAL = float(os.getenv("ANKI_PROBE_INTERVAL", "30"))
+
+scheduler = None
+upstream_prober = None
+microbatcher = None
+ledger = None
+config_watcher = None
+traffic_recorder = (
+    TrafficRecorder(TRAFFIC_RECORD_FILE, max_body_bytes=MAX_BODY_BYTES) if TRAFFIC_RECORD_FILE else None
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Start and stop background services
+    """
+    configure_logging(LOG_LEVEL, LOG_JSON, CARD_LOG_SAMPLE_RATE)
+    queued_counter.start()
+
+    global config_watcher
+    if CONFIG_FILE:
+        config_watcher = ConfigWatcher(CONFIG_FILE, CONFIG_POLL_INTERVAL)
+        config_watcher.start()
+
+    global upstream_prober
+    if PROBE_INTERVAL > 0:
+        upstream_prober = UpstreamProber(
+            lambda: get_backend().probe(), PROBE_INTERVAL, circuit_breaker
+        )
+        upstream_prober.start()
+
+    global scheduler
+    if SCHEDULER_WORKERS > 0:
+        scheduler = SubmissionScheduler(
+            lambda payload, cookie: send_payload(payload, cookie, rate_limited=False),
+            workers=SCHEDULER_WORKERS,
+            limiter=upstream_limiter,
+            tenant_weights=TENANT_WEIGHTS,
+            bulk_max_wait=BULK_MAX_WAIT,
+            interactive_burst=INTERACTIVE_BURST,
+        )
+        scheduler.start()
+        set_scheduler(scheduler)
+        if admission is not None:
+            admission.queue_depth = scheduler.queue_depth
+
+    if traffic_recorder is not None:
+        traffic_recorder.start()
+
+    global ledger
+    if LEDGER_DB:
+        ledger = CardLedger(LEDGER_DB)
+        ledger.start()
+
+    global microbatcher
+    if MICROBATCH_WINDOW_MS > 0:
+        microbatcher = MicroBatcher(
+            partial(add_card_batch, priority="interactive"),
+            window=MICROBATCH_WINDOW_MS / 1000,
+            max_batch=MICROBATCH_MAX,
+        )
+
+    replayer = None
+    if SPOOL_DIR:
+        spool = open_worker_spool(SPOOL_DIR)
+        set_spool(spool, SPOOL_MODE)
+        replayer = SpoolReplayer(
+            [spool] + adopt_orphaned_spools(SPOOL_DIR),
+            send_payload,
+            limiter=(
+                state.rate_limiter("spool-replay", SPOOL_REPLAY_RATE) if SPOOL_REPLAY_RATE > 0 else None
+            ),
+            cookie_provider=get_default_cookie,
+        )
+        replayer.start()
+
+    yield
+
+    if microbatcher is not None:
+        await microbatcher.drain()
+        microbatcher = None
+
+    if replayer is not None:
+        replayer.stop()
+        set_spool(None)
+        for spool in replayer.spools:
+            spool.close()
+
+    if scheduler is not None:
+        set_scheduler(None)
+        if admission is not None:
+            admission.queue_depth = None
+        scheduler.stop()
+        scheduler = None
+
+    if upstream_prober is not None:
+        upstream_prober.stop()
+        upstream_prober = None
+
+    if ledger is not None:
+        ledger.stop()
+        ledger = None
+
+    if config_watcher is not None:
+        config_watcher.stop()
+        config_watcher = None
+
+    if traffic_recorder is not None:
+        traffic_recorder.stop()
+
+    queued_counter.stop()
+    stop_logging()
+
 
 # Create the FastAPI app
 app = FastAPI(
     title="Anki API",
     description="API for adding cards to Anki decks",
     version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse if ORJSON_AVAILABLE else JSONResponse,
 )
 
 # Add CORS middleware to allow cross-origin requests
@@ -36,6 +404,116 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+SSE_MEDIA_TYPE = "text/event-stream"
+
+if GZIP_MIN_SIZE > 0:
+    app.add_middleware(
+        GZipUnlessStreaming,
+        minimum_size=GZIP_MIN_SIZE,
+        stream_media_types=(NDJSON_MEDIA_TYPE, SSE_MEDIA_TYPE),
+    )
+
+
+def is_admin_token(token: Optional[str]) -> bool:
+    """
+    Check a token against ANKI_ADMIN_TOKEN
+    """
+    return bool(ADMIN_TOKEN and token and hmac.compare_digest(token, ADMIN_TOKEN))
+
+
+async def require_admin(x_admin_token: Optional[str] = Header(default=None)):
+    """
+    Dependency rejecting requests without a valid X-Admin-Token header
+    """
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Admin endpoints are disabled")
+    if not is_admin_token(x_admin_token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+async def require_producer(x_producer_token: Optional[str] = Header(default=None)):
+    """
+    Dependency rejecting requests without a valid X-Producer-Token header
+    """
+    if not PRODUCER_TOKEN:
+        raise HTTPException(status_code=404, detail="Raw payloads are disabled")
+    if not (x_producer_token and hmac.compare_digest(x_producer_token, PRODUCER_TOKEN)):
+        raise HTTPException(status_code=403, detail="Invalid producer token")
+
+
+def profile_mode(headers):
+    """
+    Pick the profiler for requests that ask for it, or a random sample of requests
+    """
+    mode = headers.get("x-profile")
+    if mode and is_admin_token(headers.get("x-admin-token")):
+        # "sample" is the default: it also sees the thread pool, where
+        # upstream calls run, while cProfile only sees the event loop
+        mode = "sample" if mode.lower() in ("1", "true", "yes") else mode.lower()
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown X-Profile mode '{mode}'; use one of {', '.join(PROFILE_MODES)}")
+        return mode
+    if PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+        return PROFILE_SAMPLE_MODE
+    return None
+
+
+profiler = None
+if PROFILE_DIR:
+    profiler = RequestProfiler(ProfileStore(PROFILE_DIR, PROFILE_KEEP))
+    app.add_middleware(ProfilingMiddleware, profiler=profiler, select_mode=profile_mode)
+
+
+# Paths never subject to quotas or shedding, and the scheduler lane used by
+# the paths that submit cards
+ADMISSION_EXEMPT_PATHS = {"/health", "/live", "/ready", "/docs", "/redoc", "/openapi.json"}
+SUBMISSION_LANES = {
+    "/add-card": "interactive",
+    "/update-card": "interactive",
+    "/add-multiple-cards": "bulk",
+    "/add-raw-payloads": "bulk",
+}
+
+if admission is not None:
+
+    @app.middleware("http")
+    async def admission_control(request: Request, call_next):
+        """
+        Reject requests over the client's quota or while the server is overloaded
+        """
+        path = request.url.path
+        if path in ADMISSION_EXEMPT_PATHS or is_admin_token(request.headers.get("x-admin-token")):
+            return await call_next(request)
+
+        if QUOTA_KEY == "ip":
+            key = request.client.host if request.client else "unknown"
+        else:
+            key = client_id(request)
+        rejection = await admission.admit(key, SUBMISSION_LANES.get(path))
+        if rejection is not None:
+            return JSONResponse(
+                status_code=rejection.status_code,
+                content={"detail": rejection.detail},
+                headers=rejection.headers,
+            )
+
+        admission.in_flight += 1
+        try:
+            return await call_next(request)
+        finally:
+            admission.in_flight -= 1
+
+
+if traffic_recorder is not None:
+    # Added last, so it sees every request, including rejected ones, and
+    # times the whole response
+    app.add_middleware(
+        TrafficRecordingMiddleware,
+        recorder=traffic_recorder,
+        exempt_paths=ADMISSION_EXEMPT_PATHS,
+    )
+
 
 # Define the request models
 class CardBase(BaseModel):
@@ -43,16 +521,48 @@ class CardBase(BaseModel):
     back: str = Field(..., description="Text for the back of the card")
 
 
-class CardRequest(CardBase):
+class DuplicateCheck(BaseModel):
+    duplicate_policy: Optional[Literal[DUPLICATE_POLICIES]] = Field(
+        default=None,
+        description="What to do with near-duplicates of added cards: skip them, "
+        "add and flag them, or add them without checking",
+    )
+    similarity_threshold: Optional[float] = Field(
+        default=None, ge=0, le=1, description="Similarity at which a card is a near-duplicate"
+    )
+
+
+class CardRequest(CardBase, DuplicateCheck):
     deck_name: str = Field(
         default="default", description="Name of the deck to add the card to"
     )
 
 
-class MultipleCardsRequest(BaseModel):
-    cards: List[CardBase] = Field(..., description="List of cards to add")
+class BulkCard(CardBase):
+    deck_name: Optional[str] = Field(
+        default=None, description="Deck for this card; defaults to the request's deck_name"
+    )
+
+
+class UpdateCardRequest(CardBase):
+    deck_name: str = Field(default="default", description="Deck the card was added to")
+    note_id: Optional[int] = Field(
+        default=None,
+        description="Id of the note to update; looked up from original_front and "
+        "original_back when not given",
+    )
+    original_front: Optional[str] = Field(
+        default=None, description="Front text the card was added with"
+    )
+    original_back: Optional[str] = Field(
+        default=None, description="Back text the card was added with"
+    )
+
+
+class MultipleCardsRequest(DuplicateCheck):
+    cards: List[BulkCard] = Field(..., description="List of cards to add")
     deck_name: str = Field(
-        default="default", description="Name of the deck to add the cards to"
+        default="default", description="Deck for cards without their own deck_name"
     )
     delay: float = Field(default=1.0, description="Delay in seconds between requests")
 
@@ -63,80 +573,870 @@ class ApiResponse(BaseModel):
     data: Optional[Dict[str, Any]] = None
 
 
+@contextmanager
+def queued_cards(count):
+    """
+    Count cards as queued for the duration of the block
+    """
+    queued_counter.add(count)
+    try:
+        yield
+    finally:
+        queued_counter.add(-count)
+
+
+def client_id(request: Request) -> str:
+    """
+    Identify the client of a request: the X-Client-Id header, else its IP
+    """
+    client = request.headers.get("x-client-id")
+    if client:
+        return client
+    return request.client.host if request.client else "unknown"
+
+
+def is_duplicate_card(front, back, deck_name):
+    """
+    Check whether the same card was already submitted within DEDUP_WINDOW
+
+    Claims the card in the state, which may block on SQLite; call this from a
+    worker thread.
+    """
+    if DEDUP_WINDOW <= 0:
+        return False
+    key = hashlib.sha1(
+        "\0".join((deck_name.lower(), front, back)).encode("utf-8")
+    ).hexdigest()
+    return not state.claim(key, DEDUP_WINDOW)
+
+
+def check_similarity_threshold(threshold):
+    """
+    Reject a per-request threshold too low for the index to find its matches
+    """
+    if near_duplicates is not None and threshold is not None and threshold < near_duplicates.min_threshold:
+        raise HTTPException(
+            status_code=422,
+            detail=f"similarity_threshold must be at least {near_duplicates.min_threshold}",
+        )
+
+
+def find_near_duplicate(front, deck_name, policy, threshold):
+    """
+    Look up an added card similar to this one
+
+    Returns:
+        tuple: (match, signature); match is None if there is no near-duplicate
+            or the policy is force, signature is None if detection is off
+    """
+    if near_duplicates is None:
+        return None, None
+    signature = near_duplicates.signature(front)
+    if policy == "force":
+        return None, signature
+    return near_duplicates.find(front, deck_name, threshold, signature=signature), signature
+
+
+def near_duplicate_message(match):
+    """
+    Describe the added card a skipped near-duplicate resembles
+
+    Only the card's index id is given; its text may belong to another client.
+    """
+    return (
+        f"Near-duplicate of existing card {match['id']} "
+        f"(similarity {match['similarity']:.2f})"
+    )
+
+
+async def read_bulk_body(request: Request) -> bytes:
+    """
+    Read a bulk request body, decompressing it and enforcing MAX_BODY_BYTES
+    """
+    try:
+        return await read_body(request, MAX_BODY_BYTES)
+    except BodyTooLarge:
+        raise HTTPException(
+            status_code=413, detail=f"Request body is larger than {MAX_BODY_BYTES} bytes"
+        )
+    except UnsupportedEncoding as e:
+        raise HTTPException(
+            status_code=415,
+            detail=f"Unsupported Content-Encoding '{e}'",
+            headers={"Accept-Encoding": ", ".join(SUPPORTED_ENCODINGS)},
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def card_result(result):
+    """
+    Reduce an add_anki_card result to its JSON-serializable fields
+    """
+    reduced = {
+        "success": result["success"],
+        "status_code": result["status_code"],
+        "message": result["message"],
+    }
+    if result.get("spooled"):
+        reduced["spooled"] = True
+    if result.get("note_id") is not None:
+        reduced["note_id"] = result["note_id"]
+    return reduced
+
+
+def record_cards(cards, results, tenant):
+    """
+    Queue submitted (front, back, deck_name) cards and their results for the
+    card ledger, and store the note ids of added cards in the note index
+
+    Writing the note index blocks on SQLite, so call this from a worker thread.
+    """
+    if note_index is not None:
+        note_index.record_many(
+            tenant,
+            [
+                (front, back, deck_name, result["note_id"])
+                for (front, back, deck_name), result in zip(cards, results)
+                if result["success"] and result.get("note_id") is not None
+            ],
+        )
+    if ledger is None:
+        return
+    for (front, back, deck_name), result in zip(cards, results):
+        ledger.record(
+            deck_name, front, back, result_status(result), result.get("status_code"), tenant
+        )
+
+
 # Define the API endpoints
 @app.post("/add-card", response_model=ApiResponse)
-async def api_add_card(request: CardRequest):
+async def api_add_card(request: CardRequest, http_request: Request):
     """
     Add a single card to an Anki deck
     """
-    result = add_anki_card(
-        front_text=request.front,
-        back_text=request.back,
-        deck_name=request.deck_name,
-        cookie=DEFAULT_COOKIE,
-        verbose=False,
+    if DEDUP_WINDOW > 0 and await run_in_threadpool(
+        is_duplicate_card, request.front, request.back, request.deck_name
+    ):
+        return {
+            "success": True,
+            "message": "Duplicate card ignored",
+            "data": {"duplicate": True},
+        }
+
+    check_similarity_threshold(request.similarity_threshold)
+    policy = request.duplicate_policy or NEAR_DUP_POLICY
+    match, signature = await run_in_threadpool(
+        find_near_duplicate, request.front, request.deck_name, policy, request.similarity_threshold
+    )
+    if match is not None and policy == "skip":
+        await run_in_threadpool(
+            record_cards,
+            [(request.front, request.back, request.deck_name)],
+            [{"success": False, "status_code": 409, "near_duplicate": match}],
+            client_id(http_request),
+        )
+        raise HTTPException(status_code=409, detail=near_duplicate_message(match))
+
+    # Blocking upstream calls run in the thread pool to keep the event loop free
+    with queued_cards(1):
+        if microbatcher is not None:
+            result = await microbatcher.submit(
+                request.front, request.back, request.deck_name, client_id(http_request)
+            )
+        else:
+            result = await run_in_threadpool(
+                add_anki_card,
+                front_text=request.front,
+                back_text=request.back,
+                deck_name=request.deck_name,
+                verbose=False,
+                priority="interactive",
+                tenant=client_id(http_request),
+            )
+    await run_in_threadpool(
+        record_cards,
+        [(request.front, request.back, request.deck_name)],
+        [result],
+        client_id(http_request),
     )
 
     if result["success"]:
+        if signature is not None:
+            await run_in_threadpool(near_duplicates.add, request.front, request.deck_name, signature)
+        data = {"status_code": result["status_code"]}
+        if result.get("spooled"):
+            data["spooled"] = True
+        if result.get("note_id") is not None:
+            data["note_id"] = result["note_id"]
+        if match is not None:
+            data["near_duplicate"] = match
         return {
             "success": True,
             "message": result["message"],
-            "data": {"status_code": result["status_code"]},
+            "data": data,
         }
     else:
         raise HTTPException(
-            status_code=result.get("status_code", 500), detail=result["message"]
+            status_code=result.get("status_code") or 500, detail=result["message"]
         )
 
 
-@app.post("/add-multiple-cards", response_model=ApiResponse)
-async def api_add_multiple_cards(request: MultipleCardsRequest):
+@app.post("/update-card", response_model=ApiResponse)
+async def api_update_card(request: UpdateCardRequest, http_request: Request):
+    """
+    Replace the text of a card added earlier, in place
+    """
+    client = client_id(http_request)
+    note_id = request.note_id
+    if note_id is None:
+        if request.original_front is None or request.original_back is None:
+            raise HTTPException(
+                status_code=400, detail="Give note_id, or original_front and original_back"
+            )
+        if note_index is None:
+            raise HTTPException(status_code=404, detail="Note index is disabled")
+        note_id = await run_in_threadpool(
+            note_index.lookup, client, request.deck_name, request.original_front, request.original_back
+        )
+        if note_id is None:
+            raise HTTPException(status_code=404, detail="Card not found in the note index")
+
+    with queued_cards(1):
+        result = await run_in_threadpool(
+            update_anki_card,
+            note_id,
+            request.front,
+            request.back,
+            priority="interactive",
+            tenant=client,
+        )
+
+    if not result["success"]:
+        raise HTTPException(
+            status_code=result.get("status_code") or 500, detail=result["message"]
+        )
+    # A spooled update is delivered later, so the index already points at the new text
+    if note_index is not None:
+        await run_in_threadpool(
+            note_index.replace, client, note_id, request.deck_name, request.front, request.back
+        )
+    data = {"status_code": result["status_code"], "note_id": note_id}
+    if result.get("spooled"):
+        data["spooled"] = True
+    return {"success": True, "message": result["message"], "data": data}
+
+
+@app.post(
+    "/add-multiple-cards",
+    response_model=ApiResponse,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": inline_schema(MultipleCardsRequest)}},
+        }
+    },
+)
+async def api_add_multiple_cards(request: Request):
     """
     Add multiple cards to an Anki deck
     """
-    cards = [(card.front, card.back) for card in request.cards]
+    # The body is decoded straight into (front, back) tuples; building a
+    # MultipleCardsRequest would create one pydantic model per card.
+    try:
+        bulk = decode_bulk_request(await read_bulk_body(request))
+    except BulkRequestError as e:
+        raise RequestValidationError(e.errors)
 
-    summary = add_multiple_cards(
-        cards=cards,
-        deck_name=request.deck_name,
-        cookie=DEFAULT_COOKIE,
-        delay=request.delay,
-        verbose=False,
-    )
+    cards = bulk.cards
+    matches = signatures = None
+    skipped = False
+    if near_duplicates is not None:
+        check_similarity_threshold(bulk.similarity_threshold)
+        policy = bulk.duplicate_policy or NEAR_DUP_POLICY
+        matches, signatures = await run_in_threadpool(
+            screen_near_duplicates, cards, policy, bulk.similarity_threshold
+        )
+        skipped = policy == "skip"
+        cards = [
+            card for card, match in zip(bulk.cards, matches) if match is None or not skipped
+        ]
+
+    media_type = stream_media_type(request.headers.get("accept", ""))
+    if media_type is not None:
+        return StreamingResponse(
+            stream_bulk_results(
+                bulk, matches, signatures, skipped, client_id(request), media_type
+            ),
+            media_type=media_type,
+            # Ask reverse proxies not to buffer the stream
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    with queued_cards(len(cards)):
+        summary = await run_in_threadpool(
+            add_multiple_cards,
+            cards=cards,
+            delay=bulk.delay,
+            verbose=False,
+            tenant=client_id(request),
+        )
+    results = [card_result(result) for result in summary["results"]]
+
+    if matches is not None:
+        results = await run_in_threadpool(
+            merge_near_duplicates, bulk.cards, matches, signatures, results, skipped
+        )
 
+    await run_in_threadpool(record_cards, bulk.cards, results, client_id(request))
+
+    succeeded = sum(result["success"] for result in results)
     return {
-        "success": summary["success"] > 0,
-        "message": f"Added {summary['success']} out of {summary['total']} cards",
+        "success": succeeded > 0,
+        "message": f"Added {succeeded} out of {len(results)} cards",
         "data": {
-            "total": summary["total"],
-            "success": summary["success"],
-            "failed": summary["failed"],
+            "total": len(results),
+            "success": succeeded,
+            "failed": len(results) - succeeded,
+            "by_deck": count_by_deck(bulk.cards, results),
+            "results": results,
         },
     }
 
 
+@app.post(
+    "/add-raw-payloads",
+    response_model=ApiResponse,
+    dependencies=[Depends(require_producer)],
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/octet-stream": {"schema": {"type": "string", "format": "binary"}}},
+        }
+    },
+)
+async def api_add_raw_payloads(request: Request):
+    """
+    Send payloads already encoded like add_anki_card's, each preceded by its
+    varint length, without decoding or re-encoding them
+    """
+    if get_backend().name != "ankiweb":
+        raise HTTPException(
+            status_code=501, detail=f"The {get_backend().name} backend does not accept raw payloads"
+        )
+    try:
+        payloads = split_delimited_payloads(await read_bulk_body(request))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not payloads:
+        raise HTTPException(status_code=400, detail="No payloads in the request body")
+
+    decks = [payload_deck(payload) for payload in payloads]
+    unknown = [i for i, deck_name in enumerate(decks) if deck_name is None]
+    if unknown:
+        raise HTTPException(
+            status_code=422,
+            detail={"message": "Payloads without a registered deck suffix", "indexes": unknown[:100]},
+        )
+
+    with queued_cards(len(payloads)):
+        raw_results = await run_in_threadpool(
+            add_raw_payloads, list(zip(payloads, decks)), tenant=client_id(request)
+        )
+    results = [card_result(result) for result in raw_results]
+
+    succeeded = sum(result["success"] for result in results)
+    return {
+        "success": succeeded > 0,
+        "message": f"Added {succeeded} out of {len(results)} payloads",
+        "data": {
+            "total": len(results),
+            "success": succeeded,
+            "failed": len(results) - succeeded,
+            "by_deck": count_by_deck([(None, None, deck_name) for deck_name in decks], results),
+            "results": results,
+        },
+    }
+
+
+def stream_media_type(accept):
+    """
+    Pick the streaming format a client asked for in its Accept header
+
+    Returns:
+        str: NDJSON_MEDIA_TYPE, SSE_MEDIA_TYPE, or None for a plain JSON response
+    """
+    for media_type in (SSE_MEDIA_TYPE, NDJSON_MEDIA_TYPE):
+        if media_type in accept:
+            return media_type
+    return None
+
+
+def encode_frame(frame, media_type):
+    """
+    Encode a stream frame as an NDJSON line or a Server-Sent Event
+    """
+    if media_type == SSE_MEDIA_TYPE:
+        return b"event: " + frame["type"].encode() + b"\ndata: " + dumps(frame) + b"\n\n"
+    return dumps(frame) + b"\n"
+
+
+async def stream_bulk_results(bulk, matches, signatures, skipped, tenant, media_type):
+    """
+    Submit the cards of a bulk request and stream each card's result as it completes
+
+    Frames, in order: "start" with the number of cards, one "result" per card
+    in completion order (index is the card's position in the request),
+    "progress" every STREAM_PROGRESS_INTERVAL seconds, and a final "summary".
+    Ledger records and the near-duplicate index are updated by the worker
+    thread, so they are complete even if the client disconnects early.
+    """
+    loop = asyncio.get_running_loop()
+    frames = asyncio.Queue()
+    total = len(bulk.cards)
+    # Position in the request of each card that is sent
+    sent = [
+        i for i in range(total) if matches is None or matches[i] is None or not skipped
+    ]
+    added = []
+
+    def on_result(index, result):
+        i = sent[index]
+        result = card_result(result)
+        if matches is not None and matches[i] is not None:
+            result["near_duplicate"] = matches[i]
+        if result["success"] and signatures is not None:
+            added.append((bulk.cards[i][0], bulk.cards[i][2], signatures[i]))
+        record_cards([bulk.cards[i]], [result], tenant)
+        loop.call_soon_threadsafe(frames.put_nowait, (i, result))
+
+    def submit():
+        with queued_cards(len(sent)):
+            add_multiple_cards(
+                cards=[bulk.cards[i] for i in sent],
+                delay=bulk.delay,
+                verbose=False,
+                tenant=tenant,
+                on_result=on_result,
+            )
+        if added:
+            near_duplicates.add_many(added)
+
+    started = time.monotonic()
+    done = succeeded = 0
+    results = [None] * total
+
+    def result_frame(i, result):
+        nonlocal done, succeeded
+        done += 1
+        succeeded += result["success"]
+        results[i] = result
+        frame = {"type": "result", "index": i, "deck_name": bulk.cards[i][2], **result}
+        return encode_frame(frame, media_type)
+
+    def progress(frame_type):
+        elapsed = time.monotonic() - started
+        return {
+            "type": frame_type,
+            "total": total,
+            "done": done,
+            "success": succeeded,
+            "failed": done - succeeded,
+            "elapsed": round(elapsed, 3),
+            "cards_per_second": round(done / elapsed, 2) if elapsed > 0 else 0.0,
+        }
+
+    yield encode_frame({"type": "start", "total": total}, media_type)
+    # Skipped near-duplicates are known before anything is sent
+    for i in range(total):
+        if skipped and matches[i] is not None:
+            result = {
+                "success": False,
+                "status_code": 409,
+                "message": near_duplicate_message(matches[i]),
+                "near_duplicate": matches[i],
+            }
+            await run_in_threadpool(record_cards, [bulk.cards[i]], [result], tenant)
+            yield result_frame(i, result)
+
+    task = asyncio.ensure_future(run_in_threadpool(submit))
+    next_progress = started + STREAM_PROGRESS_INTERVAL
+    getter = None
+    try:
+        while True:
+            if getter is None:
+                getter = asyncio.ensure_future(frames.get())
+            finished, _ = await asyncio.wait(
+                {getter, task},
+                timeout=max(0, next_progress - time.monotonic()),
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if getter in finished:
+                yield result_frame(*getter.result())
+                getter = None
+            elif task in finished:
+                # Results are queued before the task completes, so none are lost
+                while not frames.empty():
+                    yield result_frame(*frames.get_nowait())
+                break
+            if time.monotonic() >= next_progress:
+                yield encode_frame(progress("progress"), media_type)
+                next_progress = time.monotonic() + STREAM_PROGRESS_INTERVAL
+        task.result()
+    finally:
+        if getter is not None:
+            getter.cancel()
+
+    summary = progress("summary")
+    summary["by_deck"] = count_by_deck(bulk.cards, results)
+    yield encode_frame(summary, media_type)
+
+
+def screen_near_duplicates(cards, policy, threshold):
+    """
+    Look up near-duplicates for each (front, back, deck_name) card of a bulk request
+
+    Returns:
+        tuple: (matches, signatures), one entry per card
+    """
+    matches = []
+    signatures = []
+    for front, _, deck_name in cards:
+        match, signature = find_near_duplicate(front, deck_name, policy, threshold)
+        matches.append(match)
+        signatures.append(signature)
+    return matches, signatures
+
+
+def merge_near_duplicates(cards, matches, signatures, results, skipped):
+    """
+    Put skipped cards back into the results, flag near-duplicates and index
+    the cards that were added
+
+    Args:
+        results (list): Results of the cards that were sent, in order
+
+    Returns:
+        list: One result per card of the request
+    """
+    sent = iter(results)
+    merged = []
+    added = []
+    for (front, _, deck_name), match, signature in zip(cards, matches, signatures):
+        if match is not None and skipped:
+            merged.append(
+                {
+                    "success": False,
+                    "status_code": 409,
+                    "message": near_duplicate_message(match),
+                    "near_duplicate": match,
+                }
+            )
+            continue
+        result = next(sent)
+        if match is not None:
+            result["near_duplicate"] = match
+        if result["success"]:
+            added.append((front, deck_name, signature))
+        merged.append(result)
+    near_duplicates.add_many(added)
+    return merged
+
+
+@app.get("/cards/search", dependencies=[Depends(require_admin)])
+async def search_cards(
+    q: Optional[str] = Query(
+        default=None,
+        description="Words that must all appear in the card; end a word with * for a prefix match",
+    ),
+    deck_name: Optional[str] = Query(
+        default=None, description="Only cards submitted to this deck"
+    ),
+    status: Optional[Literal[LEDGER_STATUSES]] = Query(
+        default=None, description="Only cards with this outcome"
+    ),
+    hash: Optional[str] = Query(
+        default=None, description="Only cards with this content hash"
+    ),
+    tenant: Optional[str] = Query(
+        default=None, description="Only cards submitted by this client (X-Client-Id or IP)"
+    ),
+    limit: int = Query(default=20, ge=1, le=100, description="Cards per page"),
+    cursor: Optional[int] = Query(
+        default=None, description="next_cursor of the previous page"
+    ),
+):
+    """
+    Search the ledger of submitted cards, newest first
+
+    The ledger holds the cards of every client, so searching it needs the
+    admin token.
+    """
+    if ledger is None:
+        raise HTTPException(status_code=404, detail="Card ledger is disabled")
+    return await run_in_threadpool(
+        ledger.search,
+        query=q,
+        deck_name=deck_name,
+        status=status,
+        content_hash=hash,
+        tenant=tenant,
+        limit=limit,
+        cursor=cursor,
+    )
+
+
+@app.post(
+    "/export-apkg",
+    response_class=FileResponse,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": inline_schema(MultipleCardsRequest)}},
+        }
+    },
+)
+async def api_export_apkg(request: Request):
+    """
+    Build a .apkg package from the cards instead of sending them to AnkiWeb
+    """
+    try:
+        bulk = decode_bulk_request(await read_bulk_body(request))
+    except BulkRequestError as e:
+        raise RequestValidationError(e.errors)
+
+    directory = tempfile.mkdtemp(prefix="anki-export-")
+    path = os.path.join(directory, "cards.apkg")
+    try:
+        await run_in_threadpool(build_apkg, bulk.cards, path, default_deck=bulk.deck_name)
+    except Exception:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+
+    return FileResponse(
+        path,
+        filename=f"{bulk.deck_name}.apkg",
+        media_type="application/octet-stream",
+        background=BackgroundTask(shutil.rmtree, directory, ignore_errors=True),
+    )
+
+
+# Cache-Control hints for read endpoints. Clients may keep a copy but must
+# revalidate it with If-None-Match, which is answered with a bodyless 304.
+CATALOGUE_CACHE_CONTROL = "public, no-cache"
+HEALTH_CACHE_CONTROL = "no-cache"
+
+_HEALTH_BODY = dumps({"status": "healthy"})
+_HEALTH_ETAG = make_etag(_HEALTH_BODY)
+
+# Encoded /decks response, rebuilt only when the deck registry version changes
+_decks_cache = {"version": None, "body": b"", "etag": ""}
+
+
+def cached_json_response(request: Request, body: bytes, etag: str, cache_control: str):
+    """
+    Return a pre-encoded JSON body, or a 304 if the client's copy is current
+    """
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
 @app.get("/health")
-async def health_check():
+async def health_check(request: Request):
     """
     Health check endpoint
     """
-    return {"status": "healthy"}
+    return cached_json_response(
+        request, _HEALTH_BODY, _HEALTH_ETAG, HEALTH_CACHE_CONTROL
+    )
+
+
+_LIVE_BODY = dumps({"status": "alive"})
+
+
+@app.get("/live")
+async def liveness_check():
+    """
+    Liveness check: the process is up and its event loop responds
+    """
+    return Response(
+        content=_LIVE_BODY, media_type="application/json", headers={"Cache-Control": "no-store"}
+    )
+
+
+@app.get("/ready")
+async def readiness_check():
+    """
+    Readiness check: whether this instance can deliver cards right now
+
+    Only reads state kept up to date by the background prober, the circuit
+    breaker and the scheduler, so calling it never sends upstream requests.
+    Returns 503 with the same body when the instance is not ready.
+    """
+    reasons = []
+    upstream = None
+    if upstream_prober is not None:
+        upstream = dict(upstream_prober.status)
+        if not upstream_prober.is_fresh():
+            reasons.append("upstream not checked recently")
+        elif not upstream["reachable"]:
+            reasons.append("upstream unreachable")
+        if upstream["credentials_valid"] is False:
+            reasons.append("credentials rejected")
+
+    breaker = circuit_breaker.snapshot() if circuit_breaker is not None else None
+    if breaker is not None and breaker["state"] == "open":
+        reasons.append("circuit breaker open")
+
+    queue_depth = scheduler.queue_depth() if scheduler is not None else {}
+    if MAX_QUEUE_DEPTH and sum(queue_depth.values()) >= MAX_QUEUE_DEPTH:
+        reasons.append("upstream queue full")
+
+    return JSONResponse(
+        status_code=503 if reasons else 200,
+        content={
+            "status": "not_ready" if reasons else "ready",
+            "reasons": reasons,
+            "upstream": upstream,
+            "circuit_breaker": breaker,
+            "queue_depth": queue_depth,
+            "queued_cards": await run_in_threadpool(state.get_counter, QUEUED_CARDS_COUNTER),
+        },
+        headers={"Cache-Control": "no-store"},
+    )
 
 
 @app.get("/decks")
-async def list_decks():
+async def list_decks(request: Request):
     """
     List available decks
     """
-    # For now, just return the hardcoded decks we know about
-    decks = ["default", "test", "life_tricks"]
-    return {"decks": decks}
+    version = get_deck_registry_version()
+    if _decks_cache["version"] != version:
+        body = dumps({"decks": list_deck_names()})
+        _decks_cache.update(version=version, body=body, etag=make_etag(body))
+
+    return cached_json_response(
+        request, _decks_cache["body"], _decks_cache["etag"], CATALOGUE_CACHE_CONTROL
+    )
+
+
+@app.post("/admin/reload", dependencies=[Depends(require_admin)])
+async def reload_config(request: Request):
+    """
+    Reload the config file, or apply a config given in the request body
+
+    A body is merged into the config file when there is one, so that every
+    worker process applies it.
+    """
+    body = await request.body()
+    try:
+        if body and config_watcher is not None:
+            changes = await run_in_threadpool(config_watcher.update, loads(body))
+        elif body and WORKER_PROCESSES > 1:
+            raise HTTPException(
+                status_code=409,
+                detail="Set ANKI_CONFIG_FILE to apply a config body to all worker processes",
+            )
+        elif body:
+            changes = apply_config(parse_config(loads(body)))
+        elif config_watcher is not None:
+            changes = await run_in_threadpool(config_watcher.reload)
+        else:
+            raise HTTPException(status_code=404, detail="No config file is configured")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "cookie_changed": changes["cookie"],
+        "deck_registry_version": get_deck_registry_version(),
+    }
+
+
+@app.get("/admin/profiles", dependencies=[Depends(require_admin)])
+async def list_profiles():
+    """
+    List the stored request profiles, newest first
+    """
+    if profiler is None:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    return {"profiles": profiler.store.list()}
+
+
+@app.get("/admin/profiles/{name}", dependencies=[Depends(require_admin)])
+async def get_profile(name: str):
+    """
+    Download a stored request profile
+    """
+    path = profiler.store.path_for(name) if profiler is not None else None
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, filename=name, media_type="application/octet-stream")
+
+
+def parse_args():
+    """
+    Parse the command line options of the server launcher
+    """
+    parser = argparse.ArgumentParser(description="Run the Anki API server")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", 8000)))
+    parser.add_argument(
+        "--production",
+        action="store_true",
+        default=os.getenv("ANKI_PRODUCTION", "").lower() in ("1", "true", "yes"),
+        help="Run with reload off and several worker processes",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)),
+        help="Number of worker processes in production mode",
+    )
+    parser.add_argument(
+        "--loop",
+        choices=["auto", "asyncio", "uvloop"],
+        default=os.getenv("ANKI_LOOP", "auto"),
+        help="Event loop implementation (uvloop must be installed)",
+    )
+    parser.add_argument(
+        "--http",
+        choices=["auto", "h11", "httptools"],
+        default=os.getenv("ANKI_HTTP", "auto"),
+        help="HTTP protocol implementation (httptools must be installed)",
+    )
+    return parser.parse_args()
 
 
 # Run the server if this file is executed directly
 if __name__ == "__main__":
-    # Get port from environment variable or use default
-    port = int(os.getenv("PORT", 8000))
+    args = parse_args()
 
-    # Run the server
-    uvicorn.run("main:app", host="0.0.0.0", port=port, reload=True)
+    for option, package in ((args.loop, "uvloop"), (args.http, "httptools")):
+        if option == package and importlib.util.find_spec(package) is None:
+            raise SystemExit(f"{package} is not installed: pip install {package}")
+
+    if args.production:
+        if args.workers > 1 and not STATE_DB:
+            # Workers inherit the environment, so they all open the same store
+            os.environ["ANKI_STATE_DB"] = os.path.abspath("anki_state.db")
+        os.environ["ANKI_WORKER_PROCESSES"] = str(args.workers)
+        uvicorn.run(
+            "main:app",
+            host=args.host,
+            port=args.port,
+            workers=args.workers,
+            loop=args.loop,
+            http=args.http,
+            reload=False,
+        )
+    else:
+        uvicorn.run(
+            "main:app",
+            host=args.host,
+            port=args.port,
+            loop=args.loop,
+            http=args.http,
+            reload=True,
+        )
@@ -0,0 +1,126 @@
+"""
+Per-client quotas and global load shedding for the Anki API.
+
+Every client (see client_id() in main.py) gets a token bucket of requests.
+Buckets live in a LocalState by default, or in the SharedState when quotas
+should hold across worker processes. Independently, requests are shed with a
+503 when the process already has too many requests in flight or too many
+payloads waiting for the upstream, so that a flood is turned away cheaply
+instead of queueing behind well-behaved traffic.
+"""
+
+import math
+
+from starlette.concurrency import run_in_threadpool
+
+
+class Rejection:
+    """Why a request was not admitted, and when the client may retry."""
+
+    def __init__(self, status_code, detail, retry_after):
+        """
+        Args:
+            status_code (int): 429 for an exhausted quota, 503 for overload
+            detail (str): Error message for the client
+            retry_after (float): Seconds the client should wait
+        """
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = max(1, math.ceil(retry_after))
+
+    @property
+    def headers(self):
+        return {"Retry-After": str(self.retry_after)}
+
+
+class AdmissionController:
+    """
+    Decides whether a request may proceed.
+
+    Requests are handled on the event loop, so in_flight is a plain counter.
+    """
+
+    def __init__(
+        self,
+        quota_state=None,
+        quota_rate=0.0,
+        quota_burst=1.0,
+        max_in_flight=0,
+        max_queue_depth=0,
+        queue_depth=None,
+        drain_rate=0.0,
+        quota_in_threadpool=False,
+    ):
+        """
+        Args:
+            quota_state: LocalState or SharedState holding the client buckets
+            quota_rate (float): Requests per second per client (0 disables quotas)
+            quota_burst (float): Requests a client may send at once
+            max_in_flight (int): Concurrent requests per process (0 = unlimited)
+            max_queue_depth (int): Payloads per lane waiting for the upstream
+                beyond which new submissions to that lane are shed (0 = unlimited)
+            queue_depth (callable, optional): Returns a dict of lane name to
+                queued payloads, e.g. SubmissionScheduler.queue_depth
+            drain_rate (float): Payloads per second the upstream accepts, used
+                to estimate Retry-After when shedding (0 = unknown)
+            quota_in_threadpool (bool): Take quota tokens in the thread pool,
+                for a SharedState whose transactions may wait on other workers
+        """
+        self.quota_state = quota_state
+        self.quota_rate = quota_rate
+        self.quota_burst = quota_burst
+        self.max_in_flight = max_in_flight
+        self.max_queue_depth = max_queue_depth
+        self.queue_depth = queue_depth
+        self.drain_rate = drain_rate
+        self.quota_in_threadpool = quota_in_threadpool
+        self.in_flight = 0
+        self.stats = {"admitted": 0, "over_quota": 0, "shed": 0}
+
+    async def admit(self, client, lane=None):
+        """
+        Check a request against the load limits and the client's quota
+
+        Args:
+            client (str): Quota key of the client
+            lane (str, optional): Scheduler lane the request submits to, if any
+
+        Returns:
+            Rejection: None if the request may proceed
+        """
+        rejection = self._check_load(lane)
+        if rejection is None and self.quota_rate:
+            if self.quota_in_threadpool:
+                rejection = await run_in_threadpool(self._check_quota, client)
+            else:
+                rejection = self._check_quota(client)
+        # Counted back on the event loop, so the stats need no lock
+        if rejection is None:
+            self.stats["admitted"] += 1
+        elif rejection.status_code == 429:
+            self.stats["over_quota"] += 1
+        else:
+            self.stats["shed"] += 1
+        return rejection
+
+    def _check_load(self, lane):
+        # Overload is checked first so shed requests do not use up quota
+        if self.max_in_flight and self.in_flight >= self.max_in_flight:
+            return Rejection(503, "Server is overloaded, retry later", 1)
+        if lane and self.max_queue_depth and self.queue_depth is not None:
+            depth = self.queue_depth()
+            # Bulk submissions count the whole queue and single cards only
+            # their own lane, so a bulk flood does not shed interactive traffic
+            queued = sum(depth.values()) if lane == "bulk" else depth.get(lane, 0)
+            if queued >= self.max_queue_depth:
+                retry_after = queued / self.drain_rate if self.drain_rate else 1
+                return Rejection(503, "Upstream queue is full, retry later", retry_after)
+        return None
+
+    def _check_quota(self, client):
+        wait = self.quota_state.take_tokens(
+            f"quota:{client}", self.quota_rate, self.quota_burst
+        )
+        if wait > 0:
+            return Rejection(429, "Request quota exceeded", wait)
+        return None
@@ -1,17 +1,605 @@
 import requests
+import os
+import threading
 import time
 import logging
+from concurrent.futures import FIRST_COMPLETED, wait
 
-# Set up basic logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+# Logging is configured by the application (see logging_setup.configure_logging)
 logger = logging.getLogger("anki-api")
+# Per-card logs, which can be sampled separately
+card_logger = logging.getLogger("anki-api.cards")
+
+# Binary suffixes (note type and deck ids) taken from the PowerShell commands,
+# keyed by lower-case deck name. The registry is copy-on-write: changes swap in
+# a new dict, so readers never see a partially updated registry.
+DECK_SUFFIXES = {
+    "default": bytes([26, 9, 8, 177, 246, 164, 207, 197, ord("2"), 16, 1]),
+    "test": bytes(
+        [26, 14, 8, 177, 246, 164, 207, 197, ord("2"), 16, 200, 136, 203, 146, 205, ord("2")]
+    ),
+    "life_tricks": bytes(
+        [26, 14, 8, 177, 246, 164, 207, 197, ord("2"), 16, 178, 197, 246, 250, 215, ord("2")]
+    ),
+    "ai": bytes(
+        [26, 14, 8, 177, 246, 164, 207, 197, ord("2"), 16, 162, 192, 203, 248, 209, ord("2")]
+    ),
+    "general_facts": bytes(
+        [26, 14, 8, 177, 246, 164, 207, 197, ord("2"), 16, 219, 129, 138, 146, 210, ord("2")]
+    ),
+    "software_engineering": bytes(
+        [26, 14, 8, 177, 246, 164, 207, 197, ord("2"), 16, 255, 146, 136, 170, 198, ord("2")]
+    ),
+    "universe": bytes(
+        [26, 14, 8, 177, 246, 164, 207, 197, ord("2"), 16, 249, 130, 170, 138, 198, ord("2")]
+    ),
+    "words_in_english": bytes(
+        [26, 14, 8, 177, 246, 164, 207, 197, ord("2"), 16, 223, 204, 141, 170, 198, ord("2")]
+    ),
+    "words_in_romanian": bytes(
+        [26, 14, 8, 177, 246, 164, 207, 197, ord("2"), 16, 198, 151, 176, 130, 201, ord("2")]
+    ),
+}
+
+# Incremented on every registry change; used by callers to invalidate caches
+_deck_registry_version = 1
+
+# AnkiWeb endpoint that notes are posted to
+UPSTREAM_URL = os.getenv(
+    "ANKI_UPSTREAM_URL", "https://ankiuser.net/svc/editor/add-or-update"
+)
+
+# Page fetched by AnkiWebBackend.probe: it needs a login and changes nothing
+PROBE_URL = os.getenv("ANKI_PROBE_URL", "https://ankiuser.net/add")
+
+# Optional limiter taken before every upstream request; see set_upstream_rate_limiter
+_upstream_limiter = None
+
+# Optional circuit breaker guarding upstream requests; see set_circuit_breaker
+_circuit_breaker = None
+
+
+class UpstreamUnavailable(requests.ConnectionError):
+    """Raised instead of sending a payload while the circuit breaker is open."""
+
+
+def set_upstream_rate_limiter(limiter):
+    """
+    Limit the rate of requests sent to AnkiWeb
+
+    Args:
+        limiter: Object with a blocking acquire() method (e.g. a
+            shared_state.RateLimiter from SharedState.rate_limiter, shared by
+            all workers), or None to disable rate limiting
+    """
+    global _upstream_limiter
+    _upstream_limiter = limiter
+
+
+def set_circuit_breaker(breaker):
+    """
+    Stop sending to AnkiWeb while it keeps failing
+
+    Args:
+        breaker: An upstream_health.CircuitBreaker fed with the outcome of
+            every upstream request, or None to always send
+    """
+    global _circuit_breaker
+    _circuit_breaker = breaker
+
+
+def get_deck_suffix(deck_name):
+    """
+    Look up the binary suffix for a deck
+
+    Args:
+        deck_name (str): Name of the deck (case-insensitive)
+
+    Returns:
+        bytes: The deck's binary suffix, or None if the deck is not registered
+    """
+    return DECK_SUFFIXES.get(deck_name.lower())
+
+
+def list_deck_names():
+    """
+    List the names of all registered decks
+
+    Returns:
+        list: Deck names in registration order
+    """
+    return list(DECK_SUFFIXES)
+
+
+def get_deck_registry_version():
+    """
+    Get the current version of the deck registry
+
+    Returns:
+        int: A counter that changes whenever the registry changes
+    """
+    return _deck_registry_version
+
+
+def set_deck_registry(deck_suffixes):
+    """
+    Replace the whole deck registry in one step
+
+    Args:
+        deck_suffixes (dict): Mapping of deck name to binary suffix
+
+    Returns:
+        int: The new registry version
+    """
+    global DECK_SUFFIXES, _deck_registry_version
+    DECK_SUFFIXES = {name.lower(): bytes(suffix) for name, suffix in deck_suffixes.items()}
+    _deck_registry_version += 1
+    return _deck_registry_version
+
+
+# Default cookie used when none is provided
+DEFAULT_COOKIE = (
+    "has_auth=1; ankiweb=eyJvcCI6ImNrIiwiaWF0IjoxNzM2Nzk4ODI1LCJqdiI6MCwiayI6"
+    "InZidTxTQ1EqOVFHb34uaTwiLCJjIjoyLCJ0IjoxNzM2Nzk4ODI1fQ.mwUZf4Fym4BWUbMTQFlAeHa-3bq9fOIdxsNl2W1bcEs"
+)
+
+
+def set_default_cookie(cookie):
+    """
+    Replace the cookie used when none is provided
+
+    The cookie is read on every upstream request, so rebinding it takes
+    effect immediately without locks. Pooled sessions are kept: the cookie
+    travels as a request header, not as session state.
+
+    Args:
+        cookie (str): The new authentication cookie
+
+    Returns:
+        bool: True if the cookie changed
+    """
+    global DEFAULT_COOKIE
+    if cookie == DEFAULT_COOKIE:
+        return False
+    DEFAULT_COOKIE = cookie
+    return True
+
+
+def get_default_cookie():
+    """
+    Get the cookie used when none is provided
+
+    Returns:
+        str: The current default cookie
+    """
+    return DEFAULT_COOKIE
+
+
+# Headers sent with every upstream request, apart from the cookie
+UPSTREAM_HEADERS = {
+    "Content-Type": "application/octet-stream",
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+        "(KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36"
+    ),
+    "Origin": "https://ankiuser.net",
+    "Referer": "https://ankiuser.net/add",
+}
+
+# Optional scheduler that orders upstream requests; see set_scheduler
+_scheduler = None
+
+# One pooled HTTP session per thread
+_sessions = threading.local()
+
+# Optional offline spool; see set_spool
+_spool = None
+_spool_mode = "off"
+
+
+def set_spool(spool, mode="fallback"):
+    """
+    Write encoded payloads to an offline spool instead of losing them
+
+    Args:
+        spool: A spool.Spool instance, or None to disable spooling
+        mode (str): "fallback" to spool only when AnkiWeb is unreachable or
+            returns a server error, "always" to spool every card and let a
+            spool.SpoolReplayer deliver them, or "off"
+    """
+    global _spool, _spool_mode
+    if mode not in ("off", "fallback", "always"):
+        raise ValueError(f"Unknown spool mode '{mode}'")
+    _spool = spool
+    _spool_mode = mode if spool is not None else "off"
+
+
+def set_scheduler(scheduler):
+    """
+    Send upstream requests through a priority-aware scheduler
+
+    Args:
+        scheduler: A scheduler.SubmissionScheduler, or None to send directly
+    """
+    global _scheduler
+    _scheduler = scheduler
+
+
+def _get_session():
+    """Get this thread's pooled HTTP session."""
+    session = getattr(_sessions, "session", None)
+    if session is None:
+        session = _sessions.session = requests.Session()
+    return session
+
+
+def normalize_card_text(text):
+    """
+    Clean card text before encoding
+
+    Removes Romanian quotation marks and replaces Romanian diacritics with
+    their base characters.
+
+    Args:
+        text (str): Card text
+
+    Returns:
+        str: The normalized text
+    """
+    # clean quotation marks
+    text = text.replace("„", "").replace("”", "")
+
+    # replace romanian diacritics with their base characters
+    return text.replace("ă", "a").replace("ş", "s").replace("ţ", "t").replace("î", "i").replace("â", "a")
+
+
+def _length_prefix(text):
+    """Build the length indicator for a text field."""
+    if len(text) < 128:
+        return bytes([len(text)])
+    # For longer text, encode as two bytes
+    return bytes([128 + (len(text) % 128), len(text) // 128])
+
+
+def _encode_text_part(front_text, back_text):
+    """Encode the front and back fields; this part is the same for all decks."""
+    return (
+        bytes([10])
+        + _length_prefix(front_text)
+        + front_text.encode("utf-8")
+        + bytes([10])
+        + _length_prefix(back_text)
+        + back_text.encode("utf-8")
+    )
+
+
+def encode_card_payload(front_text, back_text, deck_name="default", verbose=False):
+    """
+    Encode normalized card text into the binary add-or-update payload
+
+    Args:
+        front_text (str): Normalized text for the front of the card
+        back_text (str): Normalized text for the back of the card
+        deck_name (str): Name of the deck to add the card to
+        verbose (bool, optional): If True, warns about unknown decks
+
+    Returns:
+        bytes: The payload, including the deck's binary suffix
+    """
+    text_part = _encode_text_part(front_text, back_text)
+
+    # Binary suffix from the deck registry
+    binary_suffix = get_deck_suffix(deck_name)
+    if binary_suffix is None:
+        # Use default deck format for unknown decks
+        if verbose:
+            print(f"Warning: Unknown deck '{deck_name}'. Using default deck format.")
+        binary_suffix = DECK_SUFFIXES["default"]
+
+    return text_part + binary_suffix
+
+
+# Field of the add-or-update request carrying the id of the note to update;
+# an update sends it instead of the deck suffix
+UPDATE_NOTE_ID_FIELD = 4
+
+
+def _varint(value):
+    """Encode a non-negative integer as a protobuf varint."""
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def encode_update_payload(note_id, front_text, back_text):
+    """
+    Encode normalized card text into the binary payload updating an existing note
+
+    Args:
+        note_id (int): Id of the note, as returned when it was added
+        front_text (str): Normalized new text for the front of the card
+        back_text (str): Normalized new text for the back of the card
+
+    Returns:
+        bytes: The payload
+    """
+    return (
+        bytes([10])
+        + _length_prefix(front_text)
+        + front_text.encode("utf-8")
+        + bytes([10])
+        + _length_prefix(back_text)
+        + back_text.encode("utf-8")
+        + _varint(UPDATE_NOTE_ID_FIELD << 3)
+        + _varint(note_id)
+    )
+
+
+def decode_note_id(content):
+    """
+    Read the note id from an add-or-update response
+
+    The response is a protobuf message whose field 1 (a varint) is the id of
+    the added or updated note.
+
+    Args:
+        content (bytes): Response body
+
+    Returns:
+        int: The note id, or None if the body does not contain one
+    """
+    position = 0
+    length = len(content or b"")
+    try:
+        while position < length:
+            key, position = _read_varint(content, position)
+            field, wire_type = key >> 3, key & 7
+            if wire_type == 0:
+                value, position = _read_varint(content, position)
+                if field == 1:
+                    return value
+            elif wire_type == 2:
+                size, position = _read_varint(content, position)
+                position += size
+            elif wire_type == 1:
+                position += 8
+            elif wire_type == 5:
+                position += 4
+            else:
+                return None
+    except IndexError:
+        pass
+    return None
+
+
+def _read_varint(content, position):
+    value = 0
+    shift = 0
+    while True:
+        byte = content[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+
+def split_delimited_payloads(body):
+    """
+    Split a body of varint length-delimited payloads
+
+    Each payload is preceded by its length as a protobuf varint, as written by
+    protobuf's writeDelimitedTo.
+
+    Args:
+        body (bytes): The framed payloads
+
+    Returns:
+        list: memoryview slices of body, one per payload; nothing is copied
+
+    Raises:
+        ValueError: If a length prefix is malformed, a payload is empty or the
+            last payload is truncated
+    """
+    view = memoryview(body)
+    payloads = []
+    position = 0
+    length = len(view)
+    while position < length:
+        start = position
+        try:
+            size, position = _read_varint(view, position)
+        except IndexError:
+            raise ValueError(f"Truncated length prefix at offset {start}")
+        if position - start > 5 or size == 0:
+            raise ValueError(f"Invalid length prefix at offset {start}")
+        if position + size > length:
+            raise ValueError(f"Payload at offset {start} is truncated")
+        payloads.append(view[position:position + size])
+        position += size
+    return payloads
+
+
+def frame_payloads(payloads):
+    """
+    Join payloads into a body for split_delimited_payloads
+
+    Args:
+        payloads (list): Encoded payloads
+
+    Returns:
+        bytes: Each payload preceded by its varint length
+    """
+    return b"".join(_varint(len(payload)) + payload for payload in payloads)
+
+
+# (registry version, [(suffix length, {suffix: deck name})]), longest suffixes first
+_suffix_index = (None, [])
+
+
+def payload_deck(payload):
+    """
+    Find the registered deck whose binary suffix ends a payload
+
+    Args:
+        payload (bytes or memoryview): A payload built like encode_card_payload's
+
+    Returns:
+        str: The deck name, or None if the payload does not start with a text
+            field or ends with no registered deck's suffix
+    """
+    global _suffix_index
+    version, index = _suffix_index
+    if version != _deck_registry_version:
+        # Read the version before the registry, so a concurrent swap only
+        # causes another rebuild
+        version = _deck_registry_version
+        by_length = {}
+        for name, suffix in DECK_SUFFIXES.items():
+            by_length.setdefault(len(suffix), {}).setdefault(suffix, name)
+        index = sorted(by_length.items(), reverse=True)
+        _suffix_index = (version, index)
+
+    if not len(payload) or payload[0] != 10:
+        return None
+    for size, suffixes in index:
+        # A read-only memoryview hashes like bytes, so this lookup does not copy
+        if len(payload) > size:
+            deck_name = suffixes.get(payload[-size:])
+            if deck_name is not None:
+                return deck_name
+    return None
+
+
+def send_payload(payload, cookie=None, rate_limited=True):
+    """
+    Send an encoded payload to AnkiWeb
+
+    Args:
+        payload (bytes): Payload built by encode_card_payload
+        cookie (str, optional): Authentication cookie. If None, uses the default cookie.
+        rate_limited (bool, optional): If False, skip the upstream rate limiter
+            (for callers that already took a token)
+
+    Returns:
+        Response: The upstream response
+
+    Raises:
+        requests.RequestException: If AnkiWeb could not be reached, or
+            UpstreamUnavailable while the circuit breaker is open
+    """
+    headers = dict(UPSTREAM_HEADERS)
+    headers["Cookie"] = cookie if cookie is not None else DEFAULT_COOKIE
+
+    breaker = _circuit_breaker
+    if breaker is not None and not breaker.allow():
+        raise UpstreamUnavailable("AnkiWeb is failing, circuit breaker is open")
+    if rate_limited and _upstream_limiter is not None:
+        _upstream_limiter.acquire()
+    try:
+        response = _get_session().post(UPSTREAM_URL, headers=headers, data=payload)
+    except requests.RequestException:
+        if breaker is not None:
+            breaker.record_failure()
+        raise
+    if breaker is not None:
+        if response.status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+    return response
+
+
+def dispatch_payload(payload, cookie=None, priority="interactive", tenant=None, deck_name=None):
+    """
+    Send an encoded payload, through the scheduler if one is configured
+
+    Args:
+        payload (bytes): Payload built by encode_card_payload
+        cookie (str, optional): Authentication cookie
+        priority (str, optional): Scheduler lane, "interactive" or "bulk"
+        tenant (str, optional): Client the card belongs to, for fair queuing
+        deck_name (str, optional): Target deck, for fair queuing
+
+    Returns:
+        Response: The upstream response
+    """
+    if _scheduler is None:
+        return send_payload(payload, cookie)
+    return _scheduler.submit(payload, cookie, priority, tenant, deck_name).result()
+
+
+def _spooled_result(deck_name):
+    """Build the result returned for a card written to the spool."""
+    return {
+        "success": True,
+        "status_code": 202,
+        "message": f"Card queued for delivery to deck '{deck_name}'",
+        "response": None,
+        "spooled": True,
+    }
+
+
+def _error_result(error):
+    """Build the result returned when a card could not be added."""
+    return {
+        "success": False,
+        "status_code": 503 if isinstance(error, UpstreamUnavailable) else None,
+        "message": f"Error adding card: {str(error)}",
+        "response": None,
+    }
+
+
+def _delivery_result(payload, deck_name, response=None, error=None):
+    """
+    Build the result of sending a payload, spooling it if the upstream failed
+
+    Args:
+        payload (bytes): The payload that was sent
+        deck_name (str): Target deck
+        response (Response, optional): Upstream response, if one was received
+        error (Exception, optional): Exception raised while sending
+    """
+    if error is not None:
+        if _spool_mode == "fallback" and isinstance(error, requests.RequestException):
+            _spool.append(payload)
+            return _spooled_result(deck_name)
+        return _error_result(error)
+
+    if _spool_mode == "fallback" and (
+        response.status_code >= 500 or response.status_code == 429
+    ):
+        _spool.append(payload)
+        return _spooled_result(deck_name)
+
+    # Check if the request was successful
+    if response.status_code == 200:
+        return {
+            "success": True,
+            "status_code": response.status_code,
+            "message": f"Card successfully added to deck '{deck_name}'",
+            "response": response,
+            "note_id": decode_note_id(response.content),
+        }
+    return {
+        "success": False,
+        "status_code": response.status_code,
+        "message": f"Failed to add card. Status code: {response.status_code}",
+        "response": response,
+    }
 
 
 def add_anki_card(
-    front_text, back_text, deck_name="default", cookie=None, verbose=False
+    front_text,
+    back_text,
+    deck_name="default",
+    cookie=None,
+    verbose=False,
+    priority="interactive",
+    tenant=None,
 ):
     """
     Add a card to Anki with the specified parameters using the exact format from PowerShell commands
@@ -32,344 +620,642 @@ def add_anki_card(
             - words_in_romanian
         cookie (str, optional): Authentication cookie. If None, uses the default cookie.
         verbose (bool, optional): If True, prints detailed information about the request.
+        priority (str, optional): Scheduler lane, "interactive" or "bulk"
+        tenant (str, optional): Client the card belongs to, for fair queuing
 
     Returns:
         dict: A dictionary containing:
             - success (bool): Whether the request was successful
-            - status_code (int): HTTP status code
+            - status_code (int): HTTP status code (202 if the card was spooled)
             - message (str): Success or error message
             - response (Response): The full response object
+            - note_id (int): Id of the added note, if the upstream returned one
+            - spooled (bool): Present and True if the card was written to the
+              offline spool instead of being sent
     """
-    logger.info(f"Starting to add card {front_text}/{back_text} to deck: {deck_name}")
+    if _backend.name != AnkiWebBackend.name:
+        return _backend.add_notes([(front_text, back_text, deck_name)], cookie, priority, tenant)[0]
 
-    # clean front and back text
-    front_text = front_text.replace("„", "").replace("”", "")
-    back_text = back_text.replace("„", "").replace("”", "")
+    card_logger.info(
+        "Starting to add card %s/%s to deck: %s",
+        front_text,
+        back_text,
+        deck_name,
+        extra={"deck": deck_name},
+    )
 
-    # replace romanian diacritics with their base characters
-    front_text = front_text.replace("ă", "a").replace("ş", "s").replace("ţ", "t").replace("î", "i").replace("â", "a")
-    back_text = back_text.replace("ă", "a").replace("ş", "s").replace("ţ", "t").replace("î", "i").replace("â", "a")
+    front_text = normalize_card_text(front_text)
+    back_text = normalize_card_text(back_text)
 
     try:
-        # Create the length indicators for front and back text
-        if len(front_text) < 128:
-            front_len_bytes = bytes([len(front_text)])
-        else:
-            # For longer text, encode as two bytes
-            front_len_bytes = bytes(
-                [128 + (len(front_text) % 128), len(front_text) // 128]
-            )
+        payload = encode_card_payload(front_text, back_text, deck_name, verbose)
+
+        if verbose:
+            print(f"Adding card to deck '{deck_name}':")
+            print(f"  Front: {front_text}")
+            print(f"  Back: {back_text}")
+            print(f"  Payload length: {len(payload)} bytes")
+
+        if _spool_mode == "always":
+            _spool.append(payload)
+            return _spooled_result(deck_name)
+
+        # Send the request
+        try:
+            response = dispatch_payload(payload, cookie, priority, tenant, deck_name)
+        except requests.RequestException as e:
+            return _delivery_result(payload, deck_name, error=e)
+        result = _delivery_result(payload, deck_name, response)
+
+        if verbose:
+            print(f"  Status Code: {response.status_code}")
+            print(f"  Response: {response.text}")
+
+        return result
+
+    except Exception as e:
+        # Handle any exceptions
+        result = _error_result(e)
+        if verbose:
+            print(result["message"])
+        return result
+
+
+def update_anki_card(
+    note_id, front_text, back_text, cookie=None, priority="interactive", tenant=None
+):
+    """
+    Replace the text of a note that was added earlier
+
+    Args:
+        note_id (int): Id of the note, as returned in add_anki_card's result
+        front_text (str): New text for the front of the card
+        back_text (str): New text for the back of the card
+        cookie (str, optional): Authentication cookie. If None, uses the default cookie.
+        priority (str, optional): Scheduler lane, "interactive" or "bulk"
+        tenant (str, optional): Client the card belongs to, for fair queuing
+
+    Returns:
+        dict: Shaped like add_anki_card's result
+    """
+    card_logger.info("Starting to update note %s: %s/%s", note_id, front_text, back_text)
+    return _backend.update_note(
+        note_id, normalize_card_text(front_text), normalize_card_text(back_text),
+        cookie, priority, tenant,
+    )
+
 
-        if len(back_text) < 128:
-            back_len_bytes = bytes([len(back_text)])
+def _ankiweb_update_note(note_id, front_text, back_text, cookie=None, priority="interactive", tenant=None):
+    """Send an update payload to AnkiWeb; see update_anki_card."""
+    try:
+        payload = encode_update_payload(note_id, front_text, back_text)
+        if _spool_mode == "always":
+            _spool.append(payload)
+            result = _spooled_result("")
         else:
-            # For longer text, encode as two bytes
-            back_len_bytes = bytes(
-                [128 + (len(back_text) % 128), len(back_text) // 128]
-            )
+            try:
+                response = dispatch_payload(payload, cookie, priority, tenant)
+            except requests.RequestException as e:
+                result = _delivery_result(payload, "", error=e)
+            else:
+                result = _delivery_result(payload, "", response)
+    except Exception as e:
+        return _error_result(e)
+
+    if result.get("spooled"):
+        result["message"] = f"Update of note {note_id} queued for delivery"
+    elif result["success"]:
+        result["message"] = f"Note {note_id} successfully updated"
+        result["note_id"] = result["note_id"] or note_id
+    elif result["status_code"] is not None:
+        result["message"] = f"Failed to update note {note_id}. Status code: {result['status_code']}"
+    return result
+
+
+def _ankiweb_add_batch(cards, cookie=None, priority="bulk", tenant=None, on_result=None, delay=0.0):
+    """
+    Send a batch of cards to AnkiWeb; see add_card_batch
+
+    All cards are normalized and encoded first, looking up each deck's suffix
+    once for all its cards, and then handed to the scheduler, so they are
+    sent concurrently under the shared upstream rate budget. Without a
+    scheduler they are sent one by one.
+    """
+    results = [None] * len(cards)
 
-        # First part of the payload with length indicators is the same for all decks
-        text_part = (
-            bytes([10])
-            + front_len_bytes
-            + front_text.encode("utf-8")
-            + bytes([10])
-            + back_len_bytes
-            + back_text.encode("utf-8")
+    def finish(i, result):
+        results[i] = result
+        if on_result is not None:
+            on_result(i, result)
+
+    pending = []
+    suffixes = {}
+    for i, card in enumerate(cards):
+        front_text, back_text, deck_name = card[0], card[1], card[2]
+        card_logger.info(
+            "Starting to add card %s/%s to deck: %s",
+            front_text,
+            back_text,
+            deck_name,
+            extra={"deck": deck_name},
         )
+        try:
+            key = deck_name.lower()
+            suffix = suffixes.get(key)
+            if suffix is None:
+                # Unknown decks use the default deck format, as in encode_card_payload
+                suffix = suffixes[key] = get_deck_suffix(key) or DECK_SUFFIXES["default"]
+            payload = _encode_text_part(
+                normalize_card_text(front_text), normalize_card_text(back_text)
+            ) + suffix
+        except Exception as e:
+            finish(i, _error_result(e))
+            continue
+        pending.append((i, payload, deck_name, card[3] if len(card) > 3 else tenant))
 
-        # Binary suffix based on the PowerShell commands for different decks
-        if deck_name.lower() == "default":
-            binary_suffix = bytes([26, 9, 8, 177, 246, 164, 207, 197, ord("2"), 16, 1])
-        elif deck_name.lower() == "test":
-            binary_suffix = bytes(
-                [
-                    26,
-                    14,
-                    8,
-                    177,
-                    246,
-                    164,
-                    207,
-                    197,
-                    ord("2"),
-                    16,
-                    200,
-                    136,
-                    203,
-                    146,
-                    205,
-                    ord("2"),
-                ]
-            )
-        elif deck_name.lower() == "life_tricks":
-            binary_suffix = bytes(
-                [
-                    26,
-                    14,
-                    8,
-                    177,
-                    246,
-                    164,
-                    207,
-                    197,
-                    ord("2"),
-                    16,
-                    178,
-                    197,
-                    246,
-                    250,
-                    215,
-                    ord("2"),
-                ]
-            )
-        elif deck_name.lower() == "AI":
-            binary_suffix = bytes(
-                [
-                    26,
-                    14,
-                    8,
-                    177,
-                    246,
-                    164,
-                    207,
-                    197,
-                    ord("2"),
-                    16,
-                    162,
-                    192,
-                    203,
-                    248,
-                    209,
-                    ord("2"),
-                ]
-            )
-        elif deck_name.lower() == "general_facts":
-            binary_suffix = bytes(
-                [
-                    26,
-                    14,
-                    8,
-                    177,
-                    246,
-                    164,
-                    207,
-                    197,
-                    ord("2"),
-                    16,
-                    219,
-                    129,
-                    138,
-                    146,
-                    210,
-                    ord("2"),
-                ]
-            )
-        elif deck_name.lower() == "software_engineering":
-            binary_suffix = bytes(
-                [
-                    26,
-                    14,
-                    8,
-                    177,
-                    246,
-                    164,
-                    207,
-                    197,
-                    ord("2"),
-                    16,
-                    255,
-                    146,
-                    136,
-                    170,
-                    198,
-                    ord("2"),
-                ]
-            )
-        elif deck_name.lower() == "universe":
-            binary_suffix = bytes(
-                [
-                    26,
-                    14,
-                    8,
-                    177,
-                    246,
-                    164,
-                    207,
-                    197,
-                    ord("2"),
-                    16,
-                    249,
-                    130,
-                    170,
-                    138,
-                    198,
-                    ord("2"),
-                ]
-            )
-        elif deck_name.lower() == "words_in_english":
-            binary_suffix = bytes(
-                [
-                    26,
-                    14,
-                    8,
-                    177,
-                    246,
-                    164,
-                    207,
-                    197,
-                    ord("2"),
-                    16,
-                    223,
-                    204,
-                    141,
-                    170,
-                    198,
-                    ord("2"),
-                ]
-            )
-        elif deck_name.lower() == "words_in_romanian":
-            binary_suffix = bytes(
-                [
-                    26,
-                    14,
-                    8,
-                    177,
-                    246,
-                    164,
-                    207,
-                    197,
-                    ord("2"),
-                    16,
-                    198,
-                    151,
-                    176,
-                    130,
-                    201,
-                    ord("2"),
-                ]
-            )
-        else:
-            # Use default deck format for unknown decks
-            if verbose:
-                print(
-                    f"Warning: Unknown deck '{deck_name}'. Using default deck format."
-                )
-            binary_suffix = bytes([26, 9, 8, 177, 246, 164, 207, 197, ord("2"), 16, 1])
+    _deliver_batch(pending, cookie, priority, finish, delay)
+    return results
 
-        # Construct the full payload
-        payload = text_part + binary_suffix
 
-        # Define the AnkiWeb API URL
-        url = "https://ankiuser.net/svc/editor/add-or-update"
+def _deliver_batch(pending, cookie, priority, finish, delay=0.0):
+    """
+    Send encoded payloads concurrently through the scheduler, or one by one
+
+    Args:
+        pending (list): (index, payload, deck_name, tenant) tuples
+        cookie (str, optional): Authentication cookie
+        priority (str): Scheduler lane
+        finish (callable): Called as finish(index, result) for each payload
+        delay (float): Seconds between handing successive payloads over
+    """
+    if _spool_mode == "always":
+        for i, payload, deck_name, _ in pending:
+            _spool.append(payload)
+            finish(i, _spooled_result(deck_name))
+        return
+
+    if _scheduler is not None:
+        outstanding = {}
 
-        # Default cookie if none provided
-        if cookie is None:
-            cookie = (
-                "has_auth=1; ankiweb=eyJvcCI6ImNrIiwiaWF0IjoxNzM2Nzk4ODI1LCJqdiI6MCwiayI6"
-                "InZidTxTQ1EqOVFHb34uaTwiLCJjIjoyLCJ0IjoxNzM2Nzk4ODI1fQ.mwUZf4Fym4BWUbMTQFlAeHa-3bq9fOIdxsNl2W1bcEs"
+        def collect(timeout):
+            # Report results in completion order; callers wanting request order use the list
+            done, _ = wait(outstanding, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                i, payload, deck_name = outstanding.pop(future)
+                error = future.exception()
+                finish(i, _delivery_result(payload, deck_name, None if error else future.result(), error))
+
+        next_at = time.monotonic()
+        for i, payload, deck_name, card_tenant in pending:
+            # Results keep arriving while the next submission waits for its turn
+            while delay > 0 and time.monotonic() < next_at:
+                if outstanding:
+                    collect(next_at - time.monotonic())
+                else:
+                    time.sleep(max(0.0, next_at - time.monotonic()))
+            next_at = time.monotonic() + delay
+            outstanding[_scheduler.submit(payload, cookie, priority, card_tenant, deck_name)] = (
+                i, payload, deck_name,
             )
+        while outstanding:
+            collect(None)
+    else:
+        for n, (i, payload, deck_name, _) in enumerate(pending):
+            if n and delay > 0:
+                time.sleep(delay)
+            try:
+                finish(i, _delivery_result(payload, deck_name, send_payload(payload, cookie)))
+            except Exception as e:
+                finish(i, _delivery_result(payload, deck_name, error=e))
 
-        # Headers
-        headers = {
-            "Content-Type": "application/octet-stream",
-            "Cookie": cookie,
-            "User-Agent": (
-                "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
-                "(KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36"
-            ),
-            "Origin": "https://ankiuser.net",
-            "Referer": "https://ankiuser.net/add",
-        }
 
-        if verbose:
-            print(f"Adding card to deck '{deck_name}':")
-            print(f"  Front: {front_text}")
-            print(f"  Back: {back_text}")
-            print(f"  Payload length: {len(payload)} bytes")
+def add_raw_payloads(payloads, cookie=None, priority="bulk", tenant=None, on_result=None):
+    """
+    Send payloads that were encoded by the caller to AnkiWeb as they are
 
-        # Send the request
-        response = requests.post(url, headers=headers, data=payload)
+    The payloads skip normalization and encoding; validate them first with
+    split_delimited_payloads and payload_deck. Only the AnkiWeb backend
+    accepts raw payloads.
+
+    Args:
+        payloads (list): (payload, deck_name) tuples; payloads may be memoryviews
+        cookie (str, optional): Authentication cookie
+        priority (str, optional): Scheduler lane, "interactive" or "bulk"
+        tenant (str, optional): Client the payloads belong to, for fair queuing
+        on_result (callable, optional): Called as on_result(index, result) as
+            soon as each payload's result is known, possibly from a worker thread
+
+    Returns:
+        list: One result per payload, in order, shaped like add_anki_card's
+
+    Raises:
+        ValueError: If the backend is not AnkiWeb
+    """
+    if _backend.name != AnkiWebBackend.name:
+        raise ValueError(f"The {_backend.name} backend does not accept raw payloads")
+    results = [None] * len(payloads)
+
+    def finish(i, result):
+        results[i] = result
+        if on_result is not None:
+            on_result(i, result)
+
+    # The HTTP client and the spool need bytes, so this is the one copy made
+    pending = [
+        (i, bytes(payload), deck_name, tenant) for i, (payload, deck_name) in enumerate(payloads)
+    ]
+    _deliver_batch(pending, cookie, priority, finish)
+    return results
+
+
+class AnkiWebBackend:
+    """
+    Backend posting notes to the AnkiWeb editor endpoint, one request per note.
+    """
+
+    name = "ankiweb"
+
+    def add_notes(self, cards, cookie=None, priority="bulk", tenant=None, on_result=None, delay=0.0):
+        """
+        Add notes
+
+        Args:
+            cards (list): (front, back, deck_name) tuples, optionally with a
+                fourth tenant element
+            cookie (str, optional): Authentication cookie
+            priority (str, optional): Scheduler lane, "interactive" or "bulk"
+            tenant (str, optional): Client the cards belong to, for fair queuing
+            on_result (callable, optional): Called as on_result(index, result)
+                as soon as each card's result is known, from a worker thread
+            delay (float, optional): Seconds between sending successive notes
+
+        Returns:
+            list: One result per card, in order, shaped like add_anki_card's
+        """
+        return _ankiweb_add_batch(cards, cookie, priority, tenant, on_result, delay)
+
+    def update_note(self, note_id, front_text, back_text, cookie=None, priority="interactive", tenant=None):
+        """
+        Replace the fields of a note with normalized text
+
+        Returns:
+            dict: Shaped like add_anki_card's result
+        """
+        return _ankiweb_update_note(note_id, front_text, back_text, cookie, priority, tenant)
+
+    def probe(self, cookie=None):
+        """
+        Check that AnkiWeb is reachable and accepts the cookie, without adding anything
 
-        # Check if the request was successful
+        Args:
+            cookie (str, optional): Authentication cookie. If None, uses the default cookie.
+
+        Returns:
+            dict: "status_code" of PROBE_URL and "credentials_valid": True if
+                the page loaded, False if AnkiWeb asked for a login, None if
+                it could not tell (e.g. a server error)
+
+        Raises:
+            requests.RequestException: If AnkiWeb could not be reached
+        """
+        headers = dict(UPSTREAM_HEADERS)
+        headers["Cookie"] = cookie if cookie is not None else DEFAULT_COOKIE
+        response = _get_session().get(PROBE_URL, headers=headers, allow_redirects=False, timeout=10)
+        credentials_valid = None
         if response.status_code == 200:
-            result = {
-                "success": True,
-                "status_code": response.status_code,
-                "message": f"Card successfully added to deck '{deck_name}'",
-                "response": response,
-            }
-        else:
-            result = {
+            credentials_valid = True
+        elif response.status_code in (301, 302, 303, 307, 401, 403):
+            # A logged out session is redirected to the login page
+            credentials_valid = False
+        return {"status_code": response.status_code, "credentials_valid": credentials_valid}
+
+
+class AnkiConnectBackend:
+    """
+    Backend talking to a local Anki desktop through the AnkiConnect add-on.
+
+    Notes are checked with canAddNotesWithErrorDetail and the addable ones
+    sent with the batched addNotes action, up to batch_size notes per call.
+    Deck names are resolved through the deck registry: registered
+    decks map to their desktop deck (see deck_titles) and unknown decks fall
+    back to the default deck, as with AnkiWeb.
+    """
+
+    name = "ankiconnect"
+
+    def __init__(
+        self,
+        url="http://127.0.0.1:8765",
+        deck_titles=None,
+        model_name="Basic",
+        api_key=None,
+        batch_size=1000,
+        allow_duplicates=False,
+        timeout=60,
+    ):
+        """
+        Args:
+            url (str): AnkiConnect URL
+            deck_titles (dict, optional): Registry deck name to desktop deck
+                name; defaults to "Default" for "default" and the registry
+                name for other decks
+            model_name (str): Note type with Front and Back fields
+            api_key (str, optional): AnkiConnect API key, if one is configured
+            batch_size (int): Maximum notes per addNotes call
+            allow_duplicates (bool): Let Anki add notes with a duplicate first field
+            timeout (float): Request timeout in seconds
+        """
+        self.url = url
+        self.deck_titles = {"default": "Default"}
+        self.deck_titles.update({k.lower(): v for k, v in (deck_titles or {}).items()})
+        self.model_name = model_name
+        self.api_key = api_key
+        self.batch_size = batch_size
+        self.allow_duplicates = allow_duplicates
+        self.timeout = timeout
+
+    def deck_title(self, deck_name):
+        """Map a deck name to the name of the deck in Anki desktop."""
+        deck_name = deck_name.lower()
+        if get_deck_suffix(deck_name) is None:
+            deck_name = "default"
+        return self.deck_titles.get(deck_name, deck_name)
+
+    def invoke(self, action, **params):
+        """
+        Call an AnkiConnect action
+
+        Returns:
+            dict: The decoded {"result", "error"} response
+        """
+        request = {"action": action, "version": 6, "params": params}
+        if self.api_key:
+            request["key"] = self.api_key
+        response = _get_session().post(self.url, json=request, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def probe(self, cookie=None):
+        """
+        Check that AnkiConnect is reachable and accepts the API key; see AnkiWebBackend.probe
+        """
+        reply = self.invoke("version")
+        return {"status_code": 200, "credentials_valid": not reply.get("error")}
+
+    def add_notes(self, cards, cookie=None, priority="bulk", tenant=None, on_result=None, delay=0.0):
+        """
+        Add notes; see AnkiWebBackend.add_notes
+
+        The cookie, priority, tenant and delay arguments are not used.
+        """
+        results = []
+        for start in range(0, len(cards), self.batch_size):
+            chunk_results = self._add_chunk(cards[start:start + self.batch_size])
+            if on_result is not None:
+                for offset, result in enumerate(chunk_results):
+                    on_result(start + offset, result)
+            results.extend(chunk_results)
+        return results
+
+    def update_note(self, note_id, front_text, back_text, cookie=None, priority="interactive", tenant=None):
+        """
+        Replace the fields of a note; see AnkiWebBackend.update_note
+
+        The cookie, priority and tenant arguments are not used.
+        """
+        try:
+            reply = self.invoke(
+                "updateNoteFields",
+                note={"id": note_id, "fields": {"Front": front_text, "Back": back_text}},
+            )
+        except Exception as e:
+            return _error_result(e)
+        if reply.get("error"):
+            return {
                 "success": False,
-                "status_code": response.status_code,
-                "message": f"Failed to add card. Status code: {response.status_code}",
-                "response": response,
+                "status_code": 400,
+                "message": f"Failed to update note {note_id}: {reply['error']}",
+                "response": None,
             }
+        return {
+            "success": True,
+            "status_code": 200,
+            "message": f"Note {note_id} successfully updated",
+            "response": None,
+            "note_id": note_id,
+        }
 
-        if verbose:
-            print(f"  Status Code: {response.status_code}")
-            print(f"  Response: {response.text}")
+    def _add_chunk(self, cards):
+        notes = []
+        for card in cards:
+            front_text, back_text, deck_name = card[0], card[1], card[2]
+            card_logger.info(
+                "Starting to add card %s/%s to deck: %s",
+                front_text,
+                back_text,
+                deck_name,
+                extra={"deck": deck_name},
+            )
+            notes.append(
+                {
+                    "deckName": self.deck_title(deck_name),
+                    "modelName": self.model_name,
+                    "fields": {
+                        "Front": normalize_card_text(front_text),
+                        "Back": normalize_card_text(back_text),
+                    },
+                    "options": {"allowDuplicate": self.allow_duplicates},
+                    "tags": [],
+                }
+            )
 
-        return result
+        try:
+            checks = self.invoke("canAddNotesWithErrorDetail", notes=notes)
+        except Exception as e:
+            return [_error_result(e) for _ in cards]
+        if checks.get("error") or not isinstance(checks.get("result"), list):
+            # AnkiConnect too old to check notes: add them one by one, so
+            # each card still gets its own outcome
+            return [self._add_one(card, note) for card, note in zip(cards, notes)]
 
-    except Exception as e:
-        # Handle any exceptions
-        error_message = f"Error adding card: {str(e)}"
-        if verbose:
-            print(error_message)
+        results = [None] * len(cards)
+        addable = []
+        for i, check in enumerate(checks["result"]):
+            if check.get("canAdd"):
+                addable.append(i)
+            else:
+                results[i] = self._rejected(check.get("error") or "rejected by Anki")
+        if not addable:
+            return results
+
+        try:
+            reply = self.invoke("addNotes", notes=[notes[i] for i in addable])
+        except Exception as e:
+            for i in addable:
+                results[i] = _error_result(e)
+            return results
+
+        note_ids = reply.get("result")
+        if isinstance(note_ids, list):
+            for i, note_id in zip(addable, note_ids):
+                results[i] = self._added(cards[i], note_id) if note_id else self._rejected(
+                    reply.get("error") or "rejected by Anki"
+                )
+            return results
+
+        # addNotes fails as a whole when any note fails (e.g. the collection
+        # changed since the check), but the other notes are still added.
+        # Adding the notes one by one settles each outcome: with duplicates
+        # refused, a note that passed the check and is now a duplicate was
+        # added by that call.
+        for i in addable:
+            if self.allow_duplicates:
+                results[i] = {
+                    "success": False,
+                    "status_code": 502,
+                    "message": f"Outcome unknown, AnkiConnect reported: {reply.get('error')}",
+                    "response": None,
+                }
+            else:
+                results[i] = self._add_one(cards[i], notes[i], added_if_duplicate=True)
+        return results
 
+    def _add_one(self, card, note, added_if_duplicate=False):
+        """Add a single note with addNote and build its result."""
+        try:
+            reply = self.invoke("addNote", note=note)
+        except Exception as e:
+            return _error_result(e)
+        if reply.get("result"):
+            return self._added(card, reply["result"])
+        error = reply.get("error") or "rejected by Anki"
+        if added_if_duplicate and "duplicate" in error.lower():
+            return self._added(card, None)
+        return self._rejected(error)
+
+    @staticmethod
+    def _added(card, note_id):
+        return {
+            "success": True,
+            "status_code": 200,
+            "message": f"Card successfully added to deck '{card[2]}'",
+            "response": None,
+            "note_id": note_id,
+        }
+
+    @staticmethod
+    def _rejected(error):
         return {
             "success": False,
-            "status_code": None,
-            "message": error_message,
+            "status_code": 400,
+            "message": f"Failed to add card: {error}",
             "response": None,
         }
 
 
+# Backend used by add_anki_card, add_card_batch and add_multiple_cards
+_backend = AnkiWebBackend()
+
+
+def set_backend(backend):
+    """
+    Choose where cards are sent
+
+    Args:
+        backend: An AnkiWebBackend (the default) or AnkiConnectBackend
+    """
+    global _backend
+    _backend = backend
+
+
+def get_backend():
+    """Get the backend cards are sent to."""
+    return _backend
+
+
+def add_card_batch(cards, cookie=None, priority="bulk", tenant=None, on_result=None, delay=0.0):
+    """
+    Add a batch of cards, possibly to different decks, in one pass
+
+    Args:
+        cards (list): (front, back, deck_name) tuples, optionally with a
+            fourth tenant element overriding the tenant argument
+        cookie (str, optional): Authentication cookie
+        priority (str, optional): Scheduler lane, "interactive" or "bulk"
+        tenant (str, optional): Client the cards belong to, for fair queuing
+        on_result (callable, optional): Called as on_result(index, result) as
+            soon as each card's result is known, possibly from a worker thread
+        delay (float, optional): Seconds between sending successive cards;
+            ignored by backends that send notes in batches
+
+    Returns:
+        list: One result per card, in order, shaped like add_anki_card's
+    """
+    return _backend.add_notes(cards, cookie, priority, tenant, on_result, delay)
+
+
 def add_multiple_cards(
-    cards, deck_name="default", cookie=None, delay=1.0, verbose=False
+    cards, deck_name="default", cookie=None, delay=1.0, verbose=False, tenant=None, on_result=None
 ):
     """
     Add multiple cards to Anki
 
+    Cards are sent in the scheduler's "bulk" lane so that they do not hold up
+    interactive requests. Unless verbose, the cards are sent as one batch
+    through add_card_batch, which encodes cards for all decks in one pass and
+    sends them under one rate budget, spaced by the delay.
+
     Args:
-        cards (list): List of (front, back) tuples
-        deck_name (str): Name of the deck to add the cards to
+        cards (list): List of (front, back) tuples, or (front, back, deck_name)
+            tuples for cards going to different decks
+        deck_name (str): Deck for cards without their own deck name
         cookie (str, optional): Authentication cookie
         delay (float, optional): Delay in seconds between requests to avoid rate limiting
         verbose (bool, optional): If True, prints detailed information
+        tenant (str, optional): Client the cards belong to, for fair queuing
+        on_result (callable, optional): Called as on_result(index, result) as
+            soon as each card's result is known, e.g. to stream progress
 
     Returns:
         dict: A dictionary containing:
             - total (int): Total number of cards
             - success (int): Number of successfully added cards
             - failed (int): Number of failed cards
+            - by_deck (dict): Counts per deck, see count_by_deck
             - results (list): List of individual results
     """
-    results = []
-    success_count = 0
-
-    for i, (front, back) in enumerate(cards):
-        if verbose:
-            print(f"\nAdding card {i+1}/{len(cards)}:")
-
-        result = add_anki_card(front, back, deck_name, cookie, verbose)
-        results.append(result)
+    cards = [
+        (card[0], card[1], card[2] if len(card) > 2 and card[2] else deck_name)
+        for card in cards
+    ]
+    if not verbose:
+        results = add_card_batch(cards, cookie, "bulk", tenant, on_result, delay)
+    else:
+        results = []
+        for i, (front, back, card_deck) in enumerate(cards):
+            if verbose:
+                print(f"\nAdding card {i+1}/{len(cards)}:")
 
-        if result["success"]:
-            success_count += 1
+            results.append(
+                add_anki_card(
+                    front, back, card_deck, cookie, verbose, priority="bulk", tenant=tenant
+                )
+            )
+            if on_result is not None:
+                on_result(i, results[-1])
 
-        # Add delay between requests to avoid rate limiting
-        if i < len(cards) - 1 and delay > 0:
-            if verbose:
-                print(f"Waiting {delay} seconds before next request...")
-            time.sleep(delay)
+            # Add delay between requests to avoid rate limiting
+            if i < len(cards) - 1 and delay > 0:
+                if verbose:
+                    print(f"Waiting {delay} seconds before next request...")
+                time.sleep(delay)
 
+    success_count = sum(1 for result in results if result["success"])
     summary = {
         "total": len(cards),
         "success": success_count,
         "failed": len(cards) - success_count,
+        "by_deck": count_by_deck(cards, results),
         "results": results,
     }
 
@@ -382,6 +1268,30 @@ def add_multiple_cards(
     return summary
 
 
+def count_by_deck(cards, results):
+    """
+    Count added and failed cards per deck
+
+    Args:
+        cards (list): (front, back, deck_name) tuples
+        results (list): One result per card, with a "success" key
+
+    Returns:
+        dict: Lower-case deck name to {"total", "success", "failed"}
+    """
+    counts = {}
+    for card, result in zip(cards, results):
+        deck = counts.get(card[2].lower())
+        if deck is None:
+            deck = counts[card[2].lower()] = {"total": 0, "success": 0, "failed": 0}
+        deck["total"] += 1
+        if result["success"]:
+            deck["success"] += 1
+        else:
+            deck["failed"] += 1
+    return counts
+
+
 def register_deck_format(deck_name, binary_suffix):
     """
     Register a new deck format for use with add_anki_card
@@ -393,15 +1303,19 @@ def register_deck_format(deck_name, binary_suffix):
     Returns:
         bool: True if registration was successful
     """
-    # This function would modify a global dictionary of deck formats
-    # For now, we'll just print a message
-    print(f"To add support for deck '{deck_name}', modify the add_anki_card function")
-    print(f"Add an elif block for deck_name.lower() == '{deck_name.lower()}'")
-    print(f"with binary_suffix = {binary_suffix}")
+    registry = dict(DECK_SUFFIXES)
+    registry[deck_name.lower()] = bytes(binary_suffix)
+    set_deck_registry(registry)
     return True
 
+
 # Example usage
 if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+
     # Example 1: Add a single card
     result = add_anki_card(
         front_text="Example vocabulary",
@@ -0,0 +1,234 @@
+"""
+Async Python client for the Anki API.
+
+Individual add_card() calls made within a short window are coalesced into a
+single /add-multiple-cards request, even across decks, and each caller gets
+the result for its own card:
+
+    async with AnkiClient("http://localhost:8000") as client:
+        results = await asyncio.gather(
+            *(client.add_card(front, back, "words_in_english") for front, back in pairs)
+        )
+
+Requests share a pooled HTTP connection and are retried with exponential
+backoff when the connection could not be made or the service answered 429 or
+503 (both mean the cards were not processed, so retrying cannot duplicate them).
+"""
+
+import asyncio
+import random
+
+import httpx
+
+RETRY_STATUS_CODES = (429, 503)
+
+
+class AnkiClientError(Exception):
+    """Raised when a request to the Anki API fails."""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class AnkiClient:
+    """
+    Async client with connection pooling, retries and client-side batching.
+    """
+
+    def __init__(
+        self,
+        base_url="http://localhost:8000",
+        max_batch_size=100,
+        max_linger=0.05,
+        delay=0.0,
+        max_retries=3,
+        backoff=0.5,
+        max_backoff=10.0,
+        timeout=120.0,
+        max_connections=10,
+        client_id=None,
+        headers=None,
+    ):
+        """
+        Args:
+            base_url (str): Base URL of the Anki API
+            max_batch_size (int): Maximum cards per coalesced bulk request
+            max_linger (float): Seconds add_card() waits for more cards before
+                sending a partial batch
+            delay (float): delay field sent with bulk requests
+            max_retries (int): Retries per request after the first attempt
+            backoff (float): Initial retry backoff in seconds
+            max_backoff (float): Upper bound of the retry backoff
+            timeout (float): Per-request timeout in seconds
+            max_connections (int): Size of the connection pool
+            client_id (str, optional): Sent as X-Client-Id for fair scheduling
+            headers (dict, optional): Extra headers sent with every request
+        """
+        self.max_batch_size = max_batch_size
+        self.max_linger = max_linger
+        self.delay = delay
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        default_headers = dict(headers or {})
+        if client_id:
+            default_headers["X-Client-Id"] = client_id
+        self._http = httpx.AsyncClient(
+            base_url=base_url,
+            headers=default_headers,
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=max_connections, max_keepalive_connections=max_connections
+            ),
+        )
+        # Pending cards and the linger timer of the batch they will go in
+        self._pending = []
+        self._timer = None
+        self._in_flight = set()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+    async def aclose(self):
+        """Send any pending cards, wait for in-flight batches and close the pool."""
+        await self.flush()
+        await self._http.aclose()
+
+    async def request(self, method, path, **kwargs):
+        """
+        Send a request, retrying connection failures and 429/503 responses
+
+        Returns:
+            dict: The decoded JSON response
+
+        Raises:
+            AnkiClientError: If the request failed after all retries
+        """
+        backoff = self.backoff
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            try:
+                response = await self._http.request(method, path, **kwargs)
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                if last_attempt:
+                    raise AnkiClientError(f"Could not connect: {e}") from e
+                wait = backoff
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or last_attempt:
+                    if response.status_code >= 400:
+                        raise AnkiClientError(
+                            f"{method} {path} failed with status {response.status_code}: "
+                            f"{response.text}",
+                            response.status_code,
+                        )
+                    return response.json()
+                wait = _retry_after(response) or backoff
+
+            await asyncio.sleep(wait * random.uniform(0.8, 1.2))
+            backoff = min(backoff * 2, self.max_backoff)
+
+    async def health(self):
+        """Get the service health."""
+        return await self.request("GET", "/health")
+
+    async def decks(self):
+        """Get the list of available decks."""
+        return (await self.request("GET", "/decks"))["decks"]
+
+    async def add_cards(self, cards, deck_name="default", delay=None):
+        """
+        Add several cards in one bulk request
+
+        Args:
+            cards (list): (front, back) tuples, or (front, back, deck_name)
+                tuples for cards going to different decks
+            deck_name (str): Deck for cards without their own deck name
+            delay (float, optional): delay field of the request; defaults to the client's
+
+        Returns:
+            dict: The API response
+        """
+        body = {
+            "cards": [
+                {"front": card[0], "back": card[1], "deck_name": card[2]}
+                if len(card) > 2
+                else {"front": card[0], "back": card[1]}
+                for card in cards
+            ],
+            "deck_name": deck_name,
+            "delay": self.delay if delay is None else delay,
+        }
+        return await self.request("POST", "/add-multiple-cards", json=body)
+
+    async def add_card(self, front, back, deck_name="default"):
+        """
+        Add one card; calls made close together are sent as one bulk request
+
+        Args:
+            front (str): Text for the front of the card
+            back (str): Text for the back of the card
+            deck_name (str): Deck to add the card to
+
+        Returns:
+            dict: This card's result with success, status_code and message
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((front, back, deck_name, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._send_pending()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(
+                self.max_linger, self._send_pending
+            )
+        return await future
+
+    async def flush(self):
+        """Send all pending cards now and wait for every in-flight batch."""
+        self._send_pending()
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+
+    def _send_pending(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        task = asyncio.ensure_future(self._send_batch(batch))
+        self._in_flight.add(task)
+        task.add_done_callback(self._in_flight.discard)
+
+    async def _send_batch(self, batch):
+        try:
+            response = await self.add_cards(
+                [(front, back, deck_name) for front, back, deck_name, _ in batch]
+            )
+            results = response["data"]["results"]
+            if len(results) != len(batch):
+                raise AnkiClientError(
+                    f"Expected {len(batch)} results, got {len(results)}"
+                )
+        except Exception as e:
+            for *_, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (*_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+def _retry_after(response):
+    """Parse a Retry-After header given in seconds."""
+    try:
+        return float(response.headers.get("retry-after", ""))
+    except ValueError:
+        return None
@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""
+Offline .apkg package builder for large imports.
+
+Writes cards straight into an Anki collection (SQLite, schema 11) and packs it
+as a .apkg file that Anki desktop can import, instead of sending every note to
+AnkiWeb. Rows are inserted in chunks inside a single transaction, so memory use
+does not grow with the number of cards.
+
+Note GUIDs are derived from the deck and card text, so importing the same card
+twice updates the existing note instead of adding a duplicate.
+
+Usage:
+    python -m scripts.apkg_builder cards.csv cards.apkg --deck default
+The CSV has front,back[,deck_name] columns.
+"""
+
+import argparse
+import csv
+import hashlib
+import itertools
+import json
+import os
+import sqlite3
+import tempfile
+import time
+import zipfile
+
+from scripts.anki_api_v2 import get_deck_suffix, normalize_card_text
+
+FIELD_SEPARATOR = "\x1f"
+
+_SCHEMA = """
+CREATE TABLE col (
+    id integer primary key, crt integer not null, mod integer not null,
+    scm integer not null, ver integer not null, dty integer not null,
+    usn integer not null, ls integer not null, conf text not null,
+    models text not null, decks text not null, dconf text not null,
+    tags text not null
+);
+CREATE TABLE notes (
+    id integer primary key, guid text not null, mid integer not null,
+    mod integer not null, usn integer not null, tags text not null,
+    flds text not null, sfld integer not null, csum integer not null,
+    flags integer not null, data text not null
+);
+CREATE TABLE cards (
+    id integer primary key, nid integer not null, did integer not null,
+    ord integer not null, mod integer not null, usn integer not null,
+    type integer not null, queue integer not null, due integer not null,
+    ivl integer not null, factor integer not null, reps integer not null,
+    lapses integer not null, left integer not null, odue integer not null,
+    odid integer not null, flags integer not null, data text not null
+);
+CREATE TABLE revlog (
+    id integer primary key, cid integer not null, usn integer not null,
+    ease integer not null, ivl integer not null, lastIvl integer not null,
+    factor integer not null, time integer not null, type integer not null
+);
+CREATE TABLE graves (usn integer not null, oid integer not null, type integer not null);
+CREATE INDEX ix_notes_usn on notes (usn);
+CREATE INDEX ix_cards_usn on cards (usn);
+CREATE INDEX ix_revlog_usn on revlog (usn);
+CREATE INDEX ix_cards_nid on cards (nid);
+CREATE INDEX ix_cards_sched on cards (did, queue, due);
+CREATE INDEX ix_revlog_cid on revlog (cid);
+CREATE INDEX ix_notes_csum on notes (csum);
+"""
+
+_DECK_CONFIG = {
+    "id": 1,
+    "name": "Default",
+    "mod": 0,
+    "usn": 0,
+    "maxTaken": 60,
+    "autoplay": True,
+    "timer": 0,
+    "replayq": True,
+    "dyn": False,
+    "new": {
+        "delays": [1, 10],
+        "ints": [1, 4, 7],
+        "initialFactor": 2500,
+        "order": 1,
+        "perDay": 20,
+        "bury": True,
+    },
+    "rev": {
+        "perDay": 200,
+        "ease4": 1.3,
+        "ivlFct": 1,
+        "maxIvl": 36500,
+        "hardFactor": 1.2,
+        "bury": True,
+    },
+    "lapse": {
+        "delays": [10],
+        "mult": 0,
+        "minInt": 1,
+        "leechFails": 8,
+        "leechAction": 1,
+    },
+}
+
+_COLLECTION_CONFIG = {
+    "activeDecks": [1],
+    "curDeck": 1,
+    "newSpread": 0,
+    "collapseTime": 1200,
+    "timeLim": 0,
+    "estTimes": True,
+    "dueCounts": True,
+    "curModel": None,
+    "nextPos": 1,
+    "sortType": "noteFld",
+    "sortBackwards": False,
+    "addToCur": True,
+}
+
+
+def _stable_id(text):
+    """Derive a stable id in the range Anki uses for decks and note types."""
+    return (1 << 30) + int(hashlib.sha1(text.encode("utf-8")).hexdigest()[:7], 16)
+
+
+def _checksum(text):
+    """Anki's first-field checksum: the first 8 hex digits of its SHA1."""
+    return int(hashlib.sha1(text.encode("utf-8")).hexdigest()[:8], 16)
+
+
+def _guid(deck_title, front, back):
+    return hashlib.sha1(
+        FIELD_SEPARATOR.join((deck_title, front, back)).encode("utf-8")
+    ).hexdigest()[:16]
+
+
+def _deck_entry(deck_id, title, now):
+    return {
+        "id": deck_id,
+        "name": title,
+        "mod": now,
+        "usn": -1,
+        "desc": "",
+        "dyn": 0,
+        "conf": 1,
+        "collapsed": False,
+        "newToday": [0, 0],
+        "revToday": [0, 0],
+        "lrnToday": [0, 0],
+        "timeToday": [0, 0],
+        "extendNew": 10,
+        "extendRev": 50,
+    }
+
+
+def _basic_model(model_id, name, now):
+    field = {"sticky": False, "rtl": False, "font": "Arial", "size": 20, "media": []}
+    return {
+        "id": model_id,
+        "name": name,
+        "type": 0,
+        "mod": now,
+        "usn": -1,
+        "sortf": 0,
+        "did": 1,
+        "tmpls": [
+            {
+                "name": "Card 1",
+                "ord": 0,
+                "qfmt": "{{Front}}",
+                "afmt": "{{FrontSide}}\n\n<hr id=answer>\n\n{{Back}}",
+                "did": None,
+                "bqfmt": "",
+                "bafmt": "",
+            }
+        ],
+        "flds": [dict(field, name="Front", ord=0), dict(field, name="Back", ord=1)],
+        "css": ".card {\n font-family: arial;\n font-size: 20px;\n text-align: center;\n"
+        " color: black;\n background-color: white;\n}\n",
+        "latexPre": "\\documentclass[12pt]{article}\n\\special{papersize=3in,5in}\n"
+        "\\usepackage[utf8]{inputenc}\n\\usepackage{amssymb,amsmath}\n"
+        "\\pagestyle{empty}\n\\setlength{\\parindent}{0in}\n\\begin{document}\n",
+        "latexPost": "\\end{document}",
+        "req": [[0, "all", [0]]],
+        "tags": [],
+        "vers": [],
+    }
+
+
+def build_apkg(
+    cards,
+    output_path,
+    default_deck="default",
+    deck_titles=None,
+    model_name="Basic (Anki API)",
+    normalize=True,
+    chunk_size=1000,
+):
+    """
+    Write cards to a ready-to-import .apkg file
+
+    Args:
+        cards (iterable): (front, back) or (front, back, deck_name) tuples;
+            consumed lazily, so a generator keeps memory use constant
+        output_path (str): Path of the .apkg file to write
+        default_deck (str): Deck for cards without a deck name
+        deck_titles (dict, optional): Registry deck name to deck name in Anki;
+            "default" maps to "Default" and other decks keep their name.
+            Unknown decks fall back to the default deck, as with AnkiWeb.
+        model_name (str): Name of the Basic note type created in the package
+        normalize (bool): Apply the same text cleanup as add_anki_card
+        chunk_size (int): Rows inserted per executemany call
+
+    Returns:
+        dict: A dictionary containing:
+            - path (str): The written file
+            - total (int): Number of cards written
+            - decks (dict): Number of cards per deck name in Anki
+    """
+    titles = {"default": "Default"}
+    titles.update({k.lower(): v for k, v in (deck_titles or {}).items()})
+
+    now = int(time.time())
+    base_id = int(time.time() * 1000)
+    model_id = _stable_id("model:" + model_name)
+    decks = {}
+    counts = {}
+
+    directory = os.path.dirname(os.path.abspath(output_path))
+    fd, db_path = tempfile.mkstemp(suffix=".anki2", dir=directory)
+    os.close(fd)
+
+    def deck_for(deck_name):
+        key = deck_name.lower()
+        if get_deck_suffix(key) is None:
+            key = "default"
+        title = titles.get(key, key)
+        if title not in decks:
+            decks[title] = 1 if title == "Default" else _stable_id("deck:" + title)
+        return title, decks[title]
+
+    def rows():
+        for position, card in enumerate(cards):
+            front, back = card[0], card[1]
+            deck_name = card[2] if len(card) > 2 and card[2] else default_deck
+            if normalize:
+                front = normalize_card_text(front)
+                back = normalize_card_text(back)
+            title, deck_id = deck_for(deck_name)
+            counts[title] = counts.get(title, 0) + 1
+            note_id = base_id + position
+            note = (
+                note_id,
+                _guid(title, front, back),
+                model_id,
+                now,
+                -1,
+                "",
+                front + FIELD_SEPARATOR + back,
+                front,
+                _checksum(front),
+                0,
+                "",
+            )
+            card_row = (note_id, note_id, deck_id, 0, now, -1, 0, 0, position, 0, 0, 0, 0, 0, 0, 0, 0, "")
+            yield note, card_row
+
+    try:
+        conn = sqlite3.connect(db_path, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.executescript(_SCHEMA)
+        conn.execute("BEGIN")
+
+        iterator = rows()
+        while True:
+            chunk = list(itertools.islice(iterator, chunk_size))
+            if not chunk:
+                break
+            conn.executemany(
+                "INSERT INTO notes VALUES (?,?,?,?,?,?,?,?,?,?,?)",
+                [note for note, _ in chunk],
+            )
+            conn.executemany(
+                "INSERT INTO cards VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)",
+                [card_row for _, card_row in chunk],
+            )
+
+        decks.setdefault("Default", 1)
+        conf = dict(_COLLECTION_CONFIG, curModel=str(model_id), nextPos=sum(counts.values()) + 1)
+        conn.execute(
+            "INSERT INTO col VALUES (1,?,?,?,11,0,0,0,?,?,?,?,?)",
+            (
+                now,
+                now * 1000,
+                now * 1000,
+                json.dumps(conf),
+                json.dumps({str(model_id): _basic_model(model_id, model_name, now)}),
+                json.dumps(
+                    {str(deck_id): _deck_entry(deck_id, title, now) for title, deck_id in decks.items()}
+                ),
+                json.dumps({"1": _DECK_CONFIG}),
+                "{}",
+            ),
+        )
+        conn.execute("COMMIT")
+        conn.close()
+
+        tmp_output = output_path + ".tmp"
+        with zipfile.ZipFile(tmp_output, "w", zipfile.ZIP_DEFLATED) as package:
+            package.write(db_path, "collection.anki2")
+            package.writestr("media", "{}")
+        os.replace(tmp_output, output_path)
+    finally:
+        if os.path.exists(db_path):
+            os.remove(db_path)
+
+    return {"path": output_path, "total": sum(counts.values()), "decks": counts}
+
+
+def read_csv_cards(csv_file):
+    """Yield (front, back[, deck_name]) tuples from a CSV file, one row at a time."""
+    with open(csv_file, "r", encoding="utf-8", newline="") as f:
+        for row in csv.reader(f):
+            if len(row) >= 2:
+                yield tuple(row[:3])
+
+
+def main():
+    """Main function."""
+    parser = argparse.ArgumentParser(description="Build a .apkg package from a CSV file")
+    parser.add_argument("csv_file", help="CSV file with front,back[,deck_name] rows")
+    parser.add_argument("output", help="Path of the .apkg file to write")
+    parser.add_argument("--deck", default="default", help="Deck for rows without a deck name")
+    parser.add_argument(
+        "--deck-title",
+        action="append",
+        default=[],
+        metavar="NAME=TITLE",
+        help="Deck name in Anki for a registry deck (repeatable)",
+    )
+    parser.add_argument(
+        "--no-normalize", action="store_true", help="Keep quotation marks and diacritics"
+    )
+    args = parser.parse_args()
+
+    summary = build_apkg(
+        read_csv_cards(args.csv_file),
+        args.output,
+        default_deck=args.deck,
+        deck_titles=dict(item.split("=", 1) for item in args.deck_title),
+        normalize=not args.no_normalize,
+    )
+    print(f"Wrote {summary['total']} cards to {summary['path']}")
+    for deck, count in sorted(summary["decks"].items()):
+        print(f"  {deck}: {count}")
+
+
+if __name__ == "__main__":
+    main()
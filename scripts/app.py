@@ -6,6 +6,7 @@ This script checks if the required dependencies are installed and if the .env fi
 
 import os
 import sys
+import argparse
 import subprocess
 import importlib.util
 
@@ -59,31 +60,34 @@ def check_env_file():
     return True
 
 
-def run_server():
+def run_server(production=False, workers=None):
     """Run the FastAPI server."""
     print("Starting Anki API server...")
 
     # Get the port from the .env file or use the default
     port = os.environ.get("PORT", "8000")
 
+    command = [sys.executable, "main.py", "--port", port]
+    if production:
+        command.append("--production")
+        if workers:
+            command += ["--workers", str(workers)]
+
     # Run the server
-    subprocess.run(
-        [
-            sys.executable,
-            "-m",
-            "uvicorn",
-            "anki_fastapi:app",
-            "--host",
-            "0.0.0.0",
-            "--port",
-            port,
-            "--reload",
-        ]
-    )
+    subprocess.run(command)
 
 
 def main():
     """Main function."""
+    parser = argparse.ArgumentParser(description="Run the Anki API server")
+    parser.add_argument(
+        "--production",
+        action="store_true",
+        help="Run several worker processes with reload turned off",
+    )
+    parser.add_argument("--workers", type=int, help="Number of worker processes")
+    args = parser.parse_args()
+
     print("Anki API Server")
     print("==============")
 
@@ -96,7 +100,7 @@ def main():
         return
 
     # Run the server
-    run_server()
+    run_server(production=args.production, workers=args.workers)
 
 
 if __name__ == "__main__":
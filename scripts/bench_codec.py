@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Benchmark the bulk request codec against the pydantic path.
+
+Compares decoding an /add-multiple-cards body via MultipleCardsRequest with the
+fast decoder in fast_json.py, and encoding a large response with the default
+JSONResponse against the fast response class.
+
+Usage:
+    python -m scripts.bench_codec --cards 10000 --repeat 20
+"""
+
+import argparse
+import json
+import statistics
+import time
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+from main import MultipleCardsRequest
+from scripts.fast_json import ORJSON_AVAILABLE, decode_bulk_request
+
+
+def build_body(num_cards):
+    """Build a realistic bulk request body with num_cards cards."""
+    cards = [
+        {
+            "front": f"Vocabulary word number {i} with a short example",
+            "back": f"Definition {i}: a longer explanation of the word, ă ş ţ î â",
+        }
+        for i in range(num_cards)
+    ]
+    return json.dumps({"cards": cards, "deck_name": "default", "delay": 0}).encode(
+        "utf-8"
+    )
+
+
+def decode_with_pydantic(body):
+    """Decode the body the way the endpoint did before the fast codec."""
+    request = MultipleCardsRequest.model_validate_json(body)
+    return [
+        (card.front, card.back, card.deck_name or request.deck_name) for card in request.cards
+    ]
+
+
+def decode_fast(body):
+    """Decode the body with the fast codec."""
+    return decode_bulk_request(body).cards
+
+
+def time_it(func, arg, repeat):
+    """Run func(arg) repeat times and return the timings in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(arg)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def report(name, timings, num_cards):
+    """Print median and best timings for one benchmark."""
+    median = statistics.median(timings)
+    print(
+        f"  {name:<24} median {median:8.2f} ms  best {min(timings):8.2f} ms  "
+        f"({median * 1e6 / num_cards:8.0f} ns/card)"
+    )
+    return median
+
+
+def main():
+    """Main function."""
+    parser = argparse.ArgumentParser(description="Benchmark the bulk JSON codec")
+    parser.add_argument("--cards", type=int, default=10000, help="Cards per payload")
+    parser.add_argument("--repeat", type=int, default=20, help="Runs per benchmark")
+    args = parser.parse_args()
+
+    body = build_body(args.cards)
+    print(f"Payload: {args.cards} cards, {len(body)} bytes, orjson={ORJSON_AVAILABLE}")
+
+    assert decode_with_pydantic(body) == decode_fast(body)
+
+    print("Decode:")
+    slow = report("pydantic", time_it(decode_with_pydantic, body, args.repeat), args.cards)
+    fast = report("fast_json", time_it(decode_fast, body, args.repeat), args.cards)
+    print(f"  speedup: {slow / fast:.1f}x")
+
+    response = {
+        "success": True,
+        "message": "done",
+        "data": {"results": json.loads(body)["cards"]},
+    }
+    print("Encode:")
+    slow = report(
+        "JSONResponse", time_it(JSONResponse, response, args.repeat), args.cards
+    )
+    if ORJSON_AVAILABLE:
+        fast = report(
+            "ORJSONResponse", time_it(ORJSONResponse, response, args.repeat), args.cards
+        )
+        print(f"  speedup: {slow / fast:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
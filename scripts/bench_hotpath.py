@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the per-card CPU work of add_anki_card.
+
+Times text normalization, payload encoding and deck suffix lookup over three
+synthetic corpora (short vocabulary cards, long paragraphs and text heavy in
+non-ASCII characters) and reports ns/card plus bytes and memory blocks
+allocated per card, measured with tracemalloc. Results can be saved as a
+baseline and later runs compared against it; a regression beyond the
+tolerance makes the run exit with status 1.
+
+Usage:
+    python -m scripts.bench_hotpath --save-baseline bench_baseline.json
+    python -m scripts.bench_hotpath --baseline bench_baseline.json
+
+Timings depend on the machine, so save the baseline on the machine that
+runs the comparison.
+"""
+
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+from scripts.anki_api_v2 import (
+    encode_card_payload,
+    get_deck_suffix,
+    list_deck_names,
+    normalize_card_text,
+)
+
+_SYLLABLES = ["ka", "lo", "mi", "ter", "an", "stra", "pe", "nu", "vi", "do", "re", "sol"]
+_NON_ASCII_WORDS = [
+    "„mărţişor”", "ţară", "şcoală", "înţelepciune", "câine", "știință", "țărm",
+    "Привет", "мир", "学习", "日本語", "größer", "café", "naïve", "🙂", "✓",
+]
+
+
+def _words(rng, count, vocabulary=None):
+    if vocabulary:
+        return " ".join(rng.choice(vocabulary) for _ in range(count))
+    return " ".join(
+        "".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(1, 4))) for _ in range(count)
+    )
+
+
+def build_corpora(num_cards, seed=0):
+    """
+    Build the benchmark corpora
+
+    Args:
+        num_cards (int): Cards per corpus
+        seed (int): Random seed, so runs see the same cards
+
+    Returns:
+        dict: Corpus name to a list of (front, back, deck_name) tuples
+    """
+    rng = random.Random(seed)
+    # Registered decks in mixed case, plus one unknown deck that falls back to default
+    decks = [name.title() for name in list_deck_names()] + ["unregistered deck"]
+
+    def deck(i):
+        return decks[i % len(decks)]
+
+    return {
+        "vocabulary": [
+            (_words(rng, rng.randint(1, 2)), _words(rng, rng.randint(3, 6)), deck(i))
+            for i in range(num_cards)
+        ],
+        "paragraphs": [
+            (_words(rng, rng.randint(8, 16)) + "?", _words(rng, rng.randint(60, 200)) + ".", deck(i))
+            for i in range(num_cards)
+        ],
+        "non_ascii": [
+            (
+                _words(rng, rng.randint(2, 8), _NON_ASCII_WORDS),
+                _words(rng, rng.randint(10, 60), _NON_ASCII_WORDS),
+                deck(i),
+            )
+            for i in range(num_cards)
+        ],
+    }
+
+
+def bench_normalize(cards):
+    """Normalize both sides of every card."""
+    return [(normalize_card_text(front), normalize_card_text(back)) for front, back, _ in cards]
+
+
+def bench_encode(cards):
+    """Encode already normalized cards into payloads."""
+    return [encode_card_payload(front, back, deck_name) for front, back, deck_name in cards]
+
+
+def bench_deck_lookup(cards):
+    """Look up the binary suffix of every card's deck."""
+    return [get_deck_suffix(deck_name) for _, _, deck_name in cards]
+
+
+def bench_card(cards):
+    """Normalize and encode every card, as add_anki_card does."""
+    return [
+        encode_card_payload(normalize_card_text(front), normalize_card_text(back), deck_name)
+        for front, back, deck_name in cards
+    ]
+
+
+BENCHMARKS = {
+    "normalize": bench_normalize,
+    "encode": bench_encode,
+    "deck_lookup": bench_deck_lookup,
+    "card": bench_card,
+}
+
+
+def measure_time(func, cards, repeat):
+    """
+    Time func over the cards
+
+    Returns:
+        tuple: (best, median) nanoseconds per card over repeat runs
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        func(cards)
+        timings.append((time.perf_counter_ns() - start) / len(cards))
+    return min(timings), statistics.median(timings)
+
+
+def measure_allocations(func, cards):
+    """
+    Measure the memory func allocates per card with tracemalloc
+
+    The outputs are kept alive until the measurement ends, so temporaries show
+    up in the peak and the results themselves in the retained blocks.
+
+    Returns:
+        tuple: (peak bytes per card, memory blocks retained per card)
+    """
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        start_size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        outputs = func(cards)
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    del outputs
+    snapshot_filter = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    blocks = sum(
+        stat.count_diff
+        for stat in after.filter_traces(snapshot_filter).compare_to(
+            before.filter_traces(snapshot_filter), "filename"
+        )
+    )
+    return (peak - start_size) / len(cards), blocks / len(cards)
+
+
+def run(num_cards, repeat, only=None):
+    """
+    Run all benchmarks over all corpora
+
+    Args:
+        num_cards (int): Cards per corpus
+        repeat (int): Timed runs per benchmark
+        only (list, optional): Benchmark names to run; all if not given
+
+    Returns:
+        dict: "benchmark/corpus" to ns_per_card, ns_per_card_median,
+            bytes_per_card and blocks_per_card
+    """
+    corpora = build_corpora(num_cards)
+    # Encoding works on normalized text, as in add_anki_card
+    normalized = {
+        name: [(front, back, deck) for (front, back), (_, _, deck) in zip(bench_normalize(cards), cards)]
+        for name, cards in corpora.items()
+    }
+    results = {}
+    for bench_name, func in BENCHMARKS.items():
+        if only and bench_name not in only:
+            continue
+        for corpus_name in corpora:
+            cards = normalized[corpus_name] if bench_name == "encode" else corpora[corpus_name]
+            func(cards)  # warm up
+            best, median = measure_time(func, cards, repeat)
+            bytes_per_card, blocks_per_card = measure_allocations(func, cards)
+            results[f"{bench_name}/{corpus_name}"] = {
+                "ns_per_card": round(best, 1),
+                "ns_per_card_median": round(median, 1),
+                "bytes_per_card": round(bytes_per_card, 1),
+                "blocks_per_card": round(blocks_per_card, 2),
+            }
+    return results
+
+
+def compare(results, baseline, time_tolerance, alloc_tolerance):
+    """
+    Compare results with a baseline
+
+    Args:
+        results (dict): Result of run()
+        baseline (dict): Result of an earlier run()
+        time_tolerance (float): Allowed relative increase of ns/card
+        alloc_tolerance (float): Allowed relative increase of bytes and blocks per card
+
+    Returns:
+        list: (name, metric, baseline value, new value) for every regression
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        for metric, tolerance in (
+            ("ns_per_card", time_tolerance),
+            ("bytes_per_card", alloc_tolerance),
+            ("blocks_per_card", alloc_tolerance),
+        ):
+            # Allocation figures get one unit of slack so tiny values do not flap
+            slack = 0 if metric == "ns_per_card" else 1
+            if current[metric] > previous[metric] * (1 + tolerance) + slack:
+                regressions.append((name, metric, previous[metric], current[metric]))
+    return regressions
+
+
+def main():
+    """Main function."""
+    parser = argparse.ArgumentParser(description="Benchmark the per-card encoding hot path")
+    parser.add_argument("--cards", type=int, default=5000, help="Cards per corpus")
+    parser.add_argument("--repeat", type=int, default=7, help="Timed runs per benchmark")
+    parser.add_argument(
+        "--only", nargs="+", choices=list(BENCHMARKS), help="Run only these benchmarks"
+    )
+    parser.add_argument("--baseline", help="Compare with a baseline JSON file")
+    parser.add_argument("--save-baseline", help="Write the results as a baseline JSON file")
+    parser.add_argument(
+        "--time-tolerance", type=float, default=0.15,
+        help="Allowed relative slowdown in ns/card before flagging a regression",
+    )
+    parser.add_argument(
+        "--alloc-tolerance", type=float, default=0.05,
+        help="Allowed relative increase in allocations per card",
+    )
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+
+    print(f"{args.cards} cards per corpus, best of {args.repeat} runs, Python {platform.python_version()}")
+    results = run(args.cards, args.repeat, args.only)
+
+    print(f"  {'benchmark':<24} {'ns/card':>10} {'median':>10} {'bytes/card':>11} {'blocks/card':>12}")
+    for name, result in results.items():
+        line = (
+            f"  {name:<24} {result['ns_per_card']:>10.0f} {result['ns_per_card_median']:>10.0f} "
+            f"{result['bytes_per_card']:>11.0f} {result['blocks_per_card']:>12.2f}"
+        )
+        if baseline and name in baseline:
+            change = result["ns_per_card"] / baseline[name]["ns_per_card"] - 1
+            line += f"  {change:+7.1%} vs baseline"
+        print(line)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                    "cards": args.cards,
+                    "created": time.time(),
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+        print(f"Baseline written to {args.save_baseline}")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.time_tolerance, args.alloc_tolerance)
+        for name, metric, previous, current in regressions:
+            print(f"REGRESSION {name} {metric}: {previous} -> {current}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Small caching helpers for the Anki API.
+
+Provides ETag support for conditional GET requests.
+"""
+
+import hashlib
+
+
+def make_etag(body):
+    """
+    Build a strong ETag for a response body
+
+    Args:
+        body (bytes): The encoded response body
+
+    Returns:
+        str: A quoted ETag value
+    """
+    return '"' + hashlib.sha1(body).hexdigest() + '"'
+
+
+def etag_matches(if_none_match, etag):
+    """
+    Check an If-None-Match header against an ETag
+
+    Args:
+        if_none_match (str): Value of the If-None-Match request header, or None
+        etag (str): The current ETag of the resource
+
+    Returns:
+        bool: True if the client's cached copy is still current
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        # Weak comparison is fine for GET requests
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
@@ -0,0 +1,200 @@
+"""
+Compressed request bodies and responses for the Anki API.
+
+Bulk uploads may be sent with Content-Encoding gzip or deflate, or zstd when
+the zstandard package is installed. Bodies are decompressed incrementally as
+they arrive and reading stops as soon as the decompressed size passes a cap,
+so a small compressed body cannot expand into gigabytes in memory.
+"""
+
+import io
+import zlib
+
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware
+
+try:
+    import zstandard
+
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+SUPPORTED_ENCODINGS = ("gzip", "deflate", "zstd") if ZSTD_AVAILABLE else ("gzip", "deflate")
+
+# Decompressed bytes produced per step, bounding the memory used beyond the cap
+_STEP = 64 * 1024
+
+
+class BodyTooLarge(ValueError):
+    """Raised when a request body exceeds the size cap once decompressed."""
+
+
+class UnsupportedEncoding(ValueError):
+    """Raised for a Content-Encoding that cannot be decoded."""
+
+
+class _ZlibDecoder:
+    """Incremental gzip/deflate decoder that stops at a size cap."""
+
+    def __init__(self, encoding):
+        # 16 + MAX_WBITS expects a gzip header; "deflate" is decided in feed
+        self._decoder = zlib.decompressobj(16 + zlib.MAX_WBITS) if encoding == "gzip" else None
+        # Bytes held back until the two-byte zlib header can be checked
+        self._head = b""
+
+    def feed(self, data, limit):
+        if self._decoder is None:
+            # Some clients send raw deflate data as "deflate", so look at the
+            # header first; chunks may be as small as one byte
+            self._head += data
+            if len(self._head) < 2:
+                return b""
+            data, self._head = self._head, b""
+            cmf, flg = data[0], data[1]
+            is_zlib = cmf & 0x0F == 8 and (cmf << 8 | flg) % 31 == 0
+            self._decoder = zlib.decompressobj(zlib.MAX_WBITS if is_zlib else -zlib.MAX_WBITS)
+        return self._drain(data, limit)
+
+    def _drain(self, data, limit):
+        out = []
+        size = 0
+        while data:
+            chunk = self._decoder.decompress(data, _STEP)
+            out.append(chunk)
+            size += len(chunk)
+            if size > limit:
+                raise BodyTooLarge()
+            data = self._decoder.unconsumed_tail
+        return b"".join(out)
+
+    def finish(self):
+        if self._decoder is None or not self._decoder.eof:
+            raise ValueError("Truncated compressed body")
+
+
+def _decompress_zstd(data, limit):
+    # zstandard's decompressobj returns a whole frame at once, so the
+    # compressed body (already capped) is read back through a bounded stream
+    out = []
+    size = 0
+    with zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data)) as reader:
+        while True:
+            chunk = reader.read(_STEP)
+            if not chunk:
+                break
+            out.append(chunk)
+            size += len(chunk)
+            if size > limit:
+                raise BodyTooLarge()
+    return b"".join(out)
+
+
+def decompress_body(data, encoding, max_bytes):
+    """
+    Decompress a whole body that is already in memory, with the same cap as read_body
+
+    Args:
+        data (bytes): The body as received
+        encoding (str): "gzip", "deflate" or "zstd"
+        max_bytes (int): Maximum size after decompression (0 = no cap)
+
+    Returns:
+        bytes: The decoded body
+
+    Raises:
+        BodyTooLarge: If the body is larger than max_bytes
+        UnsupportedEncoding: If the encoding is not supported
+        ValueError: If the body is not validly compressed
+    """
+    if encoding not in SUPPORTED_ENCODINGS:
+        raise UnsupportedEncoding(encoding)
+    limit = max_bytes or float("inf")
+    if encoding == "zstd":
+        try:
+            return _decompress_zstd(data, limit)
+        except zstandard.ZstdError as e:
+            raise ValueError(f"Invalid zstd body: {e}")
+    decoder = _ZlibDecoder(encoding)
+    try:
+        body = decoder.feed(data, limit)
+        decoder.finish()
+    except zlib.error as e:
+        raise ValueError(f"Invalid {encoding} body: {e}")
+    return body
+
+
+async def read_body(request, max_bytes):
+    """
+    Read a request body, decompressing it according to Content-Encoding
+
+    Args:
+        request: Starlette request
+        max_bytes (int): Maximum body size after decompression (0 = no cap)
+
+    Returns:
+        bytes: The decoded body
+
+    Raises:
+        BodyTooLarge: If the body is larger than max_bytes
+        UnsupportedEncoding: If the Content-Encoding is not supported
+        ValueError: If the body is not validly compressed
+    """
+    encodings = [
+        item.strip().lower()
+        for item in request.headers.get("content-encoding", "").split(",")
+        if item.strip() and item.strip().lower() != "identity"
+    ]
+    if len(encodings) > 1 or (encodings and encodings[0] not in SUPPORTED_ENCODINGS):
+        raise UnsupportedEncoding(request.headers["content-encoding"])
+    limit = max_bytes or float("inf")
+
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > limit:
+        raise BodyTooLarge()
+
+    encoding = encodings[0] if encodings else None
+    decoder = _ZlibDecoder(encoding) if encoding in ("gzip", "deflate") else None
+    parts = []
+    size = 0
+    try:
+        async for chunk in request.stream():
+            if decoder is not None:
+                chunk = decoder.feed(chunk, limit - size)
+            parts.append(chunk)
+            size += len(chunk)
+            if size > limit:
+                raise BodyTooLarge()
+        if decoder is not None:
+            decoder.finish()
+    except zlib.error as e:
+        raise ValueError(f"Invalid {encoding} body: {e}")
+
+    body = b"".join(parts)
+    if encoding == "zstd":
+        try:
+            body = _decompress_zstd(body, limit)
+        except zstandard.ZstdError as e:
+            raise ValueError(f"Invalid zstd body: {e}")
+    return body
+
+
+class GZipUnlessStreaming(GZipMiddleware):
+    """
+    GZipMiddleware that leaves streamed responses alone.
+
+    Compressing a stream buffers its frames, which would hold back the
+    per-card results and progress frames that streaming is for.
+    """
+
+    def __init__(self, app, minimum_size=500, compresslevel=6, stream_media_types=()):
+        super().__init__(app, minimum_size=minimum_size, compresslevel=compresslevel)
+        self.stream_media_types = stream_media_types
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            accept = Headers(scope=scope).get("accept", "")
+            if any(media_type in accept for media_type in self.stream_media_types):
+                await self.app(scope, receive, send)
+                return
+        await super().__call__(scope, receive, send)
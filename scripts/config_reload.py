@@ -0,0 +1,247 @@
+"""
+Hot reload of credentials and deck definitions.
+
+A JSON config file can hold the AnkiWeb cookie and the deck registry:
+
+    {
+        "cookie": "has_auth=1; ankiweb=...",
+        "decks": {
+            "default": "1a0e08b1f6a4cfc532109bdfe2a6c332",
+            "spanish": [26, 14, 8, 177, 246, 164, 207, 197, 50, 16, 1, 2, 3, 4, 5, 50]
+        }
+    }
+
+Both keys are optional. Deck suffixes are hex strings or lists of byte
+values, and "decks" replaces the whole registry, so it must include
+"default". ConfigWatcher polls the file's modification time and applies a
+changed file by rebinding the cookie and the registry in anki_api_v2, which
+request handlers read without locks. A file that fails validation is
+reported and the previous configuration stays in place.
+"""
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from scripts.anki_api_v2 import set_deck_registry, set_default_cookie
+
+logger = logging.getLogger("anki-api")
+
+
+class ConfigError(ValueError):
+    """Raised when a config file or body is not valid."""
+
+
+def parse_config(data):
+    """
+    Validate a config mapping
+
+    Args:
+        data (dict): Decoded config with optional "cookie" and "decks" keys
+
+    Returns:
+        dict: "cookie" (str or None) and "decks" (dict of name to bytes, or None)
+
+    Raises:
+        ConfigError: If the config is not valid
+    """
+    if not isinstance(data, dict):
+        raise ConfigError("Config must be a JSON object")
+    unknown = set(data) - {"cookie", "decks"}
+    if unknown:
+        raise ConfigError(f"Unknown config keys: {', '.join(sorted(unknown))}")
+
+    cookie = data.get("cookie")
+    if cookie is not None and (not isinstance(cookie, str) or not cookie.strip()):
+        raise ConfigError("cookie must be a non-empty string")
+
+    decks = data.get("decks")
+    if decks is not None:
+        if not isinstance(decks, dict):
+            raise ConfigError("decks must be an object of deck name to suffix")
+        parsed = {}
+        for name, suffix in decks.items():
+            try:
+                if isinstance(suffix, str):
+                    parsed[name.lower()] = bytes.fromhex(suffix)
+                elif isinstance(suffix, list):
+                    parsed[name.lower()] = bytes(suffix)
+                else:
+                    raise TypeError
+            except (TypeError, ValueError):
+                raise ConfigError(
+                    f"Suffix of deck '{name}' must be a hex string or a list of byte values"
+                )
+            if not parsed[name.lower()]:
+                raise ConfigError(f"Suffix of deck '{name}' is empty")
+        if "default" not in parsed:
+            raise ConfigError("decks must include 'default'")
+        decks = parsed
+
+    return {"cookie": cookie, "decks": decks}
+
+
+def apply_config(config):
+    """
+    Swap in a parsed config
+
+    Args:
+        config (dict): Result of parse_config
+
+    Returns:
+        dict: What changed: "cookie" (bool) and "decks" (registry version or None)
+    """
+    changes = {"cookie": False, "decks": None}
+    if config["cookie"] is not None:
+        changes["cookie"] = set_default_cookie(config["cookie"])
+    if config["decks"] is not None:
+        changes["decks"] = set_deck_registry(config["decks"])
+    return changes
+
+
+def load_config_file(path):
+    """
+    Read and validate a config file
+
+    Raises:
+        ConfigError: If the file cannot be read or is not valid
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ConfigError(f"Could not read {path}: {e}")
+    return parse_config(data)
+
+
+class ConfigWatcher:
+    """
+    Applies a config file at startup and whenever it changes.
+    """
+
+    def __init__(self, path, interval=2.0):
+        """
+        Args:
+            path (str): Path of the JSON config file
+            interval (float): Seconds between modification checks
+        """
+        self.path = path
+        self.interval = interval
+        self.stats = {"reloads": 0, "last_reload": None, "last_error": None}
+        self._signature = None
+        self._stop = threading.Event()
+        self._reload_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._thread = None
+
+    def _file_signature(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        # An atomic rename over the file changes the inode even within one mtime tick
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def reload(self):
+        """
+        Apply the file now
+
+        Returns:
+            dict: The changes made, see apply_config
+
+        Raises:
+            ConfigError: If the file is not valid; the current config is kept
+        """
+        with self._reload_lock:
+            signature = self._file_signature()
+            try:
+                config = load_config_file(self.path)
+            except ConfigError as e:
+                self.stats["last_error"] = str(e)
+                # Do not retry the same broken file on every poll
+                self._signature = signature
+                raise
+            changes = apply_config(config)
+            self._signature = signature
+            self.stats["reloads"] += 1
+            self.stats["last_reload"] = time.time()
+            self.stats["last_error"] = None
+        logger.info(
+            "Reloaded %s (cookie changed: %s, deck registry version: %s)",
+            self.path,
+            changes["cookie"],
+            changes["decks"],
+        )
+        return changes
+
+    def update(self, data):
+        """
+        Merge config keys into the file and apply it
+
+        The file is replaced atomically, so the watchers of other worker
+        processes pick up the change on their next poll.
+
+        Args:
+            data (dict): Decoded config; its keys replace those in the file
+
+        Returns:
+            dict: The changes made, see apply_config
+
+        Raises:
+            ConfigError: If the merged config is not valid or cannot be
+                written; the file and the current config are kept
+        """
+        parse_config(data)
+        with self._write_lock:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    merged = json.load(f)
+            except FileNotFoundError:
+                merged = {}
+            except (OSError, ValueError) as e:
+                raise ConfigError(f"Could not read {self.path}: {e}")
+            if not isinstance(merged, dict):
+                merged = {}
+            merged.update(data)
+            parse_config(merged)
+            directory = os.path.dirname(os.path.abspath(self.path))
+            try:
+                fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".config-", suffix=".tmp")
+                try:
+                    with os.fdopen(fd, "w", encoding="utf-8") as f:
+                        json.dump(merged, f, indent=2)
+                    os.replace(tmp_path, self.path)
+                except BaseException:
+                    os.unlink(tmp_path)
+                    raise
+            except OSError as e:
+                raise ConfigError(f"Could not write {self.path}: {e}")
+            return self.reload()
+
+    def start(self):
+        """Apply the file and start watching it."""
+        try:
+            self.reload()
+        except ConfigError as e:
+            logger.error("%s", e)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="config-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop watching the file."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if self._file_signature() != self._signature:
+                try:
+                    self.reload()
+                except ConfigError as e:
+                    logger.error("%s", e)
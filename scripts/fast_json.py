@@ -0,0 +1,190 @@
+"""
+Fast JSON codec for the Anki API.
+
+Uses orjson when it is installed and falls back to the standard library
+otherwise. Bulk card requests are decoded straight into (front, back,
+deck_name) tuples so no per-card pydantic model is created.
+"""
+
+import json
+from collections import namedtuple
+
+from scripts.policies import DUPLICATE_POLICIES
+
+try:
+    import orjson
+
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+BulkRequest = namedtuple(
+    "BulkRequest", "cards deck_name delay duplicate_policy similarity_threshold"
+)
+
+
+class BulkRequestError(ValueError):
+    """Raised when a bulk request body is not valid."""
+
+    def __init__(self, errors):
+        """
+        Args:
+            errors (list): Validation errors in FastAPI's {"loc", "msg", "type"} format
+        """
+        super().__init__(errors[0]["msg"] if errors else "Invalid request body")
+        self.errors = errors
+
+
+def loads(data):
+    """Decode JSON from bytes or str."""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj):
+    """Encode an object as compact UTF-8 JSON bytes."""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def _error(loc, msg, error_type):
+    return {"loc": ["body"] + loc, "msg": msg, "type": error_type}
+
+
+def decode_bulk_request(body, default_deck="default", default_delay=1.0):
+    """
+    Decode an /add-multiple-cards request body without building pydantic models
+
+    Args:
+        body (bytes): Raw JSON request body
+        default_deck (str): Deck used when the body has no deck_name
+        default_delay (float): Delay used when the body has no delay
+
+    Returns:
+        BulkRequest: cards is a list of (front, back, deck_name) tuples, where
+            deck_name is the card's own deck_name or else the request's;
+            duplicate_policy and similarity_threshold are None when not given
+
+    Raises:
+        BulkRequestError: If the body is not valid JSON or does not match the schema
+    """
+    try:
+        data = loads(body)
+    except ValueError as e:
+        raise BulkRequestError([_error([], f"Invalid JSON: {e}", "json_invalid")])
+
+    if not isinstance(data, dict):
+        raise BulkRequestError([_error([], "Input should be an object", "dict_type")])
+
+    deck_name = data.get("deck_name", default_deck)
+    if not isinstance(deck_name, str):
+        raise BulkRequestError(
+            [_error(["deck_name"], "Input should be a valid string", "string_type")]
+        )
+
+    delay = data.get("delay", default_delay)
+    if isinstance(delay, bool) or not isinstance(delay, (int, float)):
+        raise BulkRequestError(
+            [_error(["delay"], "Input should be a valid number", "float_type")]
+        )
+
+    duplicate_policy = data.get("duplicate_policy")
+    if duplicate_policy is not None and duplicate_policy not in DUPLICATE_POLICIES:
+        raise BulkRequestError(
+            [
+                _error(
+                    ["duplicate_policy"],
+                    "Input should be " + ", ".join(f"'{p}'" for p in DUPLICATE_POLICIES),
+                    "literal_error",
+                )
+            ]
+        )
+
+    threshold = data.get("similarity_threshold")
+    if threshold is not None:
+        if isinstance(threshold, bool) or not isinstance(threshold, (int, float)):
+            raise BulkRequestError(
+                [_error(["similarity_threshold"], "Input should be a valid number", "float_type")]
+            )
+        if not 0 <= threshold <= 1:
+            raise BulkRequestError(
+                [
+                    _error(
+                        ["similarity_threshold"],
+                        "Input should be between 0 and 1",
+                        "value_error",
+                    )
+                ]
+            )
+        threshold = float(threshold)
+
+    raw_cards = data.get("cards")
+    if raw_cards is None:
+        raise BulkRequestError([_error(["cards"], "Field required", "missing")])
+    if not isinstance(raw_cards, list):
+        raise BulkRequestError(
+            [_error(["cards"], "Input should be a valid list", "list_type")]
+        )
+
+    cards = []
+    append = cards.append
+    for i, card in enumerate(raw_cards):
+        try:
+            front = card["front"]
+            back = card["back"]
+        except (TypeError, KeyError):
+            raise BulkRequestError([_card_error(i, card)])
+        if front.__class__ is not str or back.__class__ is not str:
+            raise BulkRequestError([_card_error(i, card)])
+        card_deck = card.get("deck_name")
+        if card_deck is None:
+            card_deck = deck_name
+        elif card_deck.__class__ is not str:
+            raise BulkRequestError([_card_error(i, card)])
+        append((front, back, card_deck))
+
+    return BulkRequest(cards, deck_name, float(delay), duplicate_policy, threshold)
+
+
+def _card_error(index, card):
+    """Build the validation error for a malformed card."""
+    if not isinstance(card, dict):
+        return _error(["cards", index], "Input should be an object", "dict_type")
+    for field in ("front", "back"):
+        if field not in card:
+            return _error(["cards", index, field], "Field required", "missing")
+        if not isinstance(card[field], str):
+            return _error(
+                ["cards", index, field], "Input should be a valid string", "string_type"
+            )
+    if card.get("deck_name") is not None and not isinstance(card["deck_name"], str):
+        return _error(
+            ["cards", index, "deck_name"], "Input should be a valid string", "string_type"
+        )
+    return _error(["cards", index], "Invalid card", "value_error")
+
+
+def inline_schema(model):
+    """
+    Build a self-contained JSON schema for a pydantic model
+
+    Nested model references are inlined so the schema can be embedded in an
+    OpenAPI operation for endpoints that read the raw request body.
+    """
+    schema = model.model_json_schema()
+    definitions = schema.pop("$defs", {})
+
+    def resolve(node):
+        if isinstance(node, dict):
+            ref = node.get("$ref")
+            if ref and ref.startswith("#/$defs/"):
+                return resolve(definitions[ref.split("/")[-1]])
+            return {key: resolve(value) for key, value in node.items()}
+        if isinstance(node, list):
+            return [resolve(item) for item in node]
+        return node
+
+    return resolve(schema)
@@ -138,7 +138,8 @@ def extract_anki_cookie_manual(browser="chrome"):
             )
         else:
             cursor.execute(
-                "SELECT name, value, encrypted_value FROM cookies WHERE host_key LIKE '%ankiweb.net%' OR host_key LIKE '%ankiuser.net%'"
+                "SELECT name, value, encrypted_value FROM cookies "
+                "WHERE host_key LIKE '%ankiweb.net%' OR host_key LIKE '%ankiuser.net%'"
             )
 
         cookies = cursor.fetchall()
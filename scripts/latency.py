@@ -0,0 +1,142 @@
+"""
+HDR-style latency histogram.
+
+Values are recorded in integer microseconds into log-linear buckets, so the
+histogram keeps a fixed relative precision (set by significant_digits) over
+the whole range while using little memory. Histograms can be merged and
+serialized, which makes them suitable for comparing benchmark runs.
+"""
+
+import math
+
+
+class LatencyHistogram:
+    """
+    Log-linear histogram of latencies in microseconds.
+    """
+
+    def __init__(self, significant_digits=3):
+        """
+        Args:
+            significant_digits (int): Decimal digits of precision kept (1-5)
+        """
+        if not 1 <= significant_digits <= 5:
+            raise ValueError("significant_digits must be between 1 and 5")
+        self.significant_digits = significant_digits
+        self._sub_bits = math.ceil(math.log2(2 * 10**significant_digits))
+        self._half = 1 << (self._sub_bits - 1)
+        self._counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def _index(self, value):
+        shift = max(0, value.bit_length() - self._sub_bits)
+        return shift * self._half + (value >> shift)
+
+    def _value_at(self, index):
+        """Return the highest value that maps to a bucket index."""
+        if index < 2 * self._half:
+            return index
+        shift = index // self._half - 1
+        sub = index - shift * self._half
+        return ((sub + 1) << shift) - 1
+
+    def record(self, value_us, count=1):
+        """
+        Record a latency
+
+        Args:
+            value_us (int or float): Latency in microseconds
+            count (int): Number of times to record it
+        """
+        value = max(0, int(value_us))
+        index = self._index(value)
+        self._counts[index] = self._counts.get(index, 0) + count
+        self.count += count
+        self.total += value * count
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def record_seconds(self, seconds):
+        """Record a latency given in seconds."""
+        self.record(seconds * 1e6)
+
+    def merge(self, other):
+        """Add all values recorded in another histogram."""
+        if other.significant_digits != self.significant_digits:
+            raise ValueError("Cannot merge histograms with different precision")
+        for index, count in other._counts.items():
+            self._counts[index] = self._counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, percent):
+        """
+        Get the value at a percentile
+
+        Args:
+            percent (float): Percentile between 0 and 100
+
+        Returns:
+            int: Latency in microseconds (0 if nothing was recorded)
+        """
+        if not self.count:
+            return 0
+        target = max(1, math.ceil(self.count * percent / 100))
+        seen = 0
+        for index in sorted(self._counts):
+            seen += self._counts[index]
+            if seen >= target:
+                return min(self._value_at(index), self.max)
+        return self.max
+
+    def mean(self):
+        """Get the mean latency in microseconds."""
+        return self.total / self.count if self.count else 0.0
+
+    def summary(self, percentiles=(50, 90, 99, 99.9, 99.99)):
+        """
+        Summarize the histogram in milliseconds
+
+        Returns:
+            dict: count, min, mean, max and the requested percentiles
+        """
+        result = {
+            "count": self.count,
+            "min_ms": (self.min or 0) / 1000,
+            "mean_ms": round(self.mean() / 1000, 3),
+            "max_ms": (self.max or 0) / 1000,
+        }
+        for p in percentiles:
+            result[f"p{p:g}_ms"] = self.percentile(p) / 1000
+        return result
+
+    def to_dict(self):
+        """Serialize the histogram so it can be stored and merged later."""
+        return {
+            "significant_digits": self.significant_digits,
+            "counts": {str(index): count for index, count in sorted(self._counts.items())},
+            "count": self.count,
+            "total": self.total,
+            "min": self.min,
+            "max": self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a histogram serialized with to_dict()."""
+        histogram = cls(data["significant_digits"])
+        histogram._counts = {int(index): count for index, count in data["counts"].items()}
+        histogram.count = data["count"]
+        histogram.total = data["total"]
+        histogram.min = data["min"]
+        histogram.max = data["max"]
+        return histogram
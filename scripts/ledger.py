@@ -0,0 +1,256 @@
+"""
+Local ledger of submitted cards.
+
+Every card the service handles is recorded in a SQLite database together with
+its deck, a content hash, the time of submission and the outcome, and its text
+is indexed with FTS5 so "did we already add X to deck Y" can be answered
+locally. Writes are queued and inserted in batches by a background thread, so
+recording a card never waits for the disk.
+"""
+
+import hashlib
+import logging
+import queue
+import sqlite3
+import threading
+import time
+
+from scripts.anki_api_v2 import normalize_card_text
+
+LEDGER_STATUSES = ("added", "spooled", "failed", "skipped")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cards (
+    id INTEGER PRIMARY KEY,
+    deck TEXT NOT NULL,
+    front TEXT NOT NULL,
+    back TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    created REAL NOT NULL,
+    status TEXT NOT NULL,
+    status_code INTEGER,
+    tenant TEXT
+);
+CREATE INDEX IF NOT EXISTS cards_deck ON cards (deck, id);
+CREATE INDEX IF NOT EXISTS cards_status ON cards (status, id);
+CREATE INDEX IF NOT EXISTS cards_hash ON cards (hash);
+CREATE INDEX IF NOT EXISTS cards_tenant ON cards (tenant, id);
+CREATE VIRTUAL TABLE IF NOT EXISTS cards_fts USING fts5(
+    front, back, content='cards', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS cards_fts_insert AFTER INSERT ON cards BEGIN
+    INSERT INTO cards_fts (rowid, front, back) VALUES (new.id, new.front, new.back);
+END;
+CREATE TRIGGER IF NOT EXISTS cards_fts_delete AFTER DELETE ON cards BEGIN
+    INSERT INTO cards_fts (cards_fts, rowid, front, back)
+    VALUES ('delete', old.id, old.front, old.back);
+END;
+"""
+
+_COLUMNS = ("id", "deck", "front", "back", "hash", "created", "status", "status_code")
+
+_STOP = object()
+
+logger = logging.getLogger("anki-api")
+
+
+def card_hash(deck_name, front, back):
+    """
+    Hash identifying a card's content within a deck
+
+    Args:
+        deck_name (str): Deck name
+        front (str): Front text, normalized as it was sent
+        back (str): Back text, normalized as it was sent
+
+    Returns:
+        str: Hex SHA1 digest
+    """
+    return hashlib.sha1(
+        "\0".join((deck_name.lower(), front, back)).encode("utf-8")
+    ).hexdigest()
+
+
+def result_status(result):
+    """Map a card result of the API to a ledger status."""
+    if result.get("spooled"):
+        return "spooled"
+    if result["success"]:
+        return "added"
+    return "skipped" if result.get("near_duplicate") else "failed"
+
+
+def _match_expression(query):
+    """
+    Turn free text into an FTS5 query matching all of its words
+
+    Every word is quoted, so FTS5 operators in user input are matched
+    literally; a trailing * keeps its prefix-match meaning.
+    """
+    terms = []
+    for word in query.split():
+        prefix = word.endswith("*")
+        word = word.rstrip("*")
+        if word:
+            terms.append('"' + word.replace('"', '""') + '"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+
+class CardLedger:
+    """
+    SQLite/FTS5 ledger with batched background writes.
+    """
+
+    def __init__(self, path, batch_size=500):
+        """
+        Args:
+            path (str): Path of the SQLite database file
+            batch_size (int): Maximum records inserted per transaction; records
+                queued while a batch is written go into the next one
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self._queue = queue.SimpleQueue()
+        self._local = threading.local()
+        self._thread = None
+        self._connect().executescript(_SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def start(self):
+        """Start the background writer."""
+        self._thread = threading.Thread(target=self._run, name="card-ledger", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10.0):
+        """Write all queued records and stop the background writer."""
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def record(self, deck_name, front, back, status, status_code=None, tenant=None):
+        """
+        Queue a submission for the ledger; returns immediately
+
+        Args:
+            deck_name (str): Deck the card was submitted to
+            front (str): Front text as submitted
+            back (str): Back text as submitted
+            status (str): One of LEDGER_STATUSES
+            status_code (int, optional): Upstream HTTP status code
+            tenant (str, optional): Client that submitted the card
+        """
+        self._queue.put((deck_name, front, back, status, status_code, tenant, time.time()))
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            batch = []
+            while True:
+                if item is _STOP:
+                    stopping = True
+                else:
+                    batch.append(item)
+                if len(batch) >= self.batch_size:
+                    self._write(batch)
+                    batch = []
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch):
+        rows = []
+        for deck_name, front, back, status, status_code, tenant, created in batch:
+            front = normalize_card_text(front)
+            back = normalize_card_text(back)
+            deck = deck_name.lower()
+            rows.append(
+                (deck, front, back, card_hash(deck, front, back), created, status, status_code, tenant)
+            )
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "INSERT INTO cards (deck, front, back, hash, created, status, status_code, tenant) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            logger.exception("Could not write %d card ledger records", len(rows))
+
+    def search(
+        self, query=None, deck_name=None, status=None, content_hash=None, tenant=None, limit=20, cursor=None
+    ):
+        """
+        Search recorded cards, newest first
+
+        Args:
+            query (str, optional): Words that must all appear in the front or
+                back text; append * to a word for a prefix match
+            deck_name (str, optional): Only cards submitted to this deck
+            status (str, optional): Only cards with this status
+            content_hash (str, optional): Only cards with this card_hash()
+            tenant (str, optional): Only cards submitted by this client
+            limit (int): Maximum number of cards returned
+            cursor (int, optional): next_cursor of the previous page
+
+        Returns:
+            dict: A dictionary containing:
+                - cards (list): Matching cards as dictionaries
+                - next_cursor (int): Cursor of the next page, or None on the last page
+        """
+        clauses = []
+        params = []
+        # Rows are ordered by id; with a text query the FTS5 rowid (the same id)
+        # is used so SQLite can walk the full-text index in id order
+        key = "cards.id"
+        source = "cards"
+        if query and _match_expression(query):
+            key = "cards_fts.rowid"
+            source = "cards_fts JOIN cards ON cards.id = cards_fts.rowid"
+            clauses.append("cards_fts MATCH ?")
+            params.append(_match_expression(query))
+        if deck_name:
+            clauses.append("cards.deck = ?")
+            params.append(deck_name.lower())
+        if status:
+            clauses.append("cards.status = ?")
+            params.append(status)
+        if content_hash:
+            clauses.append("cards.hash = ?")
+            params.append(content_hash)
+        if tenant:
+            clauses.append("cards.tenant = ?")
+            params.append(tenant)
+        if cursor is not None:
+            # Keyset pagination: continue below the last id of the previous page
+            clauses.append(f"{key} < ?")
+            params.append(cursor)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        params.append(limit + 1)
+
+        rows = self._connect().execute(
+            f"SELECT {', '.join('cards.' + column for column in _COLUMNS)} "
+            f"FROM {source} {where} ORDER BY {key} DESC LIMIT ?",
+            params,
+        ).fetchall()
+
+        cards = [dict(zip(_COLUMNS, row)) for row in rows[:limit]]
+        next_cursor = cards[-1]["id"] if len(rows) > limit else None
+        return {"cards": cards, "next_cursor": next_cursor}
@@ -0,0 +1,123 @@
+"""
+Non-blocking logging for the Anki API.
+
+configure_logging() routes all log records through a queue to a background
+QueueListener thread, so formatting and handler I/O happen off the request
+path. Records are enqueued unformatted; %-style arguments are only rendered
+by the listener. Per-card logs (the "anki-api.cards" logger) can be sampled,
+and output can be plain text or one JSON object per line.
+"""
+
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import time
+
+CARD_LOGGER = "anki-api.cards"
+
+# Attributes every LogRecord has; anything else was passed via extra=
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as single-line JSON objects, including extra fields."""
+
+    def format(self, record):
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created))
+            + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Lets through a random share of records."""
+
+    def __init__(self, rate):
+        """
+        Args:
+            rate (float): Share of records kept, between 0 and 1
+        """
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return self.rate >= 1 or random.random() < self.rate
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that enqueues records without formatting them.
+
+    The standard QueueHandler renders the message in the calling thread; here
+    the listener thread does it, which is safe because records only travel
+    inside this process.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def configure_logging(level="INFO", json_output=False, card_log_sample_rate=1.0, stream=None):
+    """
+    Send all logging through a background thread
+
+    Args:
+        level (str): Root log level
+        json_output (bool): If True, write one JSON object per line
+        card_log_sample_rate (float): Share of per-card log records kept
+        stream: Output stream (defaults to stderr)
+
+    Returns:
+        QueueListener: The running listener; stop it with stop_logging()
+    """
+    global _listener
+    stop_logging()
+
+    handler = logging.StreamHandler(stream or sys.stderr)
+    if json_output:
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(
+            logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+        )
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for existing in [h for h in root.handlers if isinstance(h, DeferredQueueHandler)]:
+        root.removeHandler(existing)
+    root.addHandler(DeferredQueueHandler(log_queue))
+    root.setLevel(level)
+
+    card_logger = logging.getLogger(CARD_LOGGER)
+    for existing in [f for f in card_logger.filters if isinstance(f, SamplingFilter)]:
+        card_logger.removeFilter(existing)
+    if card_log_sample_rate < 1:
+        card_logger.addFilter(SamplingFilter(card_log_sample_rate))
+    # Skip building records at all when per-card logs are switched off
+    card_logger.disabled = card_log_sample_rate <= 0
+
+    _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def stop_logging():
+    """Flush queued records and stop the background listener."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
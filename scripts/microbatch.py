@@ -0,0 +1,79 @@
+"""
+Server-side micro-batching of single-card requests.
+
+Concurrent /add-card requests arriving within a few milliseconds of each other
+are collected into one batch, encoded in one pass and dispatched together
+through anki_api_v2.add_card_batch. Each waiting request gets its own result.
+"""
+
+import asyncio
+
+from starlette.concurrency import run_in_threadpool
+
+
+class MicroBatcher:
+    """
+    Collects single cards for up to `window` seconds or `max_batch` cards.
+    """
+
+    def __init__(self, send_batch, window=0.005, max_batch=64):
+        """
+        Args:
+            send_batch (callable): Blocking send_batch(cards) taking a list of
+                (front, back, deck_name, tenant) tuples and returning one
+                result per card, e.g. a partial of add_card_batch
+            window (float): Seconds to wait for more cards after the first one
+            max_batch (int): Batch size that triggers an immediate dispatch
+        """
+        self.send_batch = send_batch
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = []
+        self._timer = None
+        self._in_flight = set()
+
+    async def submit(self, front, back, deck_name, tenant=None):
+        """
+        Add a card to the current batch and wait for its result
+
+        Returns:
+            dict: This card's result, shaped like add_anki_card's
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append(((front, back, deck_name, tenant), future))
+
+        if len(self._pending) >= self.max_batch:
+            self._dispatch()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._dispatch)
+        return await future
+
+    async def drain(self):
+        """Dispatch the current batch and wait for all in-flight batches."""
+        self._dispatch()
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        task = asyncio.ensure_future(self._send(batch))
+        self._in_flight.add(task)
+        task.add_done_callback(self._in_flight.discard)
+
+    async def _send(self, batch):
+        try:
+            results = await run_in_threadpool(self.send_batch, [card for card, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
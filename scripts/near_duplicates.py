@@ -0,0 +1,332 @@
+"""
+Near-duplicate detection for submitted cards.
+
+Generated cards often come back as slight rewordings of cards that were
+already added. NearDuplicateIndex keeps a MinHash signature of the normalized
+front text of every added card in a local SQLite database and finds similar
+cards in the same deck with locality-sensitive hashing (LSH): signatures are
+cut into bands, and only cards sharing at least one band bucket are compared.
+A lookup is one indexed query plus a handful of signature comparisons, so it
+stays fast as the index grows. The number of bands is derived from the
+similarity threshold: lower thresholds need more, narrower bands to find
+their near-duplicates as candidates at all.
+
+Signatures use one-permutation hashing over character trigrams: each trigram
+is hashed once with blake2b (stable across processes and Python versions,
+unlike hash()) and only the minimum per hash bin is kept, which is far cheaper
+in pure Python than computing num_perm independent hashes.
+"""
+
+import hashlib
+import math
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from array import array
+
+from scripts.anki_api_v2 import normalize_card_text
+
+# Signature values are the top 32 bits of a trigram's 64-bit hash
+_VALUE_SHIFT = 32
+_EMPTY = 1 << 64
+
+_WORD_SEPARATORS = re.compile(r"[\W_]+")
+
+# Share of cards exactly at the threshold that must become candidates
+_MIN_RECALL = 0.9
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cards (
+    id INTEGER PRIMARY KEY,
+    deck TEXT NOT NULL,
+    front TEXT NOT NULL,
+    signature BLOB NOT NULL,
+    added REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS bands (
+    deck INTEGER NOT NULL,
+    band INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    card_id INTEGER NOT NULL,
+    PRIMARY KEY (deck, band, bucket, card_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS settings (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+def normalize_for_matching(text):
+    """
+    Reduce card text to lowercase words separated by single spaces
+
+    Args:
+        text (str): Card text
+
+    Returns:
+        str: The normalized text
+    """
+    return _WORD_SEPARATORS.sub(" ", normalize_card_text(text).lower()).strip()
+
+
+def _stable_hash(text):
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def lsh_recall(similarity, bands, rows):
+    """Probability that two cards with this similarity share a band bucket."""
+    return 1 - (1 - similarity ** rows) ** bands
+
+
+def bands_for_threshold(num_perm, threshold):
+    """
+    Choose the number of LSH bands for a similarity threshold
+
+    Args:
+        num_perm (int): Signature length
+        threshold (float): Similarity (0-1) at which cards must be found
+
+    Returns:
+        int: The fewest bands (fewest candidates to compare) that divide
+            num_perm and still find most cards at the threshold
+    """
+    for bands in range(1, num_perm + 1):
+        if num_perm % bands == 0 and lsh_recall(threshold, bands, num_perm // bands) >= _MIN_RECALL:
+            return bands
+    return num_perm
+
+
+def _shingles(text, size=3):
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+class NearDuplicateIndex:
+    """
+    Persistent MinHash/LSH index of card fronts, scoped per deck.
+    """
+
+    def __init__(self, path, num_perm=128, bands=None, threshold=0.8, max_candidates=32):
+        """
+        Args:
+            path (str): Path of the SQLite database file
+            num_perm (int): Signature length (hash bins)
+            bands (int, optional): LSH bands; num_perm must divide evenly.
+                More bands find less similar candidates at the cost of more
+                comparisons. By default an existing index keeps its bands
+                and a new one derives them from threshold
+            threshold (float): Default estimated Jaccard similarity (0-1) at
+                which a card counts as a near-duplicate
+            max_candidates (int): Upper bound on candidates compared per lookup
+
+        Raises:
+            ValueError: If threshold is below min_threshold for the bands
+        """
+        self.path = path
+        self._local = threading.local()
+        conn = self._connect()
+        conn.executescript(_SCHEMA)
+        if bands is None:
+            stored = dict(conn.execute("SELECT name, value FROM settings"))
+            if stored.get("num_perm") == num_perm:
+                bands = stored["bands"]
+            else:
+                bands = bands_for_threshold(num_perm, threshold)
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        # Lowest similarity whose cards still share a band bucket with
+        # _MIN_RECALL, rounded up to the precision it is reported with
+        lowest = (1 - (1 - _MIN_RECALL) ** (1 / bands)) ** (1 / self.rows)
+        self.min_threshold = math.ceil(lowest * 100) / 100
+        if threshold < self.min_threshold:
+            raise ValueError(
+                f"Threshold {threshold} is below {self.min_threshold:.2f}, the lowest "
+                f"that {bands} LSH bands find reliably"
+            )
+        self.threshold = threshold
+        self.max_candidates = max_candidates
+        self._probes = [
+            sorted(range(num_perm), key=lambda j, i=i: _stable_hash(f"{i}:{j}"))
+            for i in range(num_perm)
+        ]
+        self._check_settings(conn)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _check_settings(self, conn):
+        """Refuse to open an index built with a different signature layout."""
+        wanted = {"num_perm": self.num_perm, "bands": self.bands}
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            stored = dict(conn.execute("SELECT name, value FROM settings"))
+            if not stored:
+                conn.executemany("INSERT INTO settings VALUES (?, ?)", wanted.items())
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        if stored and stored != wanted:
+            raise ValueError(
+                f"Index at {self.path} was built with {stored}, not {wanted}"
+            )
+
+    def signature(self, text):
+        """
+        Compute the MinHash signature of a card's front text
+
+        Args:
+            text (str): Card text (normalized here)
+
+        Returns:
+            tuple: num_perm integers, or None if the text has no words
+        """
+        shingles = _shingles(normalize_for_matching(text))
+        if not shingles:
+            return None
+        num_perm = self.num_perm
+        bins = [_EMPTY] * num_perm
+        for shingle in shingles:
+            h = _stable_hash(shingle)
+            index = h % num_perm
+            value = h >> _VALUE_SHIFT
+            if value < bins[index]:
+                bins[index] = value
+
+        # Empty bins borrow the value of a filled bin, probing bins in a fixed
+        # pseudo-random order per bin so that neighbouring empty bins do not
+        # all copy the same value
+        if _EMPTY in bins:
+            dense = list(bins)
+            for i, value in enumerate(bins):
+                if value == _EMPTY:
+                    for j in self._probes[i]:
+                        value = bins[j]
+                        if value != _EMPTY:
+                            break
+                    dense[i] = value
+            bins = dense
+        return tuple(bins)
+
+    def _buckets(self, signature):
+        rows = self.rows
+        return [
+            (band, zlib.crc32(array("I", signature[band * rows:(band + 1) * rows]).tobytes()))
+            for band in range(self.bands)
+        ]
+
+    def find(self, front, deck_name, threshold=None, signature=None):
+        """
+        Find the most similar indexed card in the same deck
+
+        Args:
+            front (str): Front text of the new card
+            deck_name (str): Deck of the new card
+            threshold (float, optional): Minimum similarity; defaults to the
+                index's and must not be below min_threshold
+            signature (tuple, optional): Precomputed signature of front
+
+        Returns:
+            dict: id and similarity of the closest card at or above the
+                threshold, or None if there is none
+
+        Raises:
+            ValueError: If threshold is below min_threshold
+        """
+        if threshold is None:
+            threshold = self.threshold
+        elif threshold < self.min_threshold:
+            raise ValueError(f"Threshold must be at least {self.min_threshold:.2f}")
+        signature = signature or self.signature(front)
+        if signature is None:
+            return None
+
+        deck_key = zlib.crc32(deck_name.lower().encode("utf-8"))
+        params = []
+        for band, bucket in self._buckets(signature):
+            params.extend((deck_key, band, bucket))
+        params.append(self.max_candidates)
+        # One primary key lookup per band (SQLite does not use the index for a
+        # row-value IN list); cards sharing the most bands are compared first
+        candidates = self._connect().execute(
+            "SELECT id, signature FROM cards JOIN ("
+            "  SELECT card_id, COUNT(*) AS shared FROM ("
+            + " UNION ALL ".join(
+                ["SELECT card_id FROM bands WHERE deck = ? AND band = ? AND bucket = ?"]
+                * self.bands
+            )
+            + ") GROUP BY card_id ORDER BY shared DESC LIMIT ?"
+            ") ON id = card_id",
+            params,
+        ).fetchall()
+
+        best = None
+        for card_id, blob in candidates:
+            stored = array("I")
+            stored.frombytes(blob)
+            similarity = sum(a == b for a, b in zip(signature, stored)) / self.num_perm
+            if similarity >= threshold and (best is None or similarity > best["similarity"]):
+                best = {"id": card_id, "similarity": similarity}
+        return best
+
+    def add(self, front, deck_name, signature=None):
+        """
+        Index an added card
+
+        Args:
+            front (str): Front text of the card
+            deck_name (str): Deck of the card
+            signature (tuple, optional): Precomputed signature of front
+        """
+        self.add_many([(front, deck_name, signature)])
+
+    def add_many(self, cards):
+        """
+        Index several added cards in one transaction
+
+        Args:
+            cards (list): (front, deck_name) or (front, deck_name, signature) tuples
+        """
+        entries = []
+        for card in cards:
+            front, deck_name = card[0], card[1]
+            signature = (card[2] if len(card) > 2 else None) or self.signature(front)
+            if signature is not None:
+                entries.append((front, deck_name.lower(), signature))
+        if not entries:
+            return
+
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for front, deck, signature in entries:
+                card_id = conn.execute(
+                    "INSERT INTO cards (deck, front, signature, added) VALUES (?, ?, ?, ?)",
+                    (deck, front, array("I", signature).tobytes(), now),
+                ).lastrowid
+                deck_key = zlib.crc32(deck.encode("utf-8"))
+                conn.executemany(
+                    "INSERT OR IGNORE INTO bands VALUES (?, ?, ?, ?)",
+                    [(deck_key, band, bucket, card_id) for band, bucket in self._buckets(signature)],
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM cards").fetchone()[0]
@@ -0,0 +1,113 @@
+"""
+Local index of the note ids AnkiWeb assigned to added cards.
+
+Every successfully added card whose response carried a note id is stored
+under its client key and content hash (see ledger.card_hash), so a client can
+later fix a card by sending its old and new text: the note id is looked up
+here and the note is updated in place instead of a duplicate being added.
+"""
+
+import sqlite3
+import threading
+import time
+
+from scripts.anki_api_v2 import normalize_card_text
+from scripts.ledger import card_hash
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS notes (
+    client TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    note_id INTEGER NOT NULL,
+    deck TEXT NOT NULL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (client, hash)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS notes_note_id ON notes (note_id);
+"""
+
+
+def content_hash(deck_name, front, back):
+    """Hash of a card's normalized content, as stored in the index."""
+    return card_hash(deck_name, normalize_card_text(front), normalize_card_text(back))
+
+
+class NoteIndex:
+    """
+    SQLite map of (client key, content hash) to note id.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): Path of the SQLite database file
+        """
+        self.path = path
+        self._local = threading.local()
+        self._connect().executescript(_SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def record_many(self, client, cards):
+        """
+        Store the note ids of added cards in one transaction
+
+        Args:
+            client (str): Client key the cards belong to
+            cards (list): (front, back, deck_name, note_id) tuples
+        """
+        now = time.time()
+        rows = [
+            (client, content_hash(deck_name, front, back), note_id, deck_name.lower(), now)
+            for front, back, deck_name, note_id in cards
+        ]
+        if not rows:
+            return
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("INSERT OR REPLACE INTO notes VALUES (?, ?, ?, ?, ?)", rows)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def lookup(self, client, deck_name, front, back):
+        """
+        Find the note id of a card added by a client
+
+        Returns:
+            int: The note id, or None if the card is not in the index
+        """
+        row = self._connect().execute(
+            "SELECT note_id FROM notes WHERE client = ? AND hash = ?",
+            (client, content_hash(deck_name, front, back)),
+        ).fetchone()
+        return row[0] if row else None
+
+    def replace(self, client, note_id, deck_name, front, back):
+        """
+        Re-key a note after its text was updated
+
+        Entries of the note under its old content are removed, so the old
+        text no longer resolves to it.
+        """
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM notes WHERE client = ? AND note_id = ?", (client, note_id))
+            conn.execute(
+                "INSERT OR REPLACE INTO notes VALUES (?, ?, ?, ?, ?)",
+                (client, content_hash(deck_name, front, back), note_id, deck_name.lower(), time.time()),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
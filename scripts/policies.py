@@ -0,0 +1,10 @@
+"""
+Request policy names shared by the request decoders and the handlers.
+
+Kept free of other imports so that the JSON codec can validate requests
+without loading the upstream client.
+"""
+
+# What to do with near-duplicates of added cards: skip them, add and flag
+# them, or add them without checking
+DUPLICATE_POLICIES = ("skip", "flag", "force")
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Pre-encode large card files into a spool of ready-to-send payloads.
+
+For imports of millions of rows, parsing, normalizing and encoding once up
+front keeps that CPU work off the sending path. The input file is
+memory-mapped and split into line-aligned chunks, which a process pool turns
+into encoded payloads. The output is a spool directory in the format of
+spool.py (one segment per chunk, records framed by encode_record), plus an
+index file holding the (segment, offset) of every record as big-endian
+uint32/uint64 pairs. The sender replays the spool at the upstream rate limit
+with the retries and resumable cursor of SpoolReplayer.
+
+Input files have one card per line: front,back[,deck_name]. Fields may be
+quoted, but must not contain line breaks.
+
+Usage:
+    python -m scripts.preencode encode cards.csv cards.spool --workers 8
+    python -m scripts.preencode send cards.spool --rate 5
+    python -m scripts.preencode send cards.spool --rate 5 --skip 120000
+"""
+
+import argparse
+import csv
+import io
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from scripts.anki_api_v2 import (
+    encode_card_payload,
+    get_default_cookie,
+    normalize_card_text,
+    send_payload,
+    set_default_cookie,
+)
+from scripts.shared_state import LocalState, SharedState
+from scripts.spool import SEGMENT_SUFFIX, Spool, SpoolReplayer, encode_record
+
+INDEX_FILE = "index"
+INDEX_ENTRY = struct.Struct(">IQ")
+
+
+def chunk_bounds(data, chunk_bytes):
+    """
+    Split a buffer into line-aligned chunks
+
+    Args:
+        data (bytes or mmap): The input
+        chunk_bytes (int): Approximate chunk size; chunks end after the first
+            line break at or past it
+
+    Returns:
+        list: (start, end) offsets
+    """
+    bounds = []
+    start = 0
+    size = len(data)
+    while start < size:
+        newline = data.find(b"\n", min(start + chunk_bytes, size) - 1)
+        end = size if newline == -1 else newline + 1
+        bounds.append((start, end))
+        start = end
+    return bounds
+
+
+def encode_chunk(path, start, end, default_deck="default", delimiter=","):
+    """
+    Normalize and encode the cards in one chunk of the input; runs in a worker process
+
+    Args:
+        path (str): Input file
+        start (int): Offset of the chunk's first line
+        end (int): Offset just past the chunk's last line
+        default_deck (str): Deck for rows without a deck name
+        delimiter (str): Field delimiter
+
+    Returns:
+        tuple: (records, offsets, skipped): the framed records, the offset of
+            each record within them as array("Q") bytes, and the number of
+            rows without front and back
+    """
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        text = data[start:end].decode("utf-8")
+
+    records = bytearray()
+    offsets = array("Q")
+    skipped = 0
+    # Only line endings end a row; splitlines() would also split on form feeds,
+    # U+2028 and other characters that may appear inside card text
+    for row in csv.reader(io.StringIO(text, newline=""), delimiter=delimiter):
+        if len(row) < 2:
+            skipped += bool(row)
+            continue
+        deck_name = row[2] if len(row) > 2 and row[2] else default_deck
+        payload = encode_card_payload(
+            normalize_card_text(row[0]), normalize_card_text(row[1]), deck_name
+        )
+        offsets.append(len(records))
+        records += encode_record(payload)
+    return bytes(records), offsets.tobytes(), skipped
+
+
+def preencode(input_path, spool_dir, default_deck="default", workers=None, chunk_bytes=4 << 20, delimiter=","):
+    """
+    Encode a card file into a new spool directory
+
+    Args:
+        input_path (str): Input file with front,back[,deck_name] lines
+        spool_dir (str): Output spool directory; must not hold segments yet
+        default_deck (str): Deck for rows without a deck name
+        workers (int, optional): Worker processes; defaults to the CPU count
+        chunk_bytes (int): Approximate input bytes per chunk (and segment)
+        delimiter (str): Field delimiter
+
+    Returns:
+        dict: Numbers of records, segments, skipped rows and payload bytes
+    """
+    os.makedirs(spool_dir, exist_ok=True)
+    if any(name.endswith(SEGMENT_SUFFIX) for name in os.listdir(spool_dir)):
+        raise ValueError(f"Spool directory '{spool_dir}' is not empty")
+
+    with open(input_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            bounds = []
+        else:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                bounds = chunk_bounds(data, chunk_bytes)
+
+    summary = {"records": 0, "segments": 0, "skipped": 0, "bytes": 0}
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(workers) as pool, open(os.path.join(spool_dir, INDEX_FILE), "wb") as index:
+
+        def write(result):
+            records, offsets, skipped = result
+            summary["skipped"] += skipped
+            if not records:
+                return
+            seq = summary["segments"] + 1
+            path = os.path.join(spool_dir, f"{seq:010d}{SEGMENT_SUFFIX}")
+            with open(path + ".tmp", "wb") as segment:
+                segment.write(records)
+            os.replace(path + ".tmp", path)
+            offsets = array("Q", offsets)
+            index.write(b"".join(INDEX_ENTRY.pack(seq, offset) for offset in offsets))
+            summary["segments"] = seq
+            summary["records"] += len(offsets)
+            summary["bytes"] += len(records)
+
+        # Results are written in input order; at most two chunks per worker are
+        # in flight so memory stays bounded on huge inputs
+        pending = deque()
+        for start, end in bounds:
+            pending.append(pool.submit(encode_chunk, input_path, start, end, default_deck, delimiter))
+            if len(pending) >= 2 * workers:
+                write(pending.popleft().result())
+        while pending:
+            write(pending.popleft().result())
+    return summary
+
+
+def index_position(spool_dir, record):
+    """
+    Look up the spool position of a record in the index
+
+    Args:
+        spool_dir (str): Spool directory written by preencode
+        record (int): Zero-based record number
+
+    Returns:
+        tuple: (segment, offset), as used by Spool.ack
+    """
+    with open(os.path.join(spool_dir, INDEX_FILE), "rb") as index:
+        index.seek(record * INDEX_ENTRY.size)
+        entry = index.read(INDEX_ENTRY.size)
+    if len(entry) < INDEX_ENTRY.size:
+        raise ValueError(f"Spool '{spool_dir}' has no record {record}")
+    return INDEX_ENTRY.unpack(entry)
+
+
+def send_spool(spool_dir, rate, burst=1.0, skip=None, state=None, progress_interval=10.0):
+    """
+    Deliver a pre-encoded spool at a fixed rate
+
+    Acknowledged records are remembered in the spool's cursor, so an
+    interrupted run continues where it stopped.
+
+    Args:
+        spool_dir (str): Spool directory written by preencode
+        rate (float): Payloads per second (0 for no limit)
+        burst (float): Payloads that may be sent at once
+        skip (int, optional): Start at this record number instead of the cursor
+        state (optional): LocalState or SharedState holding the rate limiter;
+            a SharedState shares the "upstream" budget with running API workers
+        progress_interval (float): Seconds between progress lines
+
+    Returns:
+        dict: The replayer's stats
+    """
+    spool = Spool(spool_dir)
+    if skip is not None:
+        spool.ack(index_position(spool_dir, skip))
+    limiter = None
+    if rate > 0:
+        limiter = (state or LocalState()).rate_limiter("upstream", rate, burst)
+    replayer = SpoolReplayer(
+        [spool], send_payload, limiter=limiter, cookie_provider=get_default_cookie
+    )
+
+    done = threading.Event()
+
+    def report():
+        started = time.monotonic()
+        while not done.wait(progress_interval):
+            stats = replayer.stats
+            elapsed = time.monotonic() - started
+            print(
+                f"  delivered {stats['delivered']}, dropped {stats['dropped']}, "
+                f"retries {stats['retries']} ({stats['delivered'] / elapsed:.1f}/s)"
+            )
+
+    reporter = threading.Thread(target=report, daemon=True)
+    reporter.start()
+    try:
+        replayer.drain(spool)
+    finally:
+        done.set()
+        spool.close()
+    return replayer.stats
+
+
+def main():
+    """Main function."""
+    parser = argparse.ArgumentParser(description="Pre-encode and send large card files")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    encode = commands.add_parser("encode", help="Encode a card file into a spool directory")
+    encode.add_argument("input", help="File with front,back[,deck_name] lines")
+    encode.add_argument("spool_dir", help="Spool directory to create")
+    encode.add_argument("--deck", default="default", help="Deck for rows without a deck name")
+    encode.add_argument("--workers", type=int, help="Worker processes (default: CPU count)")
+    encode.add_argument("--chunk-mb", type=float, default=4, help="Input megabytes per chunk")
+    encode.add_argument("--delimiter", default=",", help="Field delimiter, e.g. '\\t'")
+
+    send = commands.add_parser("send", help="Deliver a spool directory at a fixed rate")
+    send.add_argument("spool_dir", help="Spool directory written by 'encode'")
+    send.add_argument("--rate", type=float, default=1.0, help="Payloads per second (0 = unlimited)")
+    send.add_argument("--burst", type=float, default=1.0, help="Payloads sent at once")
+    send.add_argument("--skip", type=int, help="Start at this record number")
+    send.add_argument(
+        "--state-db",
+        default=os.getenv("ANKI_STATE_DB"),
+        help="Shared state database, to share the upstream rate budget with the API",
+    )
+    args = parser.parse_args()
+
+    if args.command == "encode":
+        started = time.monotonic()
+        summary = preencode(
+            args.input,
+            args.spool_dir,
+            default_deck=args.deck,
+            workers=args.workers,
+            chunk_bytes=int(args.chunk_mb * (1 << 20)),
+            delimiter=args.delimiter.encode().decode("unicode_escape"),
+        )
+        elapsed = time.monotonic() - started
+        print(
+            f"Encoded {summary['records']} cards into {summary['segments']} segments "
+            f"({summary['bytes']} bytes) in {elapsed:.1f}s; skipped {summary['skipped']} rows"
+        )
+    else:
+        if os.getenv("ANKI_COOKIE"):
+            set_default_cookie(os.getenv("ANKI_COOKIE"))
+        state = SharedState(args.state_db) if args.state_db else None
+        stats = send_spool(args.spool_dir, args.rate, args.burst, args.skip, state)
+        print(
+            f"Delivered {stats['delivered']}, dropped {stats['dropped']}, "
+            f"retries {stats['retries']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+"""
+On-demand request profiling.
+
+Two profilers are available:
+
+- "sample" (the default): a background thread samples the stacks of all
+  other threads at a fixed interval, which also covers work run in the thread
+  pool, such as upstream calls; saved as collapsed stacks (.folded), the input
+  format of flamegraph tools.
+- "cprofile": deterministic profiling with cProfile of the thread handling the
+  request (the event loop thread) only; saved as a .pstats file.
+
+Neither profiler can tell requests apart: a profile covers everything the
+process (sample) or the event loop (cprofile) did while the request was
+handled, including other requests served at the same time. The scope is part
+of the profile name and of the X-Profile-Scope response header, so profiles
+are best taken while the server is otherwise quiet.
+
+Profiles are kept in a bounded on-disk ring managed by ProfileStore.
+ProfilingMiddleware stops profiling when the last response body message is
+sent, so streamed responses are covered to their end, and writes the profile
+from the thread pool.
+"""
+
+import cProfile
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse
+
+PROFILE_MODES = ("sample", "cprofile")
+
+# What each profiler sees besides the profiled request
+PROFILE_SCOPES = {"sample": "process", "cprofile": "event-loop"}
+
+_NAME_PATTERN = re.compile(r"^[0-9]+-[0-9a-z_-]+\.(pstats|folded)$")
+
+
+class ProfileStore:
+    """
+    Directory holding the most recent profiles, oldest deleted first.
+    """
+
+    def __init__(self, directory, max_profiles=50):
+        """
+        Args:
+            directory (str): Directory to write profiles to (created if missing)
+            max_profiles (int): Number of profiles kept
+        """
+        self.directory = directory
+        self.max_profiles = max_profiles
+        self._lock = threading.Lock()
+        self._sequence = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def new_path(self, label, mode):
+        """
+        Reserve a file path for a new profile
+
+        Args:
+            label (str): Short description, e.g. the request path
+            mode (str): "cprofile" or "sample"
+
+        Returns:
+            str: Path to write the profile to
+        """
+        extension = "pstats" if mode == "cprofile" else "folded"
+        slug = re.sub(r"[^0-9a-z_-]+", "_", label.lower()).strip("_")[:60] or "root"
+        with self._lock:
+            self._sequence += 1
+            name = f"{time.time_ns() // 1000}{self._sequence % 1000:03d}-{slug}.{extension}"
+        return os.path.join(self.directory, name)
+
+    def prune(self):
+        """Delete the oldest profiles beyond max_profiles."""
+        with self._lock:
+            names = sorted(name for name in os.listdir(self.directory) if _NAME_PATTERN.match(name))
+            for name in names[: max(0, len(names) - self.max_profiles)]:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+
+    def list(self):
+        """
+        List the stored profiles, newest first
+
+        Returns:
+            list: Dictionaries with name, size_bytes and created (Unix time)
+        """
+        profiles = []
+        for name in os.listdir(self.directory):
+            if not _NAME_PATTERN.match(name):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            profiles.append(
+                {"name": name, "size_bytes": stat.st_size, "created": stat.st_mtime}
+            )
+        profiles.sort(key=lambda profile: profile["name"], reverse=True)
+        return profiles
+
+    def path_for(self, name):
+        """
+        Get the path of a stored profile
+
+        Returns:
+            str: The path, or None if the name is invalid or the profile is gone
+        """
+        if not _NAME_PATTERN.match(name):
+            return None
+        path = os.path.join(self.directory, name)
+        return path if os.path.exists(path) else None
+
+
+class StackSampler:
+    """
+    Samples the stacks of all other threads and counts collapsed stacks.
+    """
+
+    def __init__(self, interval=0.001):
+        """
+        Args:
+            interval (float): Seconds between samples
+        """
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start sampling."""
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling."""
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        names = {}
+        while True:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                if thread_id not in names:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(stack))] += 1
+            if self._stop.wait(self.interval):
+                return
+
+    def write(self, path):
+        """Write the collapsed stacks to a file."""
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class RequestProfiler:
+    """
+    Profiles one request at a time and stores the result.
+
+    Only one request is profiled at once; a request asking for a profile while
+    another is running is served without one.
+    """
+
+    def __init__(self, store, sample_interval=0.001):
+        """
+        Args:
+            store (ProfileStore): Where profiles are written
+            sample_interval (float): Seconds between samples in "sample" mode
+        """
+        self.store = store
+        self.sample_interval = sample_interval
+        self._busy = threading.Lock()
+
+    def try_begin(self, mode, label):
+        """
+        Start profiling if no other profile is running
+
+        Args:
+            mode (str): "cprofile" or "sample"
+            label (str): Short description of the request
+
+        Returns:
+            tuple: (mode, profiler, path) to pass to stop() and save(), or
+                None if busy; the path is reserved for the profile
+        """
+        if not self._busy.acquire(blocking=False):
+            return None
+        path = self.store.new_path(f"{PROFILE_SCOPES[mode]}-{label}", mode)
+        if mode == "cprofile":
+            profiler = cProfile.Profile()
+            profiler.enable()
+        else:
+            profiler = StackSampler(self.sample_interval)
+            profiler.start()
+        return mode, profiler, path
+
+    def stop(self, handle):
+        """Stop profiling; must run on the thread that called try_begin()."""
+        mode, profiler, _ = handle
+        try:
+            if mode == "cprofile":
+                profiler.disable()
+            else:
+                profiler.stop()
+        finally:
+            self._busy.release()
+
+    def save(self, handle):
+        """
+        Write a stopped profile; does file I/O, so keep it off the event loop
+
+        Returns:
+            str: File name of the stored profile
+        """
+        mode, profiler, path = handle
+        if mode == "cprofile":
+            profiler.dump_stats(path)
+        else:
+            profiler.write(path)
+        self.store.prune()
+        return os.path.basename(path)
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware profiling the requests select_mode picks.
+    """
+
+    def __init__(self, app, profiler, select_mode):
+        """
+        Args:
+            app: The wrapped ASGI app
+            profiler (RequestProfiler): Profiler and store to use
+            select_mode (callable): Called with the request Headers; returns
+                the mode to profile with or None, and raises ValueError for
+                an invalid request, which is answered with a 400
+        """
+        self.app = app
+        self.profiler = profiler
+        self.select_mode = select_mode
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        try:
+            mode = self.select_mode(Headers(scope=scope))
+        except ValueError as e:
+            await JSONResponse(status_code=400, content={"detail": str(e)})(scope, receive, send)
+            return
+        handle = self.profiler.try_begin(mode, f"{scope['method']}-{scope['path']}") if mode else None
+        if handle is None:
+            await self.app(scope, receive, send)
+            return
+
+        stopped = False
+
+        async def finish():
+            nonlocal stopped
+            if stopped:
+                return
+            stopped = True
+            self.profiler.stop(handle)
+            await run_in_threadpool(self.profiler.save, handle)
+
+        async def profiled_send(message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(raw=message["headers"])
+                headers["X-Profile-Id"] = os.path.basename(handle[2])
+                headers["X-Profile-Scope"] = PROFILE_SCOPES[handle[0]]
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                # The response is complete once its last body message goes out
+                await finish()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, profiled_send)
+        finally:
+            await finish()
@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+Replay recorded API traffic for capacity planning.
+
+Plays a recording written by scripts/traffic.py against a running instance
+or the in-process app, at the recorded pace or N times faster, sending
+synthetic cards with the recorded decks, sizes, batch sizes, encodings and
+client spread. Reports throughput and latency percentiles per endpoint next
+to the latencies seen when the traffic was recorded. A local fake upstream
+that answers like AnkiWeb after a fixed delay can be started, so runs
+measure the service and not AnkiWeb.
+
+Usage:
+    ANKI_TRAFFIC_RECORD_FILE=traffic.jsonl python main.py
+    python -m scripts.replay_traffic traffic.jsonl --in-process --speed 4 \
+        --fake-upstream --upstream-latency-ms 80
+
+To size a multi-worker server, start the fake upstream on a fixed port and
+point the server at it:
+    ANKI_UPSTREAM_URL=http://127.0.0.1:9000/ python main.py --workers 4
+    python -m scripts.replay_traffic traffic.jsonl --url http://localhost:8000 \
+        --fake-upstream --fake-upstream-port 9000 --speed 10
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from scripts import anki_api_v2
+from scripts.anki_api_v2 import encode_card_payload, frame_payloads, get_deck_suffix
+from scripts.latency import LatencyHistogram
+from scripts.test_api import BASE_URL, LoadStats, print_report
+from scripts.traffic import SINGLE_CARD_PATHS
+
+
+def load_recording(path):
+    """
+    Read a recording, ordered by start time
+
+    Returns:
+        list: The recorded entries
+    """
+    entries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                entries.append(json.loads(line))
+    entries.sort(key=lambda entry: entry["ts"])
+    return entries
+
+
+_FILLER = "the quick brown fox jumps over the lazy dog and keeps running through the field "
+
+
+class ReplayRequestFactory:
+    """Builds a request with synthetic cards for each recorded entry."""
+
+    def __init__(self, producer_token=None, bulk_delay=None):
+        """
+        Args:
+            producer_token (str, optional): X-Producer-Token for raw payloads
+            bulk_delay (float, optional): Replaces the recorded delay of bulk requests
+        """
+        self.producer_token = producer_token
+        self.bulk_delay = bulk_delay
+        self.sequence = 0
+
+    def _text(self, size):
+        # Numbered, so replayed cards are not taken for duplicates
+        self.sequence += 1
+        text = f"{self.sequence} "
+        while len(text) < size:
+            text += _FILLER
+        return text[:max(size, 1)]
+
+    def _payload(self, deck_name, size):
+        deck_name = deck_name or "default"
+        suffix = get_deck_suffix(deck_name) or get_deck_suffix("default")
+        front_size = size - len(suffix) - 5
+        front_size -= 1 if front_size >= 128 else 0
+        return encode_card_payload(self._text(max(front_size, 1)), "b", deck_name)
+
+    def build(self, entry):
+        """
+        Return (method, path, headers, content) for a recorded entry
+        """
+        headers = {"X-Client-Id": entry.get("client", "replay")}
+        if entry.get("stream"):
+            headers["Accept"] = entry["stream"]
+        path = entry["path"]
+        content = None
+        if "cards" in entry:
+            cards = [
+                {"front": self._text(front), "back": self._text(back), "deck_name": deck_name}
+                for deck_name, front, back in entry["cards"]
+            ]
+            if path in SINGLE_CARD_PATHS:
+                body = dict(cards[0])
+                if path == "/update-card":
+                    body["note_id"] = self.sequence
+            else:
+                delay = entry.get("delay", 0.0) if self.bulk_delay is None else self.bulk_delay
+                body = {"cards": cards, "delay": delay}
+            content = json.dumps(body).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+        elif "payloads" in entry:
+            content = frame_payloads(
+                [self._payload(deck_name, size) for deck_name, size in entry["payloads"]]
+            )
+            headers["Content-Type"] = "application/octet-stream"
+            if self.producer_token:
+                headers["X-Producer-Token"] = self.producer_token
+        elif entry["method"] != "GET":
+            content = b"x" * entry.get("bytes", 0)
+
+        if content is not None and entry.get("encoding") in ("gzip", "deflate"):
+            content = gzip.compress(content) if entry["encoding"] == "gzip" else zlib.compress(content)
+            headers["Content-Encoding"] = entry["encoding"]
+        return entry["method"], path, headers, content
+
+
+def _note_id_response(note_id):
+    """Build an add-or-update response: field 1 holds the note id as a varint."""
+    body = bytearray(b"\x08")
+    while note_id > 0x7F:
+        body.append((note_id & 0x7F) | 0x80)
+        note_id >>= 7
+    body.append(note_id)
+    return bytes(body)
+
+
+class FakeUpstream:
+    """
+    Local stand-in for AnkiWeb: answers every POST with a new note id after a
+    fixed delay, and every GET (the readiness probe) with 200.
+    """
+
+    def __init__(self, latency_ms=0.0, port=0):
+        """
+        Args:
+            latency_ms (float): Delay before each POST is answered
+            port (int): Port to listen on; 0 picks a free one
+        """
+        fake = self
+        self.latency = latency_ms / 1000
+        self.requests = 0
+        self._lock = threading.Lock()
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                if fake.latency:
+                    time.sleep(fake.latency)
+                with fake._lock:
+                    fake.requests += 1
+                    note_id = fake.requests
+                self._reply(_note_id_response(note_id))
+
+            def do_GET(self):
+                self._reply(b"")
+
+            def _reply(self, body):
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}/"
+        self._thread = None
+
+    def start(self):
+        """Start serving in a background thread."""
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-upstream", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop serving."""
+        self._server.shutdown()
+        self._server.server_close()
+
+
+async def replay(client, entries, factory, stats, speed=1.0, concurrency=64):
+    """
+    Send recorded requests at their recorded offsets, divided by speed
+
+    Latency is measured from each request's scheduled start, so time spent
+    waiting for a free slot counts (no coordinated omission).
+
+    Returns:
+        float: Seconds the replay took
+    """
+    limit = asyncio.Semaphore(concurrency)
+    tasks = set()
+    first = entries[0]["ts"]
+    start = time.perf_counter()
+
+    async def send(entry, intended_start):
+        method, path, headers, content = factory.build(entry)
+        async with limit:
+            error = None
+            try:
+                response = await client.request(method, path, headers=headers, content=content)
+                if response.status_code >= 400:
+                    error = f"HTTP {response.status_code}"
+            except Exception as e:
+                error = type(e).__name__
+            stats.record(path, time.perf_counter() - intended_start, error)
+
+    for entry in entries:
+        intended_start = start + (entry["ts"] - first) / speed
+        now = time.perf_counter()
+        if intended_start > now:
+            await asyncio.sleep(intended_start - now)
+        task = asyncio.create_task(send(entry, intended_start))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    if tasks:
+        await asyncio.gather(*tasks)
+    return time.perf_counter() - start
+
+
+def recorded_latency(entries):
+    """
+    Summarize the latencies in a recording
+
+    Returns:
+        dict: Path to LatencyHistogram.summary()
+    """
+    histograms = {}
+    for entry in entries:
+        histograms.setdefault(entry["path"], LatencyHistogram()).record(entry["duration_ms"] * 1000)
+    return {path: histogram.summary() for path, histogram in sorted(histograms.items())}
+
+
+async def run_replay(args):
+    """Replay a recording and return the report."""
+    import httpx
+
+    entries = load_recording(args.recording)
+    if not entries:
+        raise SystemExit(f"No requests in {args.recording}")
+
+    fake = None
+    if args.fake_upstream:
+        fake = FakeUpstream(args.upstream_latency_ms, args.fake_upstream_port)
+        fake.start()
+        print(f"Fake upstream listening on {fake.url}")
+        if args.in_process:
+            anki_api_v2.UPSTREAM_URL = fake.url
+            anki_api_v2.PROBE_URL = fake.url
+
+    factory = ReplayRequestFactory(
+        args.producer_token or os.getenv("ANKI_PRODUCER_TOKEN"), args.bulk_delay
+    )
+    stats = LoadStats()
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    try:
+        if args.in_process:
+            from main import app
+
+            # ASGITransport does not run the lifespan, which starts the scheduler
+            async with app.router.lifespan_context(app):
+                async with httpx.AsyncClient(
+                    base_url="http://in-process", transport=httpx.ASGITransport(app=app),
+                    limits=limits, timeout=args.timeout,
+                ) as client:
+                    elapsed = await replay(client, entries, factory, stats, args.speed, args.concurrency)
+        else:
+            async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.timeout) as client:
+                elapsed = await replay(client, entries, factory, stats, args.speed, args.concurrency)
+    finally:
+        if fake is not None:
+            fake.stop()
+
+    recorded_span = entries[-1]["ts"] - entries[0]["ts"]
+    config = {
+        "recording": args.recording,
+        "target": "in-process" if args.in_process else args.url,
+        "speed": args.speed,
+        "concurrency": args.concurrency,
+        "recorded_span_s": round(recorded_span, 3),
+        "recorded_rps": round(len(entries) / recorded_span, 2) if recorded_span else None,
+        "upstream_latency_ms": args.upstream_latency_ms if fake is not None else None,
+        "upstream_requests": fake.requests if fake is not None else None,
+    }
+    report = stats.report(elapsed, config)
+    report["recorded_latency"] = recorded_latency(entries)
+    return report
+
+
+def parse_args(argv=None):
+    """Parse the command line."""
+    parser = argparse.ArgumentParser(description="Replay recorded API traffic")
+    parser.add_argument("recording", help="JSON lines file written by the recorder")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--url", default=BASE_URL, help="Base URL of a running instance")
+    target.add_argument(
+        "--in-process", action="store_true", help="Drive the ASGI app from main.py directly"
+    )
+    parser.add_argument(
+        "--speed", type=float, default=1.0, help="Replay this many times faster than recorded"
+    )
+    parser.add_argument("--concurrency", type=int, default=64, help="Maximum requests in flight")
+    parser.add_argument(
+        "--fake-upstream", action="store_true", help="Start a local fake AnkiWeb for the run"
+    )
+    parser.add_argument(
+        "--fake-upstream-port", type=int, default=0,
+        help="Port of the fake upstream, for a server started with ANKI_UPSTREAM_URL pointing at it",
+    )
+    parser.add_argument(
+        "--upstream-latency-ms", type=float, default=0.0, help="Delay of each fake upstream response"
+    )
+    parser.add_argument(
+        "--bulk-delay", type=float, help="Send bulk requests with this delay instead of the recorded one"
+    )
+    parser.add_argument(
+        "--producer-token", help="X-Producer-Token for raw payloads (default: ANKI_PRODUCER_TOKEN)"
+    )
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout")
+    parser.add_argument("--json-out", help="Write the JSON report to this file ('-' for stdout)")
+    args = parser.parse_args(argv)
+    if args.speed <= 0:
+        parser.error("--speed must be positive")
+    return args
+
+
+def main():
+    """Main function."""
+    args = parse_args()
+    report = asyncio.run(run_replay(args))
+    if args.json_out == "-":
+        json.dump(report, sys.stdout, indent=2)
+    else:
+        print_report(report)
+        print(
+            f"Recorded {report['config']['recorded_rps']} req/s, "
+            f"replayed at {args.speed:g}x: {report['throughput_rps']} req/s"
+        )
+        if args.json_out:
+            with open(args.json_out, "w") as f:
+                json.dump(report, f, indent=2)
+    sys.exit(1 if report["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""
+Priority-aware fair scheduler in front of the upstream transport.
+
+Encoded payloads are submitted to one of two lanes:
+
+- "interactive": single cards from /add-card, served first
+- "bulk": cards from /add-multiple-cards and background imports
+
+Inside a lane, tenants are served with deficit round robin in proportion to
+their weights, and each tenant's turns go round-robin over the decks it has
+payloads for. One large import therefore cannot crowd out other tenants, and
+spreading it over many decks does not earn a tenant a larger share. Bulk
+traffic is protected from starvation: a bulk payload is dispatched when the
+oldest one has waited longer than bulk_max_wait, or after interactive_burst
+interactive payloads in a row.
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+LANES = ("interactive", "bulk")
+
+
+class _Tenant:
+    """One tenant's payloads, one queue per deck, served round-robin."""
+
+    def __init__(self):
+        self.decks = {}
+        self.active = deque()
+
+    def push(self, deck, item):
+        queue = self.decks.get(deck)
+        if queue is None:
+            queue = self.decks[deck] = deque()
+            self.active.append(deck)
+        queue.append(item)
+
+    def pop(self):
+        deck = self.active.popleft()
+        queue = self.decks[deck]
+        item = queue.popleft()
+        if queue:
+            self.active.append(deck)
+        else:
+            del self.decks[deck]
+        return item
+
+
+class _Lane:
+    """Queue of tenants served with deficit round robin."""
+
+    def __init__(self, weight_for):
+        self.weight_for = weight_for
+        self.tenants = {}
+        self.active = deque()
+        self.deficit = {}
+        self.size = 0
+
+    def push(self, tenant, deck, item):
+        queue = self.tenants.get(tenant)
+        if queue is None:
+            queue = self.tenants[tenant] = _Tenant()
+            self.active.append(tenant)
+            self.deficit[tenant] = 0.0
+        queue.push(deck, item)
+        self.size += 1
+
+    def oldest_enqueued_at(self):
+        return min(
+            queue[0][0] for tenant in self.active for queue in self.tenants[tenant].decks.values()
+        )
+
+    def pop(self):
+        while True:
+            tenant = self.active[0]
+            if self.deficit[tenant] >= 1:
+                self.deficit[tenant] -= 1
+                queue = self.tenants[tenant]
+                item = queue.pop()
+                self.size -= 1
+                if not queue.active:
+                    # An idle tenant loses its remaining credit
+                    self.active.popleft()
+                    del self.tenants[tenant]
+                    del self.deficit[tenant]
+                return item
+            self.deficit[tenant] += self.weight_for(tenant)
+            self.active.rotate(-1)
+
+
+class SubmissionScheduler:
+    """
+    Dispatches submitted payloads to the upstream from a pool of worker threads.
+    """
+
+    def __init__(
+        self,
+        send,
+        workers=4,
+        limiter=None,
+        tenant_weights=None,
+        bulk_max_wait=5.0,
+        interactive_burst=20,
+    ):
+        """
+        Args:
+            send (callable): send(payload, cookie) performing the upstream call
+            workers (int): Number of concurrent upstream calls
+            limiter: Optional rate limiter with a blocking acquire(); a token is
+                taken before the next payload is chosen, so priorities apply
+                to the order in which the rate budget is spent
+            tenant_weights (dict, optional): Relative share per tenant (default
+                1); weights must be positive
+            bulk_max_wait (float): Seconds after which a waiting bulk payload is
+                dispatched ahead of interactive traffic
+            interactive_burst (int): Interactive payloads dispatched in a row
+                before a waiting bulk payload gets a turn
+        """
+        # A tenant with no positive weight never earns a turn, and _Lane.pop
+        # would spin forever holding the lock
+        for tenant, weight in (tenant_weights or {}).items():
+            if not weight > 0:
+                raise ValueError(f"Weight of tenant '{tenant}' must be positive, got {weight}")
+        self.send = send
+        self.workers = workers
+        self.limiter = limiter
+        self.tenant_weights = tenant_weights or {}
+        self.bulk_max_wait = bulk_max_wait
+        self.interactive_burst = interactive_burst
+
+        self._lanes = {lane: _Lane(self._tenant_weight) for lane in LANES}
+        self._interactive_streak = 0
+        self._condition = threading.Condition()
+        self._threads = []
+        self._running = False
+
+    def _tenant_weight(self, tenant):
+        return self.tenant_weights.get(tenant, 1.0)
+
+    def start(self):
+        """Start the worker threads."""
+        self._running = True
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"scheduler-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=5.0):
+        """Stop the worker threads; payloads still queued fail with RuntimeError."""
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        with self._condition:
+            for lane in self._lanes.values():
+                while lane.size:
+                    _, _, _, future = lane.pop()
+                    future.set_exception(RuntimeError("Scheduler stopped"))
+
+    def submit(self, payload, cookie=None, lane="interactive", tenant=None, deck=None):
+        """
+        Queue a payload for dispatch
+
+        Args:
+            payload (bytes): Encoded payload
+            cookie (str, optional): Authentication cookie to send it with
+            lane (str): "interactive" or "bulk"
+            tenant (str, optional): Client the payload belongs to
+            deck (str, optional): Deck the payload targets
+
+        Returns:
+            Future: Resolves to the upstream response or raises its exception
+        """
+        if lane not in self._lanes:
+            raise ValueError(f"Unknown lane '{lane}'")
+        future = Future()
+        with self._condition:
+            if not self._running:
+                raise RuntimeError("Scheduler is not running")
+            self._lanes[lane].push(
+                tenant, (deck or "").lower(), (time.monotonic(), payload, cookie, future)
+            )
+            self._condition.notify()
+        return future
+
+    def queue_depth(self):
+        """
+        Get the number of queued payloads per lane
+
+        Returns:
+            dict: Lane name to number of payloads waiting
+        """
+        return {name: lane.size for name, lane in self._lanes.items()}
+
+    def _next_lane(self):
+        interactive = self._lanes["interactive"]
+        bulk = self._lanes["bulk"]
+        if not bulk.size:
+            return interactive
+        if not interactive.size:
+            return bulk
+        starving = (
+            self._interactive_streak >= self.interactive_burst
+            or time.monotonic() - bulk.oldest_enqueued_at() >= self.bulk_max_wait
+        )
+        return bulk if starving else interactive
+
+    def _take(self):
+        """Wait for work and pop the next payload, or return None when stopping."""
+        while True:
+            with self._condition:
+                while self._running and not any(lane.size for lane in self._lanes.values()):
+                    self._condition.wait()
+                if not self._running:
+                    return None
+
+            if self.limiter is not None:
+                self.limiter.acquire()
+
+            with self._condition:
+                # Another worker may have taken the payload while we waited for a token
+                if any(lane.size for lane in self._lanes.values()):
+                    lane = self._next_lane()
+                    if lane is self._lanes["interactive"] and self._lanes["bulk"].size:
+                        self._interactive_streak += 1
+                    else:
+                        self._interactive_streak = 0
+                    return lane.pop()
+
+    def _run(self):
+        while True:
+            item = self._take()
+            if item is None:
+                return
+            _, payload, cookie, future = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(self.send(payload, cookie))
+            except BaseException as e:
+                future.set_exception(e)
@@ -0,0 +1,381 @@
+"""
+State shared between the worker processes of the Anki API.
+
+When the server runs with several uvicorn workers, each worker is a separate
+process. Rate limits, request de-duplication and queue counters kept in
+process memory would then be multiplied by the number of workers, so they are
+stored in a local SQLite database in WAL mode that all workers open.
+
+LocalState has the same interface for single-process use.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    name TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL,
+    full REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS dedup (
+    key TEXT PRIMARY KEY,
+    expires REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    value INTEGER NOT NULL,
+    PRIMARY KEY (name, pid)
+);
+"""
+
+logger = logging.getLogger("anki-api")
+
+
+def _pid_alive(pid):
+    """Check whether a process with the given pid still exists."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SharedState:
+    """
+    SQLite-backed store for state shared across worker processes.
+
+    Every thread gets its own connection; all writes run in short
+    BEGIN IMMEDIATE transactions so concurrent workers serialize cleanly.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): Path of the SQLite database file
+        """
+        self.path = path
+        self._local = threading.local()
+        self._prune_every = 256
+        self._claims = 0
+        self._takes = 0
+        conn = self._connect()
+        conn.executescript(_SCHEMA)
+        # Databases from before buckets recorded when they are full again
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(buckets)")]
+        if "full" not in columns:
+            conn.execute("ALTER TABLE buckets ADD COLUMN full REAL NOT NULL DEFAULT 0")
+        # Drop counters left behind by this pid in a previous run
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM counters WHERE pid = ?", (os.getpid(),))
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        return _ImmediateTransaction(self._connect())
+
+    def take_tokens(self, name, rate, burst, tokens=1.0):
+        """
+        Try to take tokens from a shared token bucket
+
+        Args:
+            name (str): Bucket name
+            rate (float): Refill rate in tokens per second
+            burst (float): Bucket capacity
+            tokens (float): Number of tokens to take
+
+        Returns:
+            float: 0.0 if the tokens were taken, otherwise the seconds to wait
+                before enough tokens will be available
+
+        Raises:
+            ValueError: If rate is not positive
+        """
+        if rate <= 0:
+            raise ValueError(f"Bucket '{name}' needs a positive rate, got {rate}")
+        now = time.time()
+        with self._transaction() as conn:
+            self._takes += 1
+            if self._takes % self._prune_every == 0:
+                # Refilled buckets are the same as new ones; drop them (e.g. per-client quotas)
+                conn.execute("DELETE FROM buckets WHERE full < ?", (now,))
+            row = conn.execute(
+                "SELECT tokens, updated FROM buckets WHERE name = ?", (name,)
+            ).fetchone()
+            available = burst if row is None else min(burst, row[0] + (now - row[1]) * rate)
+            if available >= tokens:
+                available -= tokens
+                wait = 0.0
+            else:
+                wait = (tokens - available) / rate
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (name, tokens, updated, full) VALUES (?, ?, ?, ?)",
+                (name, available, now, now + (burst - available) / rate),
+            )
+        return wait
+
+    def claim(self, key, ttl):
+        """
+        Claim a de-duplication key for ttl seconds
+
+        Args:
+            key (str): The key to claim, e.g. a hash of the request
+            ttl (float): Seconds the claim lasts
+
+        Returns:
+            bool: True if the key was free (first time seen in the window),
+                False if another request already claimed it
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            self._claims += 1
+            if self._claims % self._prune_every == 0:
+                conn.execute("DELETE FROM dedup WHERE expires < ?", (now,))
+            row = conn.execute("SELECT expires FROM dedup WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[0] >= now:
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO dedup (key, expires) VALUES (?, ?)",
+                (key, now + ttl),
+            )
+        return True
+
+    def add_to_counter(self, name, delta):
+        """
+        Add delta to this process's share of a named counter
+
+        Args:
+            name (str): Counter name
+            delta (int): Amount to add (may be negative)
+        """
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO counters (name, pid, value) VALUES (?, ?, ?) "
+                "ON CONFLICT (name, pid) DO UPDATE SET value = value + excluded.value",
+                (name, os.getpid(), delta),
+            )
+
+    def set_counter(self, name, value):
+        """
+        Set this process's share of a named counter
+
+        Args:
+            name (str): Counter name
+            value (int): The new value
+        """
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO counters (name, pid, value) VALUES (?, ?, ?)",
+                (name, os.getpid(), value),
+            )
+
+    def get_counter(self, name):
+        """
+        Get the total of a named counter across all live worker processes
+
+        Args:
+            name (str): Counter name
+
+        Returns:
+            int: Sum of the counter over all live workers
+        """
+        conn = self._connect()
+        rows = conn.execute(
+            "SELECT pid, value FROM counters WHERE name = ?", (name,)
+        ).fetchall()
+        dead = [pid for pid, _ in rows if not _pid_alive(pid)]
+        if dead:
+            with self._transaction() as conn:
+                conn.executemany("DELETE FROM counters WHERE pid = ?", [(pid,) for pid in dead])
+        return sum(value for pid, value in rows if pid not in dead)
+
+    def rate_limiter(self, name, rate, burst=1.0):
+        """
+        Get a rate limiter backed by a shared token bucket
+
+        Args:
+            name (str): Bucket name shared by all workers
+            rate (float): Allowed requests per second across all workers
+            burst (float): Maximum burst size
+
+        Returns:
+            RateLimiter: The rate limiter
+        """
+        return RateLimiter(self, name, rate, burst)
+
+
+class _ImmediateTransaction:
+    """Context manager running a BEGIN IMMEDIATE ... COMMIT block."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+class LocalState:
+    """In-process store with the same interface as SharedState."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._dedup = {}
+        self._counters = {}
+
+    def take_tokens(self, name, rate, burst, tokens=1.0):
+        """Try to take tokens from a token bucket; see SharedState.take_tokens."""
+        if rate <= 0:
+            raise ValueError(f"Bucket '{name}' needs a positive rate, got {rate}")
+        now = time.monotonic()
+        with self._lock:
+            if len(self._buckets) > 10000:
+                # Refilled buckets are the same as new ones; drop them (e.g. per-client quotas)
+                self._buckets = {k: v for k, v in self._buckets.items() if v[2] > now}
+            available, updated, _ = self._buckets.get(name, (burst, now, now))
+            available = min(burst, available + (now - updated) * rate)
+            wait = 0.0
+            if available >= tokens:
+                available -= tokens
+            else:
+                wait = (tokens - available) / rate
+            self._buckets[name] = (available, now, now + (burst - available) / rate)
+            return wait
+
+    def claim(self, key, ttl):
+        """Claim a de-duplication key for ttl seconds; see SharedState.claim."""
+        now = time.monotonic()
+        with self._lock:
+            if len(self._dedup) > 10000:
+                self._dedup = {k: v for k, v in self._dedup.items() if v >= now}
+            expires = self._dedup.get(key)
+            if expires is not None and expires >= now:
+                return False
+            self._dedup[key] = now + ttl
+        return True
+
+    def add_to_counter(self, name, delta):
+        """Add delta to a named counter."""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + delta
+
+    def set_counter(self, name, value):
+        """Set a named counter."""
+        with self._lock:
+            self._counters[name] = value
+
+    def get_counter(self, name):
+        """Get the value of a named counter."""
+        return self._counters.get(name, 0)
+
+    def rate_limiter(self, name, rate, burst=1.0):
+        """Get a rate limiter backed by an in-process token bucket."""
+        return RateLimiter(self, name, rate, burst)
+
+
+class RateLimiter:
+    """Token bucket rate limiter whose state lives in a SharedState or LocalState."""
+
+    def __init__(self, state, name, rate, burst=1.0):
+        # Checked here as well, so a bad rate fails at startup and not in a worker thread
+        if rate <= 0:
+            raise ValueError(f"Rate limiter '{name}' needs a positive rate, got {rate}")
+        self.state = state
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+
+    def try_acquire(self, tokens=1.0):
+        """Take tokens without blocking; returns the seconds to wait (0.0 on success)."""
+        return self.state.take_tokens(self.name, self.rate, self.burst, tokens)
+
+    def acquire(self, tokens=1.0):
+        """Block until tokens are available and take them."""
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+
+class BufferedCounter:
+    """
+    Per-process counter published to a SharedState or LocalState in the background.
+
+    Changing the count only touches memory, so it can be done on the event
+    loop; the process's share is written every interval seconds when it has
+    changed, and readers of the state see it that much later.
+    """
+
+    def __init__(self, state, name, interval=1.0):
+        """
+        Args:
+            state: SharedState or LocalState the counter is published to
+            name (str): Counter name
+            interval (float): Seconds between publications
+        """
+        self.state = state
+        self.name = name
+        self.interval = interval
+        self._value = 0
+        self._published = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def value(self):
+        """This process's current count."""
+        return self._value
+
+    def add(self, delta):
+        """Add delta (may be negative) to the count."""
+        with self._lock:
+            self._value += delta
+
+    def publish(self):
+        """Write the count to the state now if it changed."""
+        value = self._value
+        if value != self._published:
+            self.state.set_counter(self.name, value)
+            self._published = value
+
+    def start(self):
+        """Start publishing in a background thread."""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"counter-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop publishing, after writing the final count."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.publish()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.publish()
+            except Exception:
+                logger.exception("Could not publish counter %s", self.name)
@@ -0,0 +1,414 @@
+"""
+Offline spool for encoded card payloads.
+
+When AnkiWeb is unreachable, encoded payloads (deck suffix included) are
+appended to a segmented, append-only log on local disk. A SpoolReplayer drains
+the log at a controlled rate once the upstream is back, and segments whose
+records have all been acknowledged are deleted by compaction.
+
+Layout of a spool directory:
+
+    lock                 held (flock) by the process that owns the spool
+    cursor               "<segment> <offset>" of the first unacknowledged record
+    0000000001.seg ...   segments of records
+
+Each record is a 4-byte big-endian length, a 4-byte CRC32 of the payload and
+the payload itself. A torn record at the end of the last segment (e.g. after a
+crash) is ignored until it is overwritten by the next append.
+"""
+
+import errno
+import fcntl
+import logging
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import zlib
+
+import requests
+
+logger = logging.getLogger("anki-api.spool")
+
+RECORD_HEADER = struct.Struct(">II")
+SEGMENT_SUFFIX = ".seg"
+# Prefix of spool directories that are still being set up
+STAGING_PREFIX = ".new-"
+
+
+class SpoolLockedError(RuntimeError):
+    """Raised when a spool directory is already owned by another process."""
+
+
+def encode_record(payload):
+    """
+    Frame a payload as a spool record
+
+    Args:
+        payload (bytes): The payload
+
+    Returns:
+        bytes: Length and CRC header followed by the payload
+    """
+    return RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def iter_records(data, offset=0):
+    """
+    Iterate over the complete records in a buffer
+
+    Args:
+        data (bytes or mmap): Buffer holding framed records
+        offset (int): Offset of the first record
+
+    Yields:
+        tuple: (payload, end_offset) for each valid record; stops at the first
+            torn or corrupt record
+    """
+    size = len(data)
+    header_size = RECORD_HEADER.size
+    while offset + header_size <= size:
+        length, crc = RECORD_HEADER.unpack_from(data, offset)
+        start = offset + header_size
+        end = start + length
+        if end > size:
+            return
+        payload = bytes(data[start:end])
+        if zlib.crc32(payload) != crc:
+            return
+        yield payload, end
+        offset = end
+
+
+class Spool:
+    """
+    Segmented append-only log of encoded payloads owned by one process.
+    """
+
+    def __init__(self, directory, segment_bytes=8 * 1024 * 1024, fsync=False):
+        """
+        Args:
+            directory (str): Spool directory (created if missing)
+            segment_bytes (int): Size after which a new segment is started
+            fsync (bool): If True, fsync after every append
+
+        Raises:
+            SpoolLockedError: If another process owns the directory
+        """
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        # Set for spools taken over from an exited process; removed once drained
+        self.orphaned = False
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock_file = open(os.path.join(directory, "lock"), "a")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._lock_file.close()
+            raise SpoolLockedError(f"Spool '{directory}' is in use by another process")
+
+        self._cursor = self._read_cursor()
+        segments = self.segments()
+        self._write_seq = segments[-1] if segments else max(self._cursor[0], 1)
+        self._writer = None
+        self._open_writer()
+
+    def _segment_path(self, seq):
+        return os.path.join(self.directory, f"{seq:010d}{SEGMENT_SUFFIX}")
+
+    def segments(self):
+        """Return the sequence numbers of all segments, oldest first."""
+        return sorted(
+            int(name[: -len(SEGMENT_SUFFIX)])
+            for name in os.listdir(self.directory)
+            if name.endswith(SEGMENT_SUFFIX)
+        )
+
+    def _read_cursor(self):
+        try:
+            with open(os.path.join(self.directory, "cursor")) as f:
+                seq, offset = f.read().split()
+                return int(seq), int(offset)
+        except (FileNotFoundError, ValueError):
+            segments = self.segments()
+            return (segments[0] if segments else 1), 0
+
+    def _open_writer(self):
+        path = self._segment_path(self._write_seq)
+        self._writer = open(path, "ab")
+        # Drop a torn record left by a crash so new records stay readable
+        with open(path, "rb") as f:
+            data = f.read()
+        valid = 0
+        for _, end in iter_records(data):
+            valid = end
+        if valid != len(data):
+            self._writer.truncate(valid)
+            self._writer.seek(valid)
+
+    def append(self, payload):
+        """
+        Append a payload to the spool
+
+        Args:
+            payload (bytes): Encoded payload
+        """
+        record = encode_record(payload)
+        with self._lock:
+            if self._writer.tell() + len(record) > self.segment_bytes and self._writer.tell() > 0:
+                self._writer.close()
+                self._write_seq += 1
+                self._open_writer()
+            self._writer.write(record)
+            self._writer.flush()
+            if self.fsync:
+                os.fsync(self._writer.fileno())
+
+    def iter_pending(self):
+        """
+        Iterate over the records that have not been acknowledged yet
+
+        Yields:
+            tuple: (payload, position) where position is passed to ack()
+        """
+        seq, offset = self._cursor
+        for segment in self.segments():
+            if segment < seq:
+                continue
+            start = offset if segment == seq else 0
+            with open(self._segment_path(segment), "rb") as f:
+                data = f.read()
+            for payload, end in iter_records(data, start):
+                yield payload, (segment, end)
+
+    def ack(self, position):
+        """
+        Acknowledge every record up to and including position
+
+        Args:
+            position (tuple): Position yielded by iter_pending()
+        """
+        self._cursor = position
+        path = os.path.join(self.directory, "cursor")
+        with open(path + ".tmp", "w") as f:
+            f.write(f"{position[0]} {position[1]}")
+        os.replace(path + ".tmp", path)
+
+    def compact(self):
+        """
+        Delete segments whose records have all been acknowledged
+
+        Returns:
+            int: Number of segments deleted
+        """
+        deleted = 0
+        with self._lock:
+            seq, offset = self._cursor
+            # Move the cursor off a fully drained segment that is no longer written to
+            if seq != self._write_seq and offset >= self._segment_size(seq):
+                seq, offset = seq + 1, 0
+                self.ack((seq, offset))
+            for segment in self.segments():
+                if segment < seq and segment != self._write_seq:
+                    os.remove(self._segment_path(segment))
+                    deleted += 1
+        return deleted
+
+    def _segment_size(self, seq):
+        try:
+            return os.path.getsize(self._segment_path(seq))
+        except FileNotFoundError:
+            return 0
+
+    def pending_bytes(self):
+        """Return the number of bytes in segments not yet fully acknowledged."""
+        seq, offset = self._cursor
+        total = 0
+        for segment in self.segments():
+            if segment >= seq:
+                size = self._segment_size(segment)
+                total += size - offset if segment == seq else size
+        return max(total, 0)
+
+    def close(self):
+        """Close the spool and release its lock."""
+        with self._lock:
+            self._writer.close()
+            self._lock_file.close()
+
+
+def open_worker_spool(root, **kwargs):
+    """
+    Open a spool for the current process under a shared spool root
+
+    Every worker process writes to its own sub-directory so that appends never
+    interleave between processes. The spool is created and locked under a
+    staging name that adopt_orphaned_spools skips and only then renamed, so
+    another worker cannot adopt it between its creation and its locking.
+
+    Args:
+        root (str): Spool root directory
+        **kwargs: Passed to Spool
+
+    Returns:
+        Spool: The spool owned by this process
+    """
+    os.makedirs(root, exist_ok=True)
+    spool = Spool(tempfile.mkdtemp(prefix=STAGING_PREFIX, dir=root), **kwargs)
+    name = f"worker-{os.getpid()}"
+    attempt = 0
+    while True:
+        directory = os.path.join(root, name if not attempt else f"{name}-{attempt}")
+        try:
+            # The lock and open segment follow the directory through the rename
+            os.rename(spool.directory, directory)
+        except OSError as e:
+            if e.errno not in (errno.EEXIST, errno.ENOTEMPTY):
+                spool.close()
+                raise
+            # Left by an exited process with the same pid; it will be adopted
+            attempt += 1
+            continue
+        spool.directory = directory
+        return spool
+
+
+def adopt_orphaned_spools(root, **kwargs):
+    """
+    Open the spools left behind by processes that no longer run
+
+    Args:
+        root (str): Spool root directory
+        **kwargs: Passed to Spool
+
+    Returns:
+        list: Spools whose owner has exited; the caller now owns them
+    """
+    spools = []
+    if not os.path.isdir(root):
+        return spools
+    for name in sorted(os.listdir(root)):
+        path = os.path.join(root, name)
+        if name.startswith(STAGING_PREFIX) or not os.path.isdir(path):
+            continue
+        try:
+            spool = Spool(path, **kwargs)
+        except SpoolLockedError:
+            continue
+        spool.orphaned = True
+        spools.append(spool)
+    return spools
+
+
+class SpoolReplayer:
+    """
+    Background thread that delivers spooled payloads to AnkiWeb.
+
+    Records are sent in order at a controlled rate. Network errors, 429 and 5xx
+    responses (and 401/403, which a credential rotation may fix) are retried
+    with exponential backoff; other rejected payloads are dropped and logged.
+    """
+
+    def __init__(
+        self,
+        spools,
+        send,
+        limiter=None,
+        cookie_provider=None,
+        max_backoff=60.0,
+        idle_interval=1.0,
+    ):
+        """
+        Args:
+            spools (list): Spools to drain; orphaned spools are removed once empty
+            send (callable): send(payload, cookie) returning a requests Response
+            limiter: Optional rate limiter with a blocking acquire() method
+            cookie_provider (callable, optional): Returns the cookie to send with
+            max_backoff (float): Upper bound of the retry backoff in seconds
+            idle_interval (float): Seconds to wait when there is nothing to send
+        """
+        self.spools = list(spools)
+        self.send = send
+        self.limiter = limiter
+        self.cookie_provider = cookie_provider or (lambda: None)
+        self.max_backoff = max_backoff
+        self.idle_interval = idle_interval
+        self.stats = {"delivered": 0, "dropped": 0, "retries": 0}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the replayer thread."""
+        self._thread = threading.Thread(target=self._run, name="spool-replayer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        """Stop the replayer thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            sent = 0
+            for spool in list(self.spools):
+                sent += self.drain(spool)
+                if self._stop.is_set():
+                    return
+            if not sent:
+                self._stop.wait(self.idle_interval)
+
+    def drain(self, spool):
+        """
+        Deliver the pending records of one spool
+
+        Args:
+            spool (Spool): The spool to drain
+
+        Returns:
+            int: Number of records acknowledged
+        """
+        acked = 0
+        for payload, position in spool.iter_pending():
+            if not self._deliver(payload):
+                return acked
+            spool.ack(position)
+            acked += 1
+        spool.compact()
+
+        if spool.orphaned and not spool.pending_bytes():
+            # An adopted spool is finished once drained
+            spool.close()
+            shutil.rmtree(spool.directory, ignore_errors=True)
+            self.spools.remove(spool)
+        return acked
+
+    def _deliver(self, payload):
+        """Send one payload, retrying until it is accepted, dropped or we stop."""
+        backoff = 1.0
+        while not self._stop.is_set():
+            if self.limiter is not None:
+                self.limiter.acquire()
+            try:
+                response = self.send(payload, self.cookie_provider())
+                status = response.status_code
+            except requests.RequestException as e:
+                logger.warning("Spool replay failed: %s", e)
+                status = None
+
+            if status == 200:
+                self.stats["delivered"] += 1
+                return True
+            if status is not None and status < 500 and status not in (401, 403, 429):
+                logger.error("Dropping spooled payload rejected with status %s", status)
+                self.stats["dropped"] += 1
+                return True
+
+            self.stats["retries"] += 1
+            self._stop.wait(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+        return False
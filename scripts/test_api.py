@@ -1,5 +1,31 @@
+#!/usr/bin/env python3
+"""
+Smoke tests and load generator for the Anki API.
+
+Smoke tests (one request per endpoint, prints the JSON):
+    python -m scripts.test_api
+
+Load generation against a running instance or the in-process ASGI app:
+    python -m scripts.test_api load --url http://localhost:8000 \
+        --concurrency 32 --duration 30 --mix add-card=60,decks=30,health=10
+    python -m scripts.test_api load --in-process --mode open --rate 200 --json-out run.json
+
+Note that /add-card and /add-multiple-cards go through to the upstream
+configured by ANKI_UPSTREAM_URL; point it at a stub before load testing.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import random
+import sys
+import time
+
 import requests
 
+from scripts.latency import LatencyHistogram
+
 # Base URL of the API
 BASE_URL = "http://localhost:8000"
 
@@ -73,7 +99,289 @@ def run_all_tests():
     return all(results.values())
 
 
+# Load generation
+
+ENDPOINTS = ("add-card", "add-multiple-cards", "decks", "health")
+
+
+def parse_mix(mix):
+    """
+    Parse a request mix such as "add-card=70,decks=20,health=10"
+
+    Returns:
+        dict: Endpoint name to relative weight
+    """
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(
+                f"Unknown endpoint '{name}'; choose from {', '.join(ENDPOINTS)}"
+            )
+        weights[name] = float(weight or 1)
+    return weights
+
+
+class RequestFactory:
+    """Builds the HTTP request for each endpoint of the mix."""
+
+    def __init__(self, deck_names, batch_size, bulk_delay, seed=None):
+        self.deck_names = deck_names
+        self.batch_size = batch_size
+        self.bulk_delay = bulk_delay
+        self.random = random.Random(seed)
+        self.sequence = 0
+
+    def _card(self):
+        self.sequence += 1
+        return {
+            "front": f"Load test card {self.sequence}",
+            "back": f"Generated at {time.time():.6f} for capacity planning",
+        }
+
+    def build(self, endpoint):
+        """Return (method, path, json_body) for an endpoint."""
+        if endpoint == "add-card":
+            body = self._card()
+            body["deck_name"] = self.random.choice(self.deck_names)
+            return "POST", "/add-card", body
+        if endpoint == "add-multiple-cards":
+            return (
+                "POST",
+                "/add-multiple-cards",
+                {
+                    "cards": [self._card() for _ in range(self.batch_size)],
+                    "deck_name": self.random.choice(self.deck_names),
+                    "delay": self.bulk_delay,
+                },
+            )
+        return "GET", f"/{endpoint}", None
+
+
+class LoadStats:
+    """Latency histograms and error counts collected during a run."""
+
+    def __init__(self):
+        self.latency = {}
+        self.errors = {}
+        self.requests = {}
+
+    def record(self, endpoint, seconds, error=None):
+        """Record the outcome of one request."""
+        self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+        self.latency.setdefault(endpoint, LatencyHistogram()).record_seconds(seconds)
+        if error is not None:
+            errors = self.errors.setdefault(endpoint, {})
+            errors[error] = errors.get(error, 0) + 1
+
+    def report(self, elapsed, config):
+        """Build the JSON-serializable report of the run."""
+        overall = LatencyHistogram()
+        for histogram in self.latency.values():
+            overall.merge(histogram)
+        total = sum(self.requests.values())
+        failed = sum(sum(errors.values()) for errors in self.errors.values())
+        return {
+            "config": config,
+            "elapsed_s": round(elapsed, 3),
+            "requests": total,
+            "failed": failed,
+            "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+            "latency": overall.summary(),
+            "endpoints": {
+                endpoint: {
+                    "requests": self.requests[endpoint],
+                    "errors": self.errors.get(endpoint, {}),
+                    "latency": self.latency[endpoint].summary(),
+                    "histogram": self.latency[endpoint].to_dict(),
+                }
+                for endpoint in sorted(self.requests)
+            },
+        }
+
+
+async def send_one(client, factory, stats, endpoint, intended_start=None):
+    """
+    Send one request and record its latency
+
+    In open-loop mode latency is measured from the intended start time, so
+    time spent waiting for a free connection is included (no coordinated
+    omission).
+    """
+    method, path, body = factory.build(endpoint)
+    start = intended_start if intended_start is not None else time.perf_counter()
+    error = None
+    try:
+        response = await client.request(method, path, json=body)
+        if response.status_code >= 400:
+            error = f"HTTP {response.status_code}"
+    except Exception as e:
+        error = type(e).__name__
+    stats.record(endpoint, time.perf_counter() - start, error)
+
+
+async def run_closed_loop(client, factory, stats, endpoints, weights, args):
+    """Run `concurrency` workers that each send requests back to back."""
+    deadline = time.perf_counter() + args.duration
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            endpoint = factory.random.choices(endpoints, weights)[0]
+            await send_one(client, factory, stats, endpoint)
+
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+
+
+async def run_open_loop(client, factory, stats, endpoints, weights, args):
+    """Start requests at a fixed arrival rate regardless of response times."""
+    limit = asyncio.Semaphore(args.concurrency)
+    tasks = set()
+    start = time.perf_counter()
+    deadline = start + args.duration
+    next_at = start
+
+    async def limited(endpoint, intended_start):
+        async with limit:
+            await send_one(client, factory, stats, endpoint, intended_start)
+
+    while next_at < deadline:
+        now = time.perf_counter()
+        if next_at > now:
+            await asyncio.sleep(next_at - now)
+        endpoint = factory.random.choices(endpoints, weights)[0]
+        task = asyncio.create_task(limited(endpoint, next_at))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        if args.poisson:
+            next_at += factory.random.expovariate(args.rate)
+        else:
+            next_at += 1.0 / args.rate
+
+    if tasks:
+        await asyncio.gather(*tasks)
+
+
+async def run_load(args):
+    """Run a load test and return its report."""
+    import httpx
+
+    weights_by_endpoint = args.mix
+    endpoints = list(weights_by_endpoint)
+    weights = [weights_by_endpoint[endpoint] for endpoint in endpoints]
+    factory = RequestFactory(args.decks.split(","), args.batch_size, args.bulk_delay, args.seed)
+    stats = LoadStats()
+
+    limits = httpx.Limits(
+        max_connections=args.concurrency, max_keepalive_connections=args.concurrency
+    )
+    async with contextlib.AsyncExitStack() as stack:
+        if args.in_process:
+            from main import app
+
+            # ASGITransport does not run the lifespan, which starts the
+            # scheduler, micro-batcher, ledger and prober as in production
+            await stack.enter_async_context(app.router.lifespan_context(app))
+            transport = httpx.ASGITransport(app=app)
+            base_url = "http://in-process"
+        else:
+            transport = None
+            base_url = args.url
+        client = await stack.enter_async_context(
+            httpx.AsyncClient(base_url=base_url, transport=transport, limits=limits, timeout=args.timeout)
+        )
+        start = time.perf_counter()
+        if args.mode == "open":
+            await run_open_loop(client, factory, stats, endpoints, weights, args)
+        else:
+            await run_closed_loop(client, factory, stats, endpoints, weights, args)
+        elapsed = time.perf_counter() - start
+
+    config = {
+        "target": "in-process" if args.in_process else args.url,
+        "mode": args.mode,
+        "concurrency": args.concurrency,
+        "duration_s": args.duration,
+        "rate": args.rate if args.mode == "open" else None,
+        "mix": weights_by_endpoint,
+        "batch_size": args.batch_size,
+    }
+    return stats.report(elapsed, config)
+
+
+def print_report(report):
+    """Print a human-readable summary of a load test report."""
+    print(
+        f"{report['requests']} requests in {report['elapsed_s']}s "
+        f"({report['throughput_rps']} req/s), {report['failed']} failed"
+    )
+    header = f"{'endpoint':<20}{'count':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'p99.9 ms':>10}{'max ms':>10}"
+    print(header)
+    rows = list(report["endpoints"].items()) + [("all", {"latency": report["latency"]})]
+    for endpoint, data in rows:
+        latency = data["latency"]
+        print(
+            f"{endpoint:<20}{latency['count']:>8}{latency['p50_ms']:>10.2f}"
+            f"{latency['p90_ms']:>10.2f}{latency['p99_ms']:>10.2f}"
+            f"{latency['p99.9_ms']:>10.2f}{latency['max_ms']:>10.2f}"
+        )
+    for endpoint, data in report["endpoints"].items():
+        for error, count in sorted(data["errors"].items()):
+            print(f"  {endpoint}: {error} x{count}")
+
+
+def parse_args(argv=None):
+    """Parse the command line."""
+    parser = argparse.ArgumentParser(description="Smoke tests and load generator for the Anki API")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser("smoke", help="Send one request per endpoint (default)")
+
+    load = subparsers.add_parser("load", help="Generate load and report latency percentiles")
+    target = load.add_mutually_exclusive_group()
+    target.add_argument("--url", default=BASE_URL, help="Base URL of a running instance")
+    target.add_argument(
+        "--in-process", action="store_true", help="Drive the ASGI app from main.py directly"
+    )
+    load.add_argument("--mode", choices=["closed", "open"], default="closed")
+    load.add_argument(
+        "--concurrency", type=int, default=16, help="Workers (closed) or max in flight (open)"
+    )
+    load.add_argument("--duration", type=float, default=10.0, help="Seconds to run")
+    load.add_argument("--rate", type=float, default=50.0, help="Requests per second (open loop)")
+    load.add_argument(
+        "--poisson", action="store_true", help="Poisson arrivals instead of fixed spacing"
+    )
+    load.add_argument(
+        "--mix",
+        type=parse_mix,
+        default=parse_mix("add-card=60,add-multiple-cards=5,decks=25,health=10"),
+        help="Weighted request mix, e.g. add-card=60,decks=30,health=10",
+    )
+    load.add_argument("--decks", default="default", help="Comma-separated deck names to use")
+    load.add_argument("--batch-size", type=int, default=20, help="Cards per bulk request")
+    load.add_argument(
+        "--bulk-delay", type=float, default=0.0, help="delay field sent with bulk requests"
+    )
+    load.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout")
+    load.add_argument("--seed", type=int, help="Random seed for a reproducible mix")
+    load.add_argument("--json-out", help="Write the JSON report to this file ('-' for stdout)")
+    return parser.parse_args(argv)
+
+
 if __name__ == "__main__":
+    args = parse_args()
+
+    if args.command == "load":
+        report = asyncio.run(run_load(args))
+        if args.json_out == "-":
+            json.dump(report, sys.stdout, indent=2)
+        else:
+            print_report(report)
+            if args.json_out:
+                with open(args.json_out, "w") as f:
+                    json.dump(report, f, indent=2)
+        sys.exit(1 if report["failed"] else 0)
+
     print("Running API tests...\n")
     success = run_all_tests()
     print(f"\nOverall result: {'PASS' if success else 'FAIL'}")
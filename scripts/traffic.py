@@ -0,0 +1,288 @@
+"""
+Traffic recording for capacity planning.
+
+TrafficRecorder appends the shape of every request the API handles to a JSON
+lines file: time, method, path, status, duration, an anonymized client key,
+body size and encoding, and for card endpoints the deck and UTF-8 byte sizes
+of each card (plus the delay of bulk requests). Card text, note ids and query
+strings are never written. The middleware only copies the body chunks it
+passes through; bodies of successful requests are parsed by a background
+thread, decompressed no further than the endpoints would. When that thread
+falls behind, the queue of bodies waiting for it is bounded in count and
+bytes, and requests beyond it are dropped from the recording and counted.
+
+Recording is enabled in main.py with ANKI_TRAFFIC_RECORD_FILE; recordings are
+played back with scripts/replay_traffic.py.
+"""
+
+import hashlib
+import hmac
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from scripts.anki_api_v2 import payload_deck, split_delimited_payloads
+from scripts.compression import SUPPORTED_ENCODINGS, decompress_body
+from scripts.fast_json import BulkRequestError, decode_bulk_request, loads
+
+logger = logging.getLogger("anki-api")
+
+_STOP = object()
+
+# Endpoints whose bodies hold one card, and those holding a bulk request
+SINGLE_CARD_PATHS = ("/add-card", "/update-card")
+BULK_PATHS = ("/add-multiple-cards", "/export-apkg")
+RAW_PAYLOADS_PATH = "/add-raw-payloads"
+STREAM_MEDIA_TYPES = ("application/x-ndjson", "text/event-stream")
+
+
+def _text_size(text):
+    return len(text.encode("utf-8")) if isinstance(text, str) else 0
+
+
+def request_shape(path, body, encoding=None, max_bytes=0):
+    """
+    Describe the cards in a request body without keeping their text
+
+    Args:
+        path (str): Request path
+        body (bytes): Request body as received
+        encoding (str, optional): Its Content-Encoding
+        max_bytes (int): Cap on the decompressed body, as for the endpoints
+            (0 = no cap); larger bodies are recorded as invalid
+
+    Returns:
+        dict: "cards" as [deck, front bytes, back bytes] lists (and "delay"
+            for bulk requests), "payloads" as [deck, bytes] lists for raw
+            payloads, "invalid" if the body could not be parsed, or nothing
+            for other endpoints
+    """
+    if path not in SINGLE_CARD_PATHS + BULK_PATHS + (RAW_PAYLOADS_PATH,) or not body:
+        return {}
+    try:
+        if encoding and encoding != "identity":
+            if encoding not in SUPPORTED_ENCODINGS:
+                return {}
+            body = decompress_body(body, encoding, max_bytes)
+        if path in SINGLE_CARD_PATHS:
+            card = loads(body)
+            return {
+                "cards": [
+                    [
+                        str(card.get("deck_name") or "default"),
+                        _text_size(card.get("front")),
+                        _text_size(card.get("back")),
+                    ]
+                ]
+            }
+        if path in BULK_PATHS:
+            bulk = decode_bulk_request(body)
+            return {
+                "cards": [
+                    [deck_name, _text_size(front), _text_size(back)]
+                    for front, back, deck_name in bulk.cards
+                ],
+                "delay": bulk.delay,
+            }
+        return {
+            "payloads": [
+                [payload_deck(payload), len(payload)] for payload in split_delimited_payloads(body)
+            ]
+        }
+    except (BulkRequestError, ValueError, AttributeError):
+        # Also BodyTooLarge, a ValueError
+        return {"invalid": True}
+
+
+class TrafficRecorder:
+    """
+    Appends request shapes to a JSON lines file from a background thread.
+    """
+
+    def __init__(
+        self, path, batch_size=500, max_queued=10000, max_queued_bytes=64 * 1024 * 1024, max_body_bytes=0
+    ):
+        """
+        Args:
+            path (str): File to append to; several workers may share it
+            batch_size (int): Maximum records written at once
+            max_queued (int): Requests waiting to be written before new ones
+                are dropped
+            max_queued_bytes (int): Body bytes waiting to be parsed before new
+                requests are dropped
+            max_body_bytes (int): Cap on decompressed bodies, as for the
+                endpoints (0 = no cap)
+        """
+        self.path = path
+        self.max_body_bytes = max_body_bytes
+        self.batch_size = batch_size
+        self.max_queued_bytes = max_queued_bytes
+        # Requests left out of the recording because the queue was full
+        self.dropped = 0
+        # Client keys are hashed with a per-process key, so recordings show how
+        # traffic spreads over clients without identifying them
+        self._client_key = os.urandom(16)
+        self._queue = queue.Queue(max_queued)
+        self._queued_bytes = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """Start the background writer."""
+        self._thread = threading.Thread(target=self._run, name="traffic-recorder", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10.0):
+        """Write all queued records and stop the background writer."""
+        if self._thread is not None:
+            self._queue.put(_STOP, timeout=timeout)
+            self._thread.join(timeout)
+            self._thread = None
+        if self.dropped:
+            logger.warning("Left %d requests out of the traffic recording", self.dropped)
+
+    def record(self, scope, body_chunks, status, started, duration):
+        """
+        Queue a handled request; returns immediately, dropping it if the queue is full
+
+        Args:
+            scope (dict): ASGI scope of the request
+            body_chunks (list): Request body chunks as received
+            status (int): Response status code
+            started (float): Wall-clock start time
+            duration (float): Seconds until the response was complete
+        """
+        size = sum(len(chunk) for chunk in body_chunks)
+        with self._lock:
+            if self._queued_bytes + size <= self.max_queued_bytes:
+                try:
+                    self._queue.put_nowait((scope, body_chunks, status, started, duration))
+                    self._queued_bytes += size
+                    return
+                except queue.Full:
+                    pass
+            self.dropped += 1
+            dropped = self.dropped
+        # Warn once per thousand, not per request, while the writer is behind
+        if dropped % 1000 == 1:
+            logger.warning("Traffic recorder is behind, %d requests dropped so far", dropped)
+
+    def anonymize(self, client):
+        """Map a client key to a short stable pseudonym."""
+        return hmac.new(self._client_key, client.encode("utf-8"), hashlib.sha256).hexdigest()[:12]
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            batch = []
+            while True:
+                if item is _STOP:
+                    stopping = True
+                else:
+                    batch.append(item)
+                if len(batch) >= self.batch_size:
+                    self._write(batch)
+                    batch = []
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
+
+    def _entry(self, scope, body_chunks, status, started, duration):
+        headers = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope["headers"]}
+        client = headers.get("x-client-id") or (scope["client"][0] if scope.get("client") else "unknown")
+        body = b"".join(body_chunks)
+        encoding = headers.get("content-encoding", "").strip().lower() or None
+        entry = {
+            "ts": round(started, 6),
+            "method": scope["method"],
+            "path": scope["path"],
+            "status": status,
+            "duration_ms": round(duration * 1000, 3),
+            "client": self.anonymize(client),
+            "bytes": len(body),
+        }
+        if encoding:
+            entry["encoding"] = encoding
+        accept = headers.get("accept", "")
+        for media_type in STREAM_MEDIA_TYPES:
+            if media_type in accept:
+                entry["stream"] = media_type
+                break
+        # Rejected requests keep only their size; their bodies may be hostile
+        if 200 <= status < 300:
+            entry.update(request_shape(scope["path"], body, encoding, self.max_body_bytes))
+        return entry
+
+    def _write(self, batch):
+        lines = []
+        for item in batch:
+            try:
+                lines.append(json.dumps(self._entry(*item), separators=(",", ":")) + "\n")
+            except Exception:
+                logger.exception("Could not record a request for %s", item[0].get("path"))
+            with self._lock:
+                self._queued_bytes -= sum(len(chunk) for chunk in item[1])
+        # One write per batch, so appends from several workers do not interleave
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("".join(lines))
+        except OSError:
+            logger.exception("Could not write %d traffic records", len(lines))
+
+
+class TrafficRecordingMiddleware:
+    """
+    ASGI middleware passing every request's shape to a TrafficRecorder.
+    """
+
+    def __init__(self, app, recorder, exempt_paths=(), exempt_prefixes=("/admin",)):
+        """
+        Args:
+            app: The wrapped ASGI app
+            recorder (TrafficRecorder): Where requests are recorded
+            exempt_paths (iterable): Paths never recorded, e.g. probes
+            exempt_prefixes (tuple): Path prefixes never recorded
+        """
+        self.app = app
+        self.recorder = recorder
+        self.exempt_paths = frozenset(exempt_paths)
+        self.exempt_prefixes = exempt_prefixes
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        if (
+            scope["type"] != "http"
+            or path in self.exempt_paths
+            or path.startswith(self.exempt_prefixes)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        started = time.time()
+        start = time.perf_counter()
+        chunks = []
+        status = 500
+
+        async def tee_receive():
+            message = await receive()
+            if message["type"] == "http.request" and message.get("body"):
+                chunks.append(message["body"])
+            return message
+
+        async def capture_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, tee_receive, capture_send)
+        finally:
+            self.recorder.record(scope, chunks, status, started, time.perf_counter() - start)
@@ -0,0 +1,198 @@
+"""
+Upstream health tracking for the readiness endpoint.
+
+CircuitBreaker counts consecutive upstream failures and, once there are too
+many, makes send_payload fail fast instead of piling more requests onto a
+failing AnkiWeb. UpstreamProber checks the upstream and the credentials in a
+background thread on a fixed interval and keeps the latest outcome, so
+readiness checks only read cached state and never cause upstream requests.
+"""
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger("anki-api")
+
+
+class CircuitBreaker:
+    """
+    Thread-safe circuit breaker.
+
+    Closed: requests pass and failures are counted. Open: requests are
+    refused until reset_timeout has passed. Half-open: one trial request
+    passes; its outcome closes or reopens the breaker.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        """
+        Args:
+            failure_threshold (int): Consecutive failures that open the breaker
+            reset_timeout (float): Seconds the breaker stays open before a trial request
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = "closed"
+        self._failures = 0
+        self._opened_at = None
+        self._trial_started = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        """Current state: "closed", "open" or "half_open"."""
+        with self._lock:
+            if self._state == "open" and time.monotonic() >= self._opened_at + self.reset_timeout:
+                return "half_open"
+            return self._state
+
+    def allow(self):
+        """
+        Check whether a request may be sent now
+
+        Returns:
+            bool: False while the breaker is open
+        """
+        with self._lock:
+            if self._state == "closed":
+                return True
+            now = time.monotonic()
+            if self._state == "open":
+                if now < self._opened_at + self.reset_timeout:
+                    return False
+                self._state = "half_open"
+                self._trial_started = None
+            # Half-open: let one trial through, and another if it never reports back
+            if self._trial_started is None or now >= self._trial_started + self.reset_timeout:
+                self._trial_started = now
+                return True
+            return False
+
+    def record_success(self):
+        """Report a successful request; closes the breaker."""
+        with self._lock:
+            if self._state != "closed":
+                logger.info("Upstream recovered, closing circuit breaker")
+            self._state = "closed"
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self):
+        """Report a failed request; may open the breaker."""
+        with self._lock:
+            self._failures += 1
+            if self._state == "half_open" or (
+                self._state == "closed" and self._failures >= self.failure_threshold
+            ):
+                if self._state == "closed":
+                    logger.warning(
+                        "Opening circuit breaker after %d upstream failures", self._failures
+                    )
+                self._state = "open"
+                self._opened_at = time.monotonic()
+
+    def snapshot(self):
+        """
+        Describe the breaker
+
+        Returns:
+            dict: "state" and "consecutive_failures"
+        """
+        state = self.state
+        return {"state": state, "consecutive_failures": self._failures}
+
+
+class UpstreamProber:
+    """
+    Probes the upstream in a background thread and caches the outcome.
+    """
+
+    def __init__(self, probe, interval=30.0, breaker=None):
+        """
+        Args:
+            probe (callable): Returns a dict with "status_code" and
+                "credentials_valid", e.g. AnkiWebBackend.probe; raises if the
+                upstream cannot be reached
+            interval (float): Seconds between probes
+            breaker (CircuitBreaker, optional): Fed with each probe's outcome,
+                so a recovered upstream closes the breaker without user traffic
+        """
+        self.probe = probe
+        self.interval = interval
+        self.breaker = breaker
+        # Replaced as a whole after every probe, so readers never see a partial update
+        self.status = {
+            "checked_at": None,
+            "reachable": None,
+            "credentials_valid": None,
+            "status_code": None,
+            "rtt_ms": None,
+            "error": None,
+        }
+        self._stop = threading.Event()
+        self._thread = None
+
+    def check(self):
+        """
+        Probe the upstream now
+
+        Returns:
+            dict: The new status
+        """
+        start = time.perf_counter()
+        try:
+            result = self.probe()
+        except Exception as e:
+            status = {
+                "checked_at": time.time(),
+                "reachable": False,
+                # A failed probe says nothing new about the credentials
+                "credentials_valid": self.status["credentials_valid"],
+                "status_code": None,
+                "rtt_ms": None,
+                "error": str(e),
+            }
+        else:
+            status = {
+                "checked_at": time.time(),
+                "reachable": result["status_code"] < 500,
+                "credentials_valid": result["credentials_valid"],
+                "status_code": result["status_code"],
+                "rtt_ms": round((time.perf_counter() - start) * 1000, 1),
+                "error": None,
+            }
+        if self.breaker is not None:
+            # A login redirect is a response too, but cards would not be delivered
+            if status["reachable"] and status["credentials_valid"] is True:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+        if status["credentials_valid"] is False and self.status["credentials_valid"] is not False:
+            logger.error("Upstream rejected the credentials (status %s)", status["status_code"])
+        self.status = status
+        return status
+
+    def is_fresh(self):
+        """Whether the last probe is recent enough to act on."""
+        checked_at = self.status["checked_at"]
+        # Allow for a slow or missed probe before calling the state stale
+        return checked_at is not None and time.time() - checked_at <= 3 * self.interval
+
+    def start(self):
+        """Start probing; the first probe runs right away in the background."""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="upstream-prober", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop probing."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while True:
+            self.check()
+            if self._stop.wait(self.interval):
+                return
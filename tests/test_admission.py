@@ -0,0 +1,73 @@
+"""
+Tests for per-client quotas and load shedding.
+"""
+
+import asyncio
+
+from scripts.admission import AdmissionController
+from scripts.shared_state import LocalState, SharedState
+
+
+def admit(controller, client="client", lane=None):
+    return asyncio.run(controller.admit(client, lane))
+
+
+def test_quota_allows_a_burst_then_rejects():
+    controller = AdmissionController(LocalState(), quota_rate=1, quota_burst=3)
+    assert [admit(controller) for _ in range(3)] == [None, None, None]
+    rejection = admit(controller)
+    assert rejection.status_code == 429
+    assert rejection.headers == {"Retry-After": "1"}
+    assert controller.stats == {"admitted": 3, "over_quota": 1, "shed": 0}
+
+
+def test_quotas_are_per_client():
+    controller = AdmissionController(LocalState(), quota_rate=1, quota_burst=1)
+    assert admit(controller, "a") is None
+    assert admit(controller, "a").status_code == 429
+    assert admit(controller, "b") is None
+
+
+def test_shared_quota_holds_across_controllers(tmp_path):
+    path = str(tmp_path / "state.db")
+    first = AdmissionController(SharedState(path), quota_rate=1, quota_burst=2, quota_in_threadpool=True)
+    second = AdmissionController(SharedState(path), quota_rate=1, quota_burst=2, quota_in_threadpool=True)
+    assert admit(first) is None
+    assert admit(second) is None
+    assert admit(first).status_code == 429
+
+
+def test_sheds_when_too_many_requests_are_in_flight():
+    controller = AdmissionController(LocalState(), max_in_flight=2)
+    controller.in_flight = 2
+    rejection = admit(controller)
+    assert rejection.status_code == 503
+    controller.in_flight = 1
+    assert admit(controller) is None
+
+
+def test_shed_requests_do_not_use_quota():
+    controller = AdmissionController(LocalState(), quota_rate=1, quota_burst=1, max_in_flight=1)
+    controller.in_flight = 1
+    assert admit(controller).status_code == 503
+    controller.in_flight = 0
+    assert admit(controller) is None
+
+
+def test_bulk_is_shed_on_the_whole_queue_and_interactive_on_its_lane():
+    depth = {"interactive": 1, "bulk": 4}
+    controller = AdmissionController(
+        LocalState(), max_queue_depth=5, queue_depth=lambda: depth, drain_rate=2
+    )
+    bulk = admit(controller, lane="bulk")
+    assert bulk.status_code == 503
+    # Retry-After estimates how long the queue takes to drain
+    assert bulk.headers == {"Retry-After": "3"}
+    assert admit(controller, lane="interactive") is None
+    assert admit(controller) is None
+    assert controller.stats == {"admitted": 2, "over_quota": 0, "shed": 1}
+
+
+def test_unlimited_by_default():
+    controller = AdmissionController(LocalState())
+    assert all(admit(controller, lane="bulk") is None for _ in range(100))
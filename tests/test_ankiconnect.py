@@ -0,0 +1,109 @@
+"""
+Tests for per-card outcomes of the AnkiConnect backend.
+"""
+
+from scripts.anki_api_v2 import AnkiConnectBackend
+
+
+class FakeAnkiConnect(AnkiConnectBackend):
+    """Answers actions from a table of handlers instead of calling Anki."""
+
+    def __init__(self, handlers, **kwargs):
+        super().__init__(**kwargs)
+        self.handlers = handlers
+        self.calls = []
+
+    def invoke(self, action, **params):
+        self.calls.append(action)
+        return self.handlers[action](**params)
+
+
+def cards(*fronts):
+    return [(front, "back", "default") for front in fronts]
+
+
+def test_rejected_checks_skip_addnotes():
+    backend = FakeAnkiConnect({
+        "canAddNotesWithErrorDetail": lambda notes: {
+            "result": [{"canAdd": True}, {"canAdd": False, "error": "cannot create note because it is a duplicate"}],
+            "error": None,
+        },
+        "addNotes": lambda notes: {"result": [101] * len(notes), "error": None},
+    })
+
+    results = backend.add_notes(cards("a", "b"))
+
+    assert [r["success"] for r in results] == [True, False]
+    assert results[0]["note_id"] == 101
+    assert results[1]["status_code"] == 400 and "duplicate" in results[1]["message"]
+    assert backend.calls == ["canAddNotesWithErrorDetail", "addNotes"]
+
+
+def test_failed_addnotes_settles_each_card():
+    added = {"a"}
+
+    def add_note(note):
+        front = note["fields"]["Front"]
+        if front in added:
+            return {"result": None, "error": "cannot create note because it is a duplicate"}
+        return {"result": None, "error": "model was not found"}
+
+    backend = FakeAnkiConnect({
+        "canAddNotesWithErrorDetail": lambda notes: {"result": [{"canAdd": True}] * len(notes), "error": None},
+        "addNotes": lambda notes: {"result": None, "error": "['model was not found']"},
+        "addNote": add_note,
+    })
+
+    results = backend.add_notes(cards("a", "b"))
+
+    # "a" was added by the failed addNotes call; "b" really failed
+    assert [r["success"] for r in results] == [True, False]
+    assert "model was not found" in results[1]["message"]
+
+
+def test_unknown_outcome_with_duplicates_allowed():
+    backend = FakeAnkiConnect({
+        "canAddNotesWithErrorDetail": lambda notes: {"result": [{"canAdd": True}] * len(notes), "error": None},
+        "addNotes": lambda notes: {"result": None, "error": "boom"},
+    }, allow_duplicates=True)
+
+    results = backend.add_notes(cards("a"))
+
+    assert results[0]["status_code"] == 502
+    assert "addNote" not in backend.calls
+
+
+def test_old_ankiconnect_adds_one_by_one():
+    backend = FakeAnkiConnect({
+        "canAddNotesWithErrorDetail": lambda notes: {"result": None, "error": "unsupported action"},
+        "addNote": lambda note: {"result": 7, "error": None},
+    })
+
+    results = backend.add_notes(cards("a", "b"))
+
+    assert [r["note_id"] for r in results] == [7, 7]
+    assert backend.calls.count("addNote") == 2
+
+
+def test_results_are_reported_per_chunk():
+    backend = FakeAnkiConnect({
+        "canAddNotesWithErrorDetail": lambda notes: {"result": [{"canAdd": True}] * len(notes), "error": None},
+        "addNotes": lambda notes: {"result": list(range(len(notes))), "error": None},
+    }, batch_size=2)
+    reported = []
+
+    backend.add_notes(cards("a", "b", "c"), on_result=lambda index, result: reported.append(index))
+
+    assert reported == [0, 1, 2]
+    assert backend.calls.count("addNotes") == 2
+
+
+def test_transport_error_fails_every_card():
+    def unreachable(notes):
+        raise ConnectionError("refused")
+
+    backend = FakeAnkiConnect({"canAddNotesWithErrorDetail": unreachable})
+
+    results = backend.add_notes(cards("a", "b"))
+
+    assert not any(r["success"] for r in results)
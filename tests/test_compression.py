@@ -0,0 +1,72 @@
+"""
+Tests for decoding compressed request bodies.
+"""
+
+import asyncio
+import gzip
+import zlib
+
+import pytest
+from starlette.requests import Request
+
+from scripts.compression import BodyTooLarge, UnsupportedEncoding, read_body
+
+CARDS = b'{"cards": [{"front": "Front", "back": "Back"}], "deck_name": "default"}' * 50
+
+
+def raw_deflate(data):
+    compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def make_request(body, encoding, chunk_size=None):
+    """Build a request whose body arrives in chunks of chunk_size bytes."""
+    chunk_size = chunk_size or max(len(body), 1)
+    chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)] or [b""]
+    messages = [
+        {"type": "http.request", "body": chunk, "more_body": i < len(chunks) - 1}
+        for i, chunk in enumerate(chunks)
+    ]
+
+    async def receive():
+        return messages.pop(0)
+
+    headers = [(b"content-encoding", encoding.encode("latin-1"))] if encoding else []
+    return Request({"type": "http", "method": "POST", "path": "/", "headers": headers}, receive)
+
+
+def read(body, encoding, chunk_size=None, max_bytes=0):
+    return asyncio.run(read_body(make_request(body, encoding, chunk_size), max_bytes))
+
+
+@pytest.mark.parametrize(
+    "encoding, compress",
+    [("gzip", gzip.compress), ("deflate", zlib.compress), ("deflate", raw_deflate)],
+)
+@pytest.mark.parametrize("chunk_size", [None, 1, 2, 7])
+def test_decodes_compressed_bodies(encoding, compress, chunk_size):
+    assert read(compress(CARDS), encoding, chunk_size) == CARDS
+
+
+def test_identity_body_is_returned_as_is():
+    assert read(CARDS, None, 1) == CARDS
+
+
+def test_decompressed_size_is_capped():
+    with pytest.raises(BodyTooLarge):
+        read(gzip.compress(b"x" * 1_000_000), "gzip", max_bytes=1000)
+
+
+def test_truncated_body_is_rejected():
+    with pytest.raises(ValueError):
+        read(zlib.compress(CARDS)[:-8], "deflate", 1)
+
+
+def test_one_byte_deflate_body_is_rejected():
+    with pytest.raises(ValueError):
+        read(b"x", "deflate")
+
+
+def test_unknown_encoding_is_rejected():
+    with pytest.raises(UnsupportedEncoding):
+        read(CARDS, "br")
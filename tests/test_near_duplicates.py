@@ -0,0 +1,99 @@
+"""
+Tests for the MinHash/LSH near-duplicate index.
+"""
+
+import random
+
+import pytest
+
+from scripts.near_duplicates import (
+    NearDuplicateIndex,
+    _shingles,
+    bands_for_threshold,
+    lsh_recall,
+    normalize_for_matching,
+)
+
+WORDS = (
+    "capital france paris river seine bridge tower museum painting king queen "
+    "revolution republic language grammar verb noun tense past future present "
+    "cell membrane protein enzyme energy atom molecule bond reaction acid base"
+).split()
+
+
+def jaccard(a, b):
+    a = _shingles(normalize_for_matching(a))
+    b = _shingles(normalize_for_matching(b))
+    return len(a & b) / len(a | b)
+
+
+def pairs(rng, count, threshold):
+    """Card fronts and rewordings whose true similarity is just above threshold."""
+    found = []
+    while len(found) < count:
+        words = [rng.choice(WORDS) for _ in range(rng.randint(12, 30))]
+        original = " ".join(words)
+        for _ in range(20):
+            i = rng.randrange(len(words))
+            words[i] = rng.choice(WORDS)
+            variant = " ".join(words)
+            similarity = jaccard(original, variant)
+            if similarity < threshold + 0.05:
+                break
+            if similarity <= threshold + 0.15:
+                found.append((original, variant))
+                break
+    return found
+
+
+@pytest.mark.parametrize("threshold", [0.6, 0.8])
+def test_finds_rewordings_at_the_threshold(tmp_path, threshold):
+    index = NearDuplicateIndex(str(tmp_path / "index.db"), threshold=threshold)
+    rng = random.Random(1234)
+    cases = pairs(rng, 150, threshold)
+    index.add_many([(original, "default") for original, _ in cases])
+
+    hits = sum(index.find(variant, "default") is not None for _, variant in cases)
+    assert hits / len(cases) >= 0.85
+
+
+def test_unrelated_cards_do_not_match(tmp_path):
+    index = NearDuplicateIndex(str(tmp_path / "index.db"))
+    index.add("What is the capital of France?", "default")
+    assert index.find("Which enzyme breaks down starch?", "default") is None
+
+
+def test_matches_are_scoped_to_the_deck(tmp_path):
+    index = NearDuplicateIndex(str(tmp_path / "index.db"))
+    index.add("What is the capital of France?", "Geography")
+    assert index.find("What is the capital of France", "geography")["similarity"] == 1.0
+    assert index.find("What is the capital of France", "history") is None
+
+
+def test_matches_do_not_carry_card_text(tmp_path):
+    index = NearDuplicateIndex(str(tmp_path / "index.db"))
+    index.add("What is the capital of France?", "default")
+    assert set(index.find("What is the capital of France?", "default")) == {"id", "similarity"}
+
+
+def test_banding_follows_the_threshold():
+    for threshold in (0.5, 0.6, 0.7, 0.8, 0.9):
+        bands = bands_for_threshold(128, threshold)
+        assert lsh_recall(threshold, bands, 128 // bands) >= 0.9
+    assert bands_for_threshold(128, 0.8) == 16
+    assert bands_for_threshold(128, 0.5) > bands_for_threshold(128, 0.8)
+
+
+def test_existing_index_keeps_its_banding(tmp_path):
+    path = str(tmp_path / "index.db")
+    assert NearDuplicateIndex(path, threshold=0.5).bands == 64
+    assert NearDuplicateIndex(path, threshold=0.9).bands == 64
+
+
+def test_rejects_thresholds_below_what_the_banding_finds(tmp_path):
+    path = str(tmp_path / "index.db")
+    index = NearDuplicateIndex(path, threshold=0.8)
+    with pytest.raises(ValueError):
+        index.find("anything", "default", threshold=index.min_threshold - 0.1)
+    with pytest.raises(ValueError):
+        NearDuplicateIndex(path, threshold=0.5)
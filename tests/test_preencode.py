@@ -0,0 +1,59 @@
+"""
+Tests for pre-encoding card files.
+"""
+
+import csv
+
+import pytest
+
+from scripts.anki_api_v2 import encode_card_payload, normalize_card_text
+from scripts.preencode import chunk_bounds, encode_chunk
+from scripts.spool import iter_records
+
+# Characters str.splitlines() treats as line breaks that are not line endings in a CSV file
+SEPARATORS = ["\x0b", "\x0c", "\x1c", "\x1d", "\x1e", "\x85", "\u2028", "\u2029"]
+
+
+def sequential_payloads(path):
+    """Encode a card file the way a plain csv.reader over the file reads it."""
+    payloads = []
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        for row in csv.reader(f):
+            if len(row) < 2:
+                continue
+            deck_name = row[2] if len(row) > 2 and row[2] else "default"
+            payloads.append(
+                encode_card_payload(normalize_card_text(row[0]), normalize_card_text(row[1]), deck_name)
+            )
+    return payloads
+
+
+def preencoded_payloads(path, chunk_bytes):
+    with open(path, "rb") as f:
+        data = f.read()
+    payloads = []
+    for start, end in chunk_bounds(data, chunk_bytes):
+        records, _, _ = encode_chunk(str(path), start, end)
+        payloads.extend(payload for payload, _ in iter_records(records))
+    return payloads
+
+
+@pytest.mark.parametrize("chunk_bytes", [1, 16, 1 << 20])
+def test_matches_sequential_reader(tmp_path, chunk_bytes):
+    lines = [f"front{sep}x,back {i},ai" for i, sep in enumerate(SEPARATORS)]
+    lines += ['"quoted, front",back', "only-front", "", "last,row"]
+    path = tmp_path / "cards.csv"
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8", newline="")
+
+    expected = sequential_payloads(path)
+    assert len(expected) == len(SEPARATORS) + 2
+    assert preencoded_payloads(path, chunk_bytes) == expected
+
+
+def test_keeps_separator_in_front_text(tmp_path):
+    path = tmp_path / "cards.csv"
+    path.write_text("front\u2028x,back\n", encoding="utf-8", newline="")
+    records, _, skipped = encode_chunk(str(path), 0, path.stat().st_size)
+    (payload, _), = iter_records(records)
+    assert payload == encode_card_payload("front\u2028x", "back", "default")
+    assert skipped == 0
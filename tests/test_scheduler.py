@@ -0,0 +1,119 @@
+"""
+Tests for the fair submission scheduler.
+"""
+
+import threading
+import time
+
+import pytest
+
+from scripts.scheduler import SubmissionScheduler
+
+
+class Upstream:
+    """Records the order payloads are sent in; holds the first send until released."""
+
+    def __init__(self):
+        self.sent = []
+        self.release = threading.Event()
+
+    def send(self, payload, cookie):
+        if not self.sent:
+            self.sent.append(payload)
+            self.release.wait(5)
+        else:
+            self.sent.append(payload)
+        return payload
+
+
+def dispatch_order(submissions, **kwargs):
+    """
+    Queue submissions behind a blocked first payload and return the dispatch order
+
+    Args:
+        submissions (list): (payload, lane, tenant, deck) tuples
+        **kwargs: Passed to SubmissionScheduler
+    """
+    upstream = Upstream()
+    scheduler = SubmissionScheduler(upstream.send, workers=1, **kwargs)
+    scheduler.start()
+    try:
+        first = scheduler.submit("blocker", lane="bulk", tenant="setup")
+        while not upstream.sent:
+            time.sleep(0.001)
+        futures = [
+            scheduler.submit(payload, lane=lane, tenant=tenant, deck=deck)
+            for payload, lane, tenant, deck in submissions
+        ]
+        upstream.release.set()
+        first.result(5)
+        for future in futures:
+            future.result(5)
+    finally:
+        scheduler.stop()
+    return upstream.sent[1:]
+
+
+def test_tenants_share_equally_regardless_of_decks():
+    submissions = [(f"a{i}", "bulk", "a", f"deck{i % 4}") for i in range(20)]
+    submissions += [(f"b{i}", "bulk", "b", "default") for i in range(20)]
+    order = dispatch_order(submissions)
+    first_half = order[:20]
+    assert sum(p.startswith("a") for p in first_half) == 10
+    assert sum(p.startswith("b") for p in first_half) == 10
+
+
+def test_tenant_decks_take_turns():
+    submissions = [(f"x{i}", "bulk", "a", "x") for i in range(3)]
+    submissions += [(f"y{i}", "bulk", "a", "y") for i in range(3)]
+    assert dispatch_order(submissions) == ["x0", "y0", "x1", "y1", "x2", "y2"]
+
+
+def test_tenant_weights_set_shares():
+    submissions = [(f"a{i}", "bulk", "a", "d") for i in range(30)]
+    submissions += [(f"b{i}", "bulk", "b", "d") for i in range(30)]
+    order = dispatch_order(submissions, tenant_weights={"a": 1, "b": 2})
+    first = order[:15]
+    assert sum(p.startswith("b") for p in first) == 10
+
+
+def test_interactive_lane_goes_first():
+    submissions = [(f"bulk{i}", "bulk", "a", "d") for i in range(3)]
+    submissions += [(f"int{i}", "interactive", "a", "d") for i in range(3)]
+    order = dispatch_order(submissions)
+    assert order == ["int0", "int1", "int2", "bulk0", "bulk1", "bulk2"]
+
+
+def test_bulk_gets_a_turn_after_interactive_burst():
+    submissions = [("bulk0", "bulk", "a", "d")]
+    submissions += [(f"int{i}", "interactive", "a", "d") for i in range(5)]
+    order = dispatch_order(submissions, interactive_burst=2)
+    assert order.index("bulk0") == 2
+
+
+def test_bulk_goes_next_once_it_waited_too_long():
+    submissions = [("bulk0", "bulk", "a", "d")]
+    submissions += [(f"int{i}", "interactive", "a", "d") for i in range(3)]
+    order = dispatch_order(submissions, bulk_max_wait=0)
+    assert order[0] == "bulk0"
+
+
+def test_rejects_non_positive_weights():
+    with pytest.raises(ValueError):
+        SubmissionScheduler(lambda payload, cookie: None, tenant_weights={"a": 0})
+
+
+def test_stop_fails_queued_payloads():
+    upstream = Upstream()
+    scheduler = SubmissionScheduler(upstream.send, workers=1)
+    scheduler.start()
+    scheduler.submit("blocker")
+    while not upstream.sent:
+        time.sleep(0.001)
+    queued = scheduler.submit("queued")
+    stopper = threading.Thread(target=scheduler.stop, kwargs={"timeout": 0.1})
+    stopper.start()
+    stopper.join(5)
+    upstream.release.set()
+    with pytest.raises(RuntimeError):
+        queued.result(5)
@@ -0,0 +1,137 @@
+"""
+Tests for the offline spool and its replayer.
+"""
+
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from scripts.spool import (
+    RECORD_HEADER,
+    Spool,
+    SpoolLockedError,
+    SpoolReplayer,
+    adopt_orphaned_spools,
+    open_worker_spool,
+)
+
+PAYLOADS = [f"payload {i}".encode() * (i + 1) for i in range(20)]
+
+
+def pending(spool):
+    return [payload for payload, _ in spool.iter_pending()]
+
+
+def replayer(spool, statuses=None):
+    """Replayer whose upstream answers with the given statuses, then 200."""
+    statuses = list(statuses or [])
+    sent = []
+
+    def send(payload, cookie):
+        sent.append(payload)
+        return SimpleNamespace(status_code=statuses.pop(0) if statuses else 200)
+
+    replay = SpoolReplayer([spool], send, max_backoff=0)
+    # No backoff sleeps in tests
+    replay._stop.wait = lambda timeout=None: False
+    return replay, sent
+
+
+def test_round_trip_across_segments(tmp_path):
+    spool = Spool(str(tmp_path), segment_bytes=200)
+    for payload in PAYLOADS:
+        spool.append(payload)
+    assert len(spool.segments()) > 1
+    assert pending(spool) == PAYLOADS
+    spool.close()
+
+    reopened = Spool(str(tmp_path), segment_bytes=200)
+    assert pending(reopened) == PAYLOADS
+
+
+def test_ack_survives_reopen(tmp_path):
+    spool = Spool(str(tmp_path))
+    for payload in PAYLOADS[:5]:
+        spool.append(payload)
+    positions = [position for _, position in spool.iter_pending()]
+    spool.ack(positions[2])
+    spool.close()
+    assert pending(Spool(str(tmp_path))) == PAYLOADS[3:5]
+
+
+def test_torn_tail_is_ignored_and_overwritten(tmp_path):
+    spool = Spool(str(tmp_path))
+    spool.append(b"first")
+    spool.append(b"second")
+    segment = os.path.join(str(tmp_path), f"{spool.segments()[-1]:010d}.seg")
+    spool.close()
+    # A crash in the middle of the last record
+    with open(segment, "r+b") as f:
+        f.truncate(os.path.getsize(segment) - 3)
+
+    reopened = Spool(str(tmp_path))
+    assert pending(reopened) == [b"first"]
+    reopened.append(b"third")
+    assert pending(reopened) == [b"first", b"third"]
+
+
+def test_corrupt_record_stops_reading(tmp_path):
+    spool = Spool(str(tmp_path))
+    spool.append(b"good")
+    spool.append(b"flipped")
+    segment = os.path.join(str(tmp_path), f"{spool.segments()[-1]:010d}.seg")
+    with open(segment, "r+b") as f:
+        f.seek(RECORD_HEADER.size * 2 + len(b"good"))
+        f.write(b"X")
+    assert pending(spool) == [b"good"]
+
+
+def test_compaction_deletes_acknowledged_segments(tmp_path):
+    spool = Spool(str(tmp_path), segment_bytes=200)
+    for payload in PAYLOADS:
+        spool.append(payload)
+    segments = spool.segments()
+    replay, sent = replayer(spool)
+    assert replay.drain(spool) == len(PAYLOADS)
+    assert sent == PAYLOADS
+    # Only the segment still being written to is kept
+    assert spool.segments() == [segments[-1]]
+    assert spool.pending_bytes() == 0
+    assert pending(spool) == []
+
+
+def test_replay_retries_server_errors_and_drops_rejected(tmp_path):
+    spool = Spool(str(tmp_path))
+    for payload in (b"a", b"b", b"c"):
+        spool.append(payload)
+    replay, sent = replayer(spool, statuses=[503, 429, 200, 400, 200])
+    assert replay.drain(spool) == 3
+    assert sent == [b"a", b"a", b"a", b"b", b"c"]
+    assert replay.stats == {"delivered": 2, "dropped": 1, "retries": 2}
+
+
+def test_second_owner_is_refused(tmp_path):
+    owner = Spool(str(tmp_path))
+    with pytest.raises(SpoolLockedError):
+        Spool(str(tmp_path))
+    owner.close()
+    Spool(str(tmp_path)).close()
+
+
+def test_orphaned_spool_is_adopted_and_removed_once_drained(tmp_path):
+    root = str(tmp_path)
+    orphan = Spool(os.path.join(root, "worker-1"))
+    orphan.append(b"left behind")
+    orphan.close()
+
+    own = open_worker_spool(root)
+    adopted = adopt_orphaned_spools(root)
+    assert [spool.directory for spool in adopted] == [os.path.join(root, "worker-1")]
+
+    replay, sent = replayer(adopted[0])
+    replay.spools.append(own)
+    replay.drain(adopted[0])
+    assert sent == [b"left behind"]
+    assert not os.path.exists(os.path.join(root, "worker-1"))
+    assert os.path.isdir(own.directory)
@@ -0,0 +1,117 @@
+"""
+Tests for traffic recording.
+"""
+
+import asyncio
+import gzip
+import json
+import time
+
+from scripts.anki_api_v2 import encode_card_payload, frame_payloads
+from scripts.traffic import TrafficRecorder, TrafficRecordingMiddleware, request_shape
+
+BULK = json.dumps(
+    {"cards": [{"front": "Front", "back": "Bäck"}, {"front": "F", "back": "B", "deck_name": "ai"}], "delay": 0}
+).encode()
+
+
+def scope(path="/add-multiple-cards", headers=()):
+    return {
+        "type": "http",
+        "method": "POST",
+        "path": path,
+        "headers": [(key.encode(), value.encode()) for key, value in headers],
+        "client": ("10.0.0.1", 1234),
+    }
+
+
+def read_entries(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_shape_holds_sizes_not_text():
+    shape = request_shape("/add-multiple-cards", BULK)
+    assert shape == {"cards": [["default", 5, 5], ["ai", 1, 1]], "delay": 0}
+    assert request_shape("/add-card", b'{"front": "abc", "back": "de"}') == {"cards": [["default", 3, 2]]}
+
+
+def test_shape_of_raw_payloads():
+    payload = encode_card_payload("front", "back", "default")
+    assert request_shape("/add-raw-payloads", frame_payloads([payload])) == {
+        "payloads": [["default", len(payload)]]
+    }
+
+
+def test_compressed_bodies_are_capped():
+    assert request_shape("/add-multiple-cards", gzip.compress(BULK), "gzip")["cards"]
+    bomb = gzip.compress(b" " * 10_000_000)
+    assert request_shape("/add-multiple-cards", bomb, "gzip", max_bytes=1 << 20) == {"invalid": True}
+
+
+def test_other_paths_and_bad_bodies():
+    assert request_shape("/decks", b"anything") == {}
+    assert request_shape("/add-multiple-cards", b"{not json") == {"invalid": True}
+
+
+def test_recorder_writes_shapes_of_successful_requests_only(tmp_path):
+    path = str(tmp_path / "traffic.jsonl")
+    recorder = TrafficRecorder(path)
+    recorder.start()
+    recorder.record(scope(), [BULK[:10], BULK[10:]], 200, time.time(), 0.05)
+    recorder.record(scope(), [BULK], 413, time.time(), 0.01)
+    recorder.stop()
+
+    ok, rejected = read_entries(path)
+    assert ok["status"] == 200 and ok["bytes"] == len(BULK) and len(ok["cards"]) == 2
+    assert rejected["status"] == 413 and "cards" not in rejected
+    assert ok["client"] == rejected["client"] != "10.0.0.1"
+
+
+def test_full_queue_drops_and_counts(tmp_path):
+    path = str(tmp_path / "traffic.jsonl")
+    recorder = TrafficRecorder(path, max_queued=2, max_queued_bytes=len(BULK) * 10)
+    for _ in range(3):
+        recorder.record(scope(), [BULK], 200, time.time(), 0.01)
+    recorder.record(scope(), [BULK * 20], 200, time.time(), 0.01)
+    assert recorder.dropped == 2
+    recorder.start()
+    recorder.stop()
+    assert len(read_entries(path)) == 2
+
+
+def test_middleware_tees_the_body(tmp_path):
+    path = str(tmp_path / "traffic.jsonl")
+    recorder = TrafficRecorder(path)
+    received = []
+
+    async def app(scope, receive, send):
+        while True:
+            message = await receive()
+            received.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        await send({"type": "http.response.start", "status": 201, "headers": []})
+        await send({"type": "http.response.body", "body": b"{}"})
+
+    messages = [
+        {"type": "http.request", "body": BULK[:7], "more_body": True},
+        {"type": "http.request", "body": BULK[7:], "more_body": False},
+        {"type": "http.request", "body": b"", "more_body": False},
+    ]
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        pass
+
+    middleware = TrafficRecordingMiddleware(app, recorder, exempt_paths=("/live",))
+    recorder.start()
+    asyncio.run(middleware(scope(), receive, send))
+    asyncio.run(middleware(scope("/live"), receive, send))
+    recorder.stop()
+
+    assert b"".join(received) == BULK
+    (entry,) = read_entries(path)
+    assert entry["status"] == 201 and entry["cards"] == [["default", 5, 5], ["ai", 1, 1]]